@@ -0,0 +1,234 @@
+"""
+측정한 추론 시간, 지연 시간, 사람 크기에 따라 실행 중에 PoseNet 모델(입력 해상도)을 바꾸는 제어기입니다.
+
+모델 사다리(MODEL_LADDER)는 함께 배포되는 posenet_mobilenet_v1_075 모델 세 가지이며, 단계가 높을수록
+해상도가 높아 멀리 있는(작게 보이는) 사람도 잘 잡지만 추론이 느립니다.
+  - 추론 시간이 목표 fps를 유지할 수 없거나 전체 지연 시간이 예산을 넘으면 한 단계 내립니다.
+  - 사람이 작게 보이거나 포즈 신뢰도가 낮고, 다음 단계로도 목표 fps를 지킬 수 있으면 한 단계 올립니다.
+  - 사람이 충분히 크게 보이면 전력을 아끼기 위해 한 단계 내립니다.
+모델은 백그라운드에서 미리 불러온 뒤 파이프라인의 appsink 해상도(caps)만 바꾸므로 파이프라인을 재시작하지 않습니다.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+from pose_engine import PoseEngine
+
+MODEL_PATTERN = 'models/mobilenet/posenet_mobilenet_v1_075_%d_%d_quant_decoder_edgetpu.tflite'
+# (추론 해상도 (너비, 높이), 모델 경로) - 낮은 단계부터
+MODEL_LADDER = tuple(((width, height), MODEL_PATTERN % (height, width))
+                     for width, height in ((481, 353), (641, 481), (1281, 721)))
+# 유지하려는 초당 처리 프레임 수입니다.
+TARGET_FPS = 15.0
+# 판단에 사용하는 측정 구간(초)과, 단계를 바꾼 뒤 다음 판단까지 기다리는 시간(초)입니다.
+WINDOW_SECONDS = 5.0
+SWITCH_COOLDOWN = 15.0
+# 사람 키(포즈 높이)가 추론 영역 높이에서 차지하는 비율이 이보다 작으면 멀리 있다고 봅니다.
+SMALL_PERSON = 0.25
+# 이보다 크면 낮은 해상도로도 충분하다고 봅니다.
+LARGE_PERSON = 0.6
+# 포즈 점수 평균이 이보다 낮으면 해상도를 올려 볼 만하다고 봅니다.
+LOW_POSE_SCORE = 0.4
+# 부하 때문에 내려온 단계로 다시 올라가기 전에 기다리는 시간(초)입니다. 실패할 때마다 두 배로 늘어납니다.
+UPGRADE_BACKOFF = 60.0
+KEYPOINT_MIN_SCORE = 0.3
+
+
+class EngineLadder:
+    """
+    모델 사다리의 PoseEngine들을 보관하고, 입력 텐서 크기에 맞는 모델로 추론합니다.
+    해상도를 바꾸는 동안 이전 크기의 프레임이 남아 있어도 그 크기의 모델로 처리됩니다.
+    PoseEngine과 같은 메서드를 제공하므로 fall_detector.py의 콜백에 그대로 넘길 수 있습니다.
+    (모든 단계가 mirror=False이므로 출력 해석은 어느 모델로 하든 같습니다.)
+    """
+    def __init__(self, ladder, level, backend='auto', num_threads=None):
+        self.ladder = ladder
+        self.backend = backend
+        self.num_threads = num_threads
+        self.engines = {}
+        self.by_size = {}
+        self.lock = threading.Lock()
+        self.active = self.load(level)
+
+    def load(self, level):
+        """level 단계의 모델을 불러옵니다. 이미 불러왔으면 그대로 반환합니다."""
+        with self.lock:
+            engine = self.engines.get(level)
+        if engine is None:
+            size, path = self.ladder[level]
+            print('모델 로딩 중: ', path)
+            engine = PoseEngine(path, backend=self.backend, num_threads=self.num_threads)
+            with self.lock:
+                self.engines[level] = engine
+                self.by_size[size[0] * size[1] * 3] = engine
+        return engine
+
+    def run_inference(self, input_data):
+        engine = self.by_size.get(input_data.size)
+        if engine is None:
+            raise ValueError('No model loaded for input of %d bytes' % input_data.size)
+        self.active = engine
+        return engine.run_inference(input_data)
+
+    @property
+    def backend_name(self):
+        return self.active.backend_name
+
+    def get_input_tensor_shape(self):
+        return self.active.get_input_tensor_shape()
+
+    def get_output_snapshot(self):
+        return self.active.get_output_snapshot()
+
+    def ParseOutputSnapshot(self, snapshot):
+        return self.active.ParseOutputSnapshot(snapshot)
+
+    def latency_stats(self):
+        """{모델 해상도/백엔드 이름: (추론 횟수, 평균 ms)}를 반환합니다."""
+        stats = {}
+        for level, engine in sorted(self.engines.items()):
+            width, height = self.ladder[level][0]
+            for name, value in engine.latency_stats().items():
+                stats['%dx%d/%s' % (width, height, name)] = value
+        return stats
+
+
+class AdaptiveController:
+    """
+    window 초마다 파이프라인의 추론/지연 통계와 감지 단계가 넘겨준 포즈 정보를 보고 모델 단계를 정합니다.
+    단계를 바꿀 때는 모델을 먼저 불러온 뒤 모든 파이프라인의 추론 해상도를 함께 바꿉니다.
+    (여러 카메라는 하나의 TPU를 공유하므로 목표 fps는 카메라 수만큼 나눠서 계산합니다.)
+    """
+    def __init__(self, engines, level, target_fps=TARGET_FPS, window=WINDOW_SECONDS,
+                 cooldown=SWITCH_COOLDOWN, min_level=0, max_level=None):
+        self.engines = engines
+        self.level = level
+        self.target_fps = target_fps
+        self.window = window
+        self.cooldown = cooldown
+        self.min_level = min_level
+        self.max_level = len(engines.ladder) - 1 if max_level is None else max_level
+        self.pipelines = []
+        self.lock = threading.Lock()
+        self.heights = []
+        self.scores = []
+        # 단계별 다음 업그레이드 가능 시각과 대기 시간
+        self.retry_at = collections.defaultdict(float)
+        self.backoff = collections.defaultdict(lambda: UPGRADE_BACKOFF)
+        self.last_switch = time.monotonic()
+        self.switches = 0
+        self.stopped = threading.Event()
+        self.thread = None
+        self.previous = {}
+
+    @property
+    def inference_size(self):
+        return self.engines.ladder[self.level][0]
+
+    def observe_poses(self, poses, inference_box):
+        """감지 단계에서 프레임마다 호출합니다. 사람 키 비율과 포즈 점수를 모아 둡니다."""
+        if not len(poses):
+            return
+        keypoints = poses.keypoints
+        visible = keypoints[:, :, 2] > KEYPOINT_MIN_SCORE
+        ys = np.where(visible, keypoints[:, :, 1], np.nan)
+        with np.errstate(invalid='ignore'):
+            heights = (np.nanmax(ys, axis=1) - np.nanmin(ys, axis=1)) / inference_box[3]
+        heights = heights[visible.sum(axis=1) >= 4]
+        with self.lock:
+            self.heights.extend(heights.tolist())
+            self.scores.extend(poses.scores.tolist())
+
+    def attach(self, pipelines):
+        self.pipelines = list(pipelines)
+        self.previous = {pipeline: self.counters(pipeline) for pipeline in self.pipelines}
+
+    @staticmethod
+    def counters(pipeline):
+        invoke = pipeline.stage['invoke'].stats
+        return (invoke.count, invoke.total_time, pipeline.latency.count, pipeline.latency.total_time)
+
+    def measure(self):
+        """지난 측정 이후 (평균 추론 시간, 평균 전체 지연 시간, 처리한 프레임 수)를 계산합니다."""
+        invokes = invoke_time = frames = latency = 0
+        for pipeline in self.pipelines:
+            current = self.counters(pipeline)
+            previous = self.previous.get(pipeline, current)
+            invokes += current[0] - previous[0]
+            invoke_time += current[1] - previous[1]
+            frames += current[2] - previous[2]
+            latency += current[3] - previous[3]
+            self.previous[pipeline] = current
+        if not invokes or not frames:
+            return None
+        return invoke_time / invokes, latency / frames, frames
+
+    def decide(self, invoke, latency, heights, scores, now):
+        """다음 단계를 반환합니다. (바꾸지 않으면 현재 단계)"""
+        cameras = max(len(self.pipelines), 1)
+        budget = 1.0 / (self.target_fps * cameras)
+        level = self.level
+
+        # 부하: 추론이 목표 간격보다 오래 걸리거나, 지연 시간이 쌓이면 내립니다.
+        if level > self.min_level and (invoke > budget or latency > 3 * budget):
+            self.retry_at[level] = now + self.backoff[level]
+            self.backoff[level] *= 2
+            return level - 1
+        if level < self.max_level and now >= self.retry_at[level + 1]:
+            # 다음 단계의 추론 시간은 픽셀 수 비율로 추정합니다. 추정이 틀리면 다음 판단에서 다시 내려오고,
+            # 그 단계는 대기 시간(backoff)이 지나야 다시 시도합니다.
+            (width, height), _ = self.engines.ladder[level]
+            (next_width, next_height), _ = self.engines.ladder[level + 1]
+            estimate = invoke * (next_width * next_height) / (width * height)
+            small = heights and np.median(heights) < SMALL_PERSON
+            unsure = scores and np.mean(scores) < LOW_POSE_SCORE
+            if (small or unsure) and estimate < 0.8 * budget:
+                return level + 1
+        if level > self.min_level and heights and np.median(heights) > LARGE_PERSON:
+            return level - 1
+        # 한동안 부하 없이 유지되면 업그레이드 대기 시간을 초기화합니다.
+        if level + 1 in self.backoff and now >= self.retry_at[level + 1] + UPGRADE_BACKOFF:
+            del self.backoff[level + 1]
+        return level
+
+    def step(self):
+        now = time.monotonic()
+        measured = self.measure()
+        with self.lock:
+            heights, self.heights = self.heights, []
+            scores, self.scores = self.scores, []
+        if measured is None or now - self.last_switch < self.cooldown:
+            return
+        invoke, latency, _ = measured
+        level = self.decide(invoke, latency, heights, scores, now)
+        if level != self.level:
+            self.switch(level)
+
+    def switch(self, level):
+        """모델을 먼저 불러온 뒤 모든 파이프라인의 추론 해상도를 바꿉니다."""
+        self.engines.load(level)
+        old_size = self.inference_size
+        self.level = level
+        self.last_switch = time.monotonic()
+        self.switches += 1
+        print('추론 해상도 변경: %dx%d -> %dx%d' % (old_size + self.inference_size))
+        for pipeline in self.pipelines:
+            pipeline.set_inference_size(self.inference_size)
+
+    def run(self):
+        while not self.stopped.wait(self.window):
+            try:
+                self.step()
+            except Exception as e:
+                print('해상도 제어 오류: %s' % e)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='adaptive', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
@@ -0,0 +1,120 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+# 낙상 전후로 전송할 시간(초)입니다.
+PRE_EVENT_SECONDS = 2.0
+POST_EVENT_SECONDS = 2.0
+# 링 버퍼에 보관할 초당 프레임 수입니다. 모든 프레임을 보관하지 않고 이 간격으로 골라 담습니다.
+CAPTURE_FPS = 4.0
+# 링 버퍼에는 가로/세로를 이 배율로 줄인 프레임을 보관합니다.
+CAPTURE_STEP = 2
+
+
+class FrameRing:
+    """
+    최근 프레임을 미리 할당한 고정 크기 배열 (capacity, 높이, 너비, 3)에 보관하는 링 버퍼입니다.
+    프레임마다 새 배열을 만들지 않으므로 메모리 사용량이 capacity로 고정됩니다.
+    timestamps는 구간을 고를 때 쓰는 프레임 시각이고, wall_times는 서버로 보낼 촬영 시각(epoch 초)입니다.
+    """
+    def __init__(self, capacity, shape):
+        self.frames = np.zeros((capacity,) + tuple(shape), dtype=np.uint8)
+        self.timestamps = np.full(capacity, -np.inf)
+        self.wall_times = np.zeros(capacity)
+        self.count = 0
+
+    def push(self, frame, timestamp, wall_time, step=1):
+        """
+        frame(BufferFrame 또는 배열)을 step 간격으로 줄여서 다음 칸에 복사합니다.
+        프레임 크기가 달라 칸에 맞지 않으면 False를 반환합니다.
+        """
+        slot = self.count % len(self.frames)
+        if isinstance(frame, np.ndarray):
+            view = frame[::step, ::step]
+            if view.shape != self.frames.shape[1:]:
+                return False
+            np.copyto(self.frames[slot], view)
+        elif frame.copy(step=step, out=self.frames[slot]) is None:
+            return False
+        self.timestamps[slot] = timestamp
+        self.wall_times[slot] = wall_time
+        self.count += 1
+        return True
+
+    def between(self, start, end):
+        """start <= 시각 <= end인 프레임의 (복사본 리스트, 촬영 시각 리스트)를 시간 순서로 반환합니다."""
+        indices = np.flatnonzero((self.timestamps >= start) & (self.timestamps <= end))
+        indices = indices[np.argsort(self.timestamps[indices])]
+        return [self.frames[i].copy() for i in indices], self.wall_times[indices].tolist()
+
+
+class EventCapture:
+    """
+    카메라 한 대의 낙상 전후 장면을 모읍니다.
+
+    매 프레임 add()를 호출하면 CAPTURE_FPS 간격으로 축소 프레임을 FrameRing에 담아 두고,
+    낙상이 감지된 프레임은 원본 크기로 따로 복사해 둡니다.
+    post 초가 지나면 (전 장면 + 낙상 프레임 + 후 장면)을 on_clip(frames, timestamps, event_index)로 넘깁니다.
+    on_clip은 감지 단계에서 호출되므로 인코딩처럼 오래 걸리는 작업은 다른 스레드로 넘겨야 합니다.
+    추론 해상도가 바뀌어 프레임 크기가 달라지면 링 버퍼를 새 크기로 다시 만듭니다. (이전 장면은 버려짐)
+
+    구간은 프레임 시각(PTS 기반, 단조 증가)으로 고르므로 NTP 동기화로 시스템 시계가 바뀌어도 어긋나지 않고,
+    on_clip에 넘기는 timestamps는 프레임마다 따로 기록한 촬영 시각(time.time())입니다.
+    카메라가 끝나거나 프로그램을 종료할 때는 flush()로 후 장면을 기다리던 낙상을 바로 넘깁니다.
+    """
+    def __init__(self, shape, on_clip, pre=PRE_EVENT_SECONDS, post=POST_EVENT_SECONDS,
+                 fps=CAPTURE_FPS, step=CAPTURE_STEP):
+        self.on_clip = on_clip
+        self.pre = pre
+        self.post = post
+        self.interval = 1.0 / fps
+        self.step = step
+        self.capacity = math.ceil((pre + post) * fps) + 2
+        self.shape = None
+        self.resize(shape)
+        self.last_push = -np.inf
+        # 후 장면을 기다리는 낙상: (프레임 시각, 촬영 시각, 원본 크기 프레임)
+        self.pending = []
+        # 감지 단계와 flush()를 부르는 스레드(종료 처리)가 다를 수 있습니다.
+        self.lock = threading.Lock()
+
+    def resize(self, shape):
+        height, width = shape[:2]
+        self.shape = tuple(shape)
+        self.ring = FrameRing(self.capacity,
+                              (math.ceil(height / self.step), math.ceil(width / self.step), 3))
+
+    def add(self, frame, timestamp, event=False, wall_time=None):
+        """
+        프레임 하나를 받습니다. timestamp는 프레임 시각(초), wall_time은 촬영 시각(epoch 초, 기본값: 지금)입니다.
+        """
+        if wall_time is None:
+            wall_time = time.time()
+        with self.lock:
+            if tuple(frame.shape) != self.shape:
+                self.resize(frame.shape)
+            if event:
+                full = frame.copy()
+                if full is not None:
+                    self.pending.append((timestamp, wall_time, full))
+            elif timestamp - self.last_push >= self.interval:
+                if self.ring.push(frame, timestamp, wall_time, self.step):
+                    self.last_push = timestamp
+
+            # 프레임 시각이 거꾸로 가면(영상 소스가 다시 시작됨 등) 기다리던 낙상을 바로 넘깁니다.
+            while self.pending and not 0 <= timestamp - self.pending[0][0] < self.post:
+                self.emit(*self.pending.pop(0))
+
+    def flush(self):
+        """후 장면을 기다리는 낙상을 지금까지 모인 후 장면과 함께 모두 넘깁니다."""
+        with self.lock:
+            while self.pending:
+                self.emit(*self.pending.pop(0))
+
+    def emit(self, event_time, event_wall_time, event_frame):
+        before, before_times = self.ring.between(event_time - self.pre, event_time)
+        after, after_times = self.ring.between(event_time, event_time + self.post)
+        self.on_clip(before + [event_frame] + after,
+                     before_times + [event_wall_time] + after_times, len(before))
@@ -0,0 +1,303 @@
+"""
+사람별 키포인트 시계열로 낙상을 판단하는 분류기입니다.
+
+트랙마다 최근 WINDOW_SECONDS 초 동안의 키포인트 17개 (x, y, score)를 프레임 시각과 함께 KeypointWindow에 보관하고,
+프레임마다 창 전체에서 특징(FEATURES)을 벡터 연산으로 계산합니다. 창 크기가 고정이므로 프레임당 비용은 일정합니다.
+속도와 거리는 프레임 수가 아니라 고정된 시간 간격으로 계산하므로(빠진 프레임은 보간), 전력을 아끼려고
+초당 프레임 수를 낮추거나 큐에서 프레임이 버려져도 같은 임계값이 같은 의미를 가집니다.
+모든 길이는 몸통 길이(어깨 중심 ~ 엉덩이 중심) 단위로 정규화하므로, 카메라와의 거리나 해상도가 달라도
+같은 임계값을 사용할 수 있습니다.
+
+  torso_angle   : 몸통이 수직에서 기운 각도(도). 서 있으면 0, 누워 있으면 90에 가깝습니다.
+  aspect_ratio  : 보이는 키포인트를 감싸는 사각형의 너비/높이. 누워 있으면 커집니다.
+  hip_velocity  : 창 안에서 엉덩이 중심이 내려간 가장 빠른 속도(몸통 길이/초).
+  shoulder_drop : 창 안에서 DROP_SECONDS 초 동안 어깨 중심이 내려간 가장 큰 거리(몸통 길이).
+  movement      : 최근 STILL_SECONDS 초 동안 키포인트가 움직인 평균 속도(몸통 길이/초). 낙상 후 정지 판단에 씁니다.
+
+분류기는 predict(window)로 낙상 점수(0~1)를 반환하며, 규칙 기반의 RuleClassifier와
+작은 양자화 TFLite 모델을 사용하는 TFLiteClassifier가 있습니다.
+"""
+import math
+
+import numpy as np
+
+from pose_engine import KeypointType
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    Interpreter = None
+
+NUM_KEYPOINTS = len(KeypointType)
+# 트랙마다 보관하는 시간(초)입니다. (넘어지는 동작과 넘어진 뒤의 자세를 함께 봅니다)
+WINDOW_SECONDS = 2.0
+# 창에 담을 수 있는 최대 초당 프레임 수입니다. (이보다 빠르면 창이 WINDOW_SECONDS보다 짧아집니다)
+MAX_FPS = 30
+# 하강 속도와 하강 거리는 프레임 수가 아니라 이 간격의 균일한 시간 격자로 다시 샘플링하여 계산합니다.
+SAMPLE_INTERVAL = 1 / 15
+# 샘플 사이의 간격이 이보다 길면 (움직임 게이트, 버려진 프레임 등) 그 사이는 보간하지 않습니다.
+MAX_GAP_SECONDS = 0.5
+# 이보다 점수가 낮은 키포인트는 보이지 않는 것으로 봅니다.
+KEYPOINT_MIN_SCORE = 0.3
+# 하강 속도를 계산할 시간 간격(초)과, 하강 거리를 비교할 시간(초)입니다.
+# (천천히 눕거나 앉는 동작은 DROP_SECONDS 동안 조금만 내려갑니다)
+VELOCITY_SECONDS = 0.2
+DROP_SECONDS = 0.7
+# 정지 여부를 판단할 최근 시간(초)입니다.
+STILL_SECONDS = 0.5
+# 몸통 길이를 알 수 없을 때 키포인트 사각형 높이에 곱해 몸통 길이로 쓰는 비율입니다.
+TORSO_PER_HEIGHT = 0.35
+# 몸통 길이가 이보다 짧으면(픽셀) 너무 멀거나 잘못 잡힌 포즈로 보고 판단하지 않습니다.
+MIN_SCALE = 8.0
+
+FEATURES = ('torso_angle', 'aspect_ratio', 'hip_velocity', 'shoulder_drop', 'movement')
+TORSO_ANGLE, ASPECT_RATIO, HIP_VELOCITY, SHOULDER_DROP, MOVEMENT = range(len(FEATURES))
+
+# RuleClassifier 기본 임계값 (몸통 길이 단위)
+FALL_HIP_VELOCITY = 2.0
+FALL_SHOULDER_DROP = 1.0
+LYING_ANGLE = 55.0
+LYING_ASPECT_RATIO = 1.0
+STILL_MOVEMENT = 0.3
+# 낙상 점수가 이 값 이상이면 낙상으로 판단합니다.
+FALL_SCORE = 0.5
+
+SHOULDERS = (KeypointType.LEFT_SHOULDER, KeypointType.RIGHT_SHOULDER)
+HIPS = (KeypointType.LEFT_HIP, KeypointType.RIGHT_HIP)
+
+
+class KeypointWindow:
+    """
+    사람 한 명의 최근 seconds 초 동안의 키포인트 (n, 17, 3)와 프레임 시각 (n,)을 보관하는 링 버퍼입니다.
+    시각은 프레임이 캡처된 시각(GStreamer 버퍼 PTS 또는 time.monotonic() 기준 초)입니다.
+    배열은 미리 할당되며, 특징은 마지막으로 추가한 프레임 기준으로 한 번만 계산해 둡니다.
+    """
+    def __init__(self, seconds=WINDOW_SECONDS, max_fps=MAX_FPS):
+        self.seconds = seconds
+        capacity = math.ceil(seconds * max_fps) + 1
+        self.keypoints = np.zeros((capacity, NUM_KEYPOINTS, 3), dtype=np.float32)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.count = 0
+        self._features = None
+
+    def __len__(self):
+        return min(self.count, len(self.timestamps))
+
+    def duration(self):
+        """가장 오래된 프레임부터 마지막 프레임까지의 시간(초)입니다."""
+        _, timestamps = self.ordered()
+        return timestamps[-1] - timestamps[0] if len(timestamps) else 0.0
+
+    def append(self, keypoints, timestamp):
+        """keypoints: 원본 영상 좌표의 (17, 3) 배열. timestamp는 이전 프레임보다 늦어야 합니다."""
+        if self.count and timestamp <= self.timestamps[(self.count - 1) % len(self.timestamps)]:
+            return
+        slot = self.count % len(self.timestamps)
+        self.keypoints[slot] = keypoints
+        self.timestamps[slot] = timestamp
+        self.count += 1
+        self._features = None
+
+    def ordered(self):
+        """창 안(마지막 프레임 기준 seconds 초 이내)의 (키포인트 (n, 17, 3), 시각 (n,))을 오래된 순서로 반환합니다."""
+        size = len(self.timestamps)
+        if self.count <= size:
+            keypoints, timestamps = self.keypoints[:self.count], self.timestamps[:self.count]
+        else:
+            order = (np.arange(size) + self.count) % size
+            keypoints, timestamps = self.keypoints[order], self.timestamps[order]
+        start = np.searchsorted(timestamps, timestamps[-1] - self.seconds) if len(timestamps) else 0
+        return keypoints[start:], timestamps[start:]
+
+    def features(self):
+        """FEATURES 순서의 특징 벡터 (float32)를 반환합니다. 계산할 수 없는 값은 NaN입니다."""
+        if self._features is None:
+            self._features = window_features(*self.ordered())
+        return self._features
+
+
+def time_grid(timestamps, interval=SAMPLE_INTERVAL):
+    """마지막 시각에서 interval 간격으로 첫 시각까지 거슬러 올라가는 균일한 시간 격자를 오래된 순서로 반환합니다."""
+    span = timestamps[-1] - timestamps[0]
+    return timestamps[-1] - np.arange(int(span / interval + 1e-6), -1, -1) * interval
+
+
+def gap_mask(timestamps, grid, max_gap=MAX_GAP_SECONDS):
+    """격자의 각 시각 앞뒤 샘플 간격이 max_gap보다 길어 보간하면 안 되는 위치를 True로 반환합니다."""
+    right = np.clip(np.searchsorted(timestamps, grid), 1, len(timestamps) - 1)
+    gaps = timestamps[right] - timestamps[right - 1]
+    # 격자 시각이 실제 샘플과 같으면 간격과 관계없이 사용합니다.
+    exact = (np.abs(timestamps[right] - grid) < 1e-6) | (np.abs(timestamps[right - 1] - grid) < 1e-6)
+    return (gaps > max_gap) & ~exact
+
+
+def resample(timestamps, values, grid, max_gap=MAX_GAP_SECONDS):
+    """
+    NaN이 섞인 시계열을 격자 시각으로 선형 보간합니다.
+    보간에 쓰는 두 샘플의 간격이 max_gap보다 길거나 범위를 벗어나면 NaN입니다.
+    """
+    valid = ~np.isnan(values)
+    if valid.sum() < 2:
+        return np.full(len(grid), np.nan)
+    times = timestamps[valid]
+    result = np.interp(grid, times, values[valid], left=np.nan, right=np.nan)
+    result[gap_mask(times, grid, max_gap)] = np.nan
+    return result
+
+
+def window_features(keypoints, timestamps):
+    """키포인트 시계열 (n, 17, 3)과 시각 (n,)으로 특징 벡터를 계산합니다."""
+    features = np.full(len(FEATURES), np.nan, dtype=np.float32)
+    if len(keypoints) < 2:
+        return features
+    visible = keypoints[:, :, 2] > KEYPOINT_MIN_SCORE
+    xy = np.where(visible[:, :, None], keypoints[:, :, :2], np.nan)
+
+    # 양쪽이 모두 보일 때만 중심을 계산합니다. (하나라도 NaN이면 NaN)
+    shoulder = xy[:, SHOULDERS].mean(axis=1)
+    hip = xy[:, HIPS].mean(axis=1)
+    torso = hip - shoulder
+    xs, ys = xy[:, :, 0], xy[:, :, 1]
+    width = np.fmax.reduce(xs, axis=1) - np.fmin.reduce(xs, axis=1)
+    height = np.fmax.reduce(ys, axis=1) - np.fmin.reduce(ys, axis=1)
+
+    # 정규화 기준: 창 안에서 가장 길게 보인 몸통 길이 (누우면 짧아 보이므로 최댓값을 씁니다)
+    scale = np.fmax.reduce(np.concatenate((np.hypot(torso[:, 0], torso[:, 1]),
+                                           height * TORSO_PER_HEIGHT)))
+    if not scale >= MIN_SCALE:
+        return features
+
+    features[TORSO_ANGLE] = math.degrees(math.atan2(abs(torso[-1, 0]), abs(torso[-1, 1])))
+    if visible[-1].sum() >= 4 and height[-1] > 0:
+        features[ASPECT_RATIO] = width[-1] / height[-1]
+
+    # 하강 속도와 거리는 초당 프레임 수와 관계없도록 균일한 시간 격자에서 계산합니다.
+    grid = time_grid(timestamps)
+    hip_y = resample(timestamps, hip[:, 1], grid)
+    shoulder_y = resample(timestamps, shoulder[:, 1], grid)
+    steps = round(VELOCITY_SECONDS / SAMPLE_INTERVAL)
+    if len(grid) > steps:
+        velocity = (hip_y[steps:] - hip_y[:-steps]) / (steps * SAMPLE_INTERVAL)
+        features[HIP_VELOCITY] = np.fmax.reduce(velocity) / scale
+    # 각 시각의 어깨 높이와 그 전 DROP_SECONDS 동안 가장 높았던 위치의 차이 중 최댓값
+    steps = min(round(DROP_SECONDS / SAMPLE_INTERVAL), len(grid) - 1)
+    if steps > 0:
+        windows = np.lib.stride_tricks.sliding_window_view(shoulder_y, steps + 1)
+        features[SHOULDER_DROP] = np.fmax.reduce(
+            windows[:, -1] - np.fmin.reduce(windows, axis=1)) / scale
+
+    # 최근 STILL_SECONDS 동안 보이는 키포인트가 이동한 거리의 합 / 걸린 시간
+    recent = slice(max(np.searchsorted(timestamps, timestamps[-1] - STILL_SECONDS) - 1, 0), None)
+    step = np.hypot(*np.moveaxis(np.diff(xy[recent], axis=0), -1, 0))
+    moved = ~np.isnan(step)
+    count = moved.sum(axis=1)
+    dt = np.diff(timestamps[recent])
+    valid = count > 0
+    if valid.any() and dt[valid].sum() > 0:
+        distance = (np.where(moved, step, 0).sum(axis=1)[valid] / count[valid]).sum()
+        features[MOVEMENT] = distance / dt[valid].sum() / scale
+    return features
+
+
+class RuleClassifier:
+    """
+    특징에 대한 규칙으로 낙상을 판단합니다.
+    빠르게 내려온 뒤(엉덩이 하강 속도 또는 어깨 하강 거리) 누운 자세(몸통 각도 또는 가로로 긴 사각형)이거나
+    움직이지 않으면 낙상으로 봅니다. 앉거나 눕는 동작은 천천히 내려오므로 하강 조건에서 걸러집니다.
+    """
+    def __init__(self, hip_velocity=FALL_HIP_VELOCITY, shoulder_drop=FALL_SHOULDER_DROP,
+                 lying_angle=LYING_ANGLE, lying_aspect_ratio=LYING_ASPECT_RATIO,
+                 still_movement=STILL_MOVEMENT, window_seconds=WINDOW_SECONDS):
+        # 트랙마다 보관할 시간(초) (FallDetector가 KeypointWindow를 만들 때 사용)
+        self.window_seconds = window_seconds
+        self.hip_velocity = hip_velocity
+        self.shoulder_drop = shoulder_drop
+        self.lying_angle = lying_angle
+        self.lying_aspect_ratio = lying_aspect_ratio
+        self.still_movement = still_movement
+
+    def predict(self, window):
+        # NaN과의 비교는 항상 False이므로, 보이지 않는 부위의 규칙은 만족하지 않은 것으로 처리됩니다.
+        f = window.features()
+        descent = f[HIP_VELOCITY] > self.hip_velocity or f[SHOULDER_DROP] > self.shoulder_drop
+        lying = f[TORSO_ANGLE] > self.lying_angle or f[ASPECT_RATIO] > self.lying_aspect_ratio
+        still = f[MOVEMENT] < self.still_movement
+        return 1.0 if descent and (lying or still) else 0.0
+
+
+class TFLiteClassifier:
+    """
+    작은 (양자화된) TFLite 분류 모델로 낙상 점수를 계산합니다. 모델 입력은 둘 중 하나입니다.
+      - 특징 벡터 (1, len(FEATURES))
+      - 정규화한 키포인트 창 (1, T, 17, 3): SAMPLE_INTERVAL 간격으로 다시 샘플링한 T개 시각의
+        엉덩이 중심 기준, 몸통 길이 단위 좌표와 점수 (보이지 않거나 긴 공백 구간은 점수 0)
+    출력은 낙상 확률 하나 (1, 1) 또는 두 클래스 (1, 2)의 두 번째 값입니다.
+    키포인트 창을 입력으로 받는 모델은 창이 T개 시각을 채우기 전에는 0을 반환합니다. 모델은 CPU에서 실행합니다.
+    """
+    def __init__(self, model_path, num_threads=1):
+        if Interpreter is None:
+            raise ValueError('tflite_runtime is required for the TFLite classifier.')
+        self.interpreter = Interpreter(model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        size = int(np.prod(self.input['shape'][1:]))
+        # 키포인트 창을 입력으로 받는 모델인지 여부
+        self.raw_input = size != len(FEATURES)
+        if not self.raw_input:
+            self.samples = 0
+            self.window_seconds = WINDOW_SECONDS
+        elif size % (NUM_KEYPOINTS * 3) == 0:
+            self.samples = size // (NUM_KEYPOINTS * 3)
+            self.window_seconds = max(WINDOW_SECONDS, self.samples * SAMPLE_INTERVAL)
+        else:
+            raise ValueError('Unsupported classifier input shape: %s' % self.input['shape'])
+
+    def inputs(self, window):
+        if not self.raw_input:
+            return window.features()
+        keypoints, timestamps = window.ordered()
+        # 격자의 각 시각에는 그 시각 이전의 가장 가까운 프레임을 씁니다.
+        grid = time_grid(timestamps)[-self.samples:]
+        index = np.searchsorted(timestamps, grid + 1e-6) - 1
+        keypoints = keypoints[index]
+        visible = (keypoints[:, :, 2] > KEYPOINT_MIN_SCORE) & ~gap_mask(timestamps, grid)[:, None]
+        xy = np.where(visible[:, :, None], keypoints[:, :, :2], np.nan)
+        # 기준점: 마지막 프레임의 엉덩이 중심 (안 보이면 어깨 중심)
+        center = xy[-1, HIPS].mean(axis=0)
+        if np.isnan(center).any():
+            center = xy[-1, SHOULDERS].mean(axis=0)
+        torso = np.fmax.reduce(np.hypot(*(xy[:, HIPS].mean(axis=1) -
+                                          xy[:, SHOULDERS].mean(axis=1)).T))
+        normalized = np.zeros_like(keypoints)
+        if torso >= MIN_SCALE and not np.isnan(center).any():
+            normalized[:, :, :2] = np.nan_to_num((xy - center) / torso)
+        normalized[:, :, 2] = np.where(visible, keypoints[:, :, 2], 0)
+        return normalized
+
+    def predict(self, window):
+        if len(window) < 2 or (self.raw_input and
+                               window.duration() < (self.samples - 1) * SAMPLE_INTERVAL - 1e-6):
+            return 0.0
+        data = np.nan_to_num(self.inputs(window)).astype(np.float32)
+        dtype = self.input['dtype']
+        scale, zero_point = self.input['quantization']
+        if dtype != np.float32 and scale:
+            info = np.iinfo(dtype)
+            data = np.clip(np.round(data / scale + zero_point), info.min, info.max)
+        self.interpreter.set_tensor(self.input['index'],
+                                    data.astype(dtype).reshape(self.input['shape']))
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output['index']).reshape(-1)
+        scale, zero_point = self.output['quantization']
+        value = float(output[-1])
+        if self.output['dtype'] != np.float32 and scale:
+            value = (value - zero_point) * scale
+        return value
+
+
+def make_classifier(model_path=None):
+    """모델 경로가 있으면 TFLiteClassifier를, 없으면 RuleClassifier를 만듭니다."""
+    if model_path:
+        return TFLiteClassifier(model_path)
+    return RuleClassifier()
@@ -0,0 +1,53 @@
+from classifier import FALL_SCORE, RuleClassifier
+from tracker import PoseTracker
+
+# 감지 후 다음 감지까지의 최소 시간 간격(초)입니다.
+FALL_COOLDOWN_SECONDS = 5.0
+
+
+class FallDetector:
+    """
+    카메라 한 대의 낙상 감지 로직입니다.
+    포즈를 원본 영상 좌표로 바꿔 사람별 트랙에 연결하고, 트랙마다 키포인트 창(KeypointWindow)을
+    분류기(classifier.py의 RuleClassifier/TFLiteClassifier)에 넘겨 낙상 점수를 계산합니다.
+    점수가 fall_score 이상인 사람이 있으면 낙상으로 판단하고, cooldown 초 안에 반복된 감지는 무시합니다.
+    실시간 파이프라인(fall_detector.py)과 재생 도구(replay.py)가 같은 코드를 사용합니다.
+    """
+    def __init__(self, classifier=None, fall_score=FALL_SCORE, cooldown=FALL_COOLDOWN_SECONDS):
+        self.classifier = classifier or RuleClassifier()
+        self.fall_score = fall_score
+        self.cooldown = cooldown
+        self.tracker = PoseTracker(window_seconds=self.classifier.window_seconds)
+        # 마지막으로 낙상이 감지된 시간을 기록하여 중복 감지를 방지합니다.
+        self.fall_detected_time = float('-inf')
+
+    def update(self, poses, src_size, inference_box, timestamp):
+        """
+        한 프레임의 포즈(PoseArray)로 상태를 갱신합니다.
+        timestamp는 그 프레임이 캡처된 시각(초)이며, 낙상 판단의 속도와 시간 창은 이 시각을 기준으로 계산합니다.
+        (각 포즈의 트랙 리스트, 낙상 알림 여부)를 반환하며,
+        알림 여부는 쿨다운을 통과한 낙상일 때만 True입니다.
+        """
+        # 모든 포즈의 키포인트를 원본 영상 좌표로 한 번에 바꿉니다. (추론 해상도가 바뀌어도 같은 좌표계)
+        box_x, box_y, box_w, box_h = inference_box
+        keypoints = poses.keypoints.copy()
+        keypoints[:, :, :2] -= (box_x, box_y)
+        keypoints[:, :, :2] *= (src_size[0] / box_w, src_size[1] / box_h)
+
+        # 포즈를 사람별 트랙에 연결합니다. tracks[i]는 i번째 포즈의 트랙입니다.
+        tracks = self.tracker.update(keypoints, timestamp)
+
+        fall_detected_in_frame = False
+        for i, track in enumerate(tracks):
+            if track is None:
+                continue
+            track.window.append(keypoints[i], timestamp)
+            track.score = self.classifier.predict(track.window)
+            if track.score >= self.fall_score:
+                fall_detected_in_frame = True
+
+        # 낙상이 감지되었고, 쿨다운 시간이 지났다면 알림 대상입니다.
+        if fall_detected_in_frame and (timestamp - self.fall_detected_time > self.cooldown):
+            self.fall_detected_time = timestamp
+            return tracks, True
+        return tracks, False
@@ -2,53 +2,24 @@ import argparse
 import collections
 from functools import partial
 import time
-import svgwrite
 import cv2
 from datetime import datetime
 import os
 import threading
 import queue
-import requests
 
 # 같은 폴더에 있는 gstreamer.py와 pose_engine.py를 임포트합니다.
 import gstreamer
-from pose_engine import PoseEngine
-from pose_engine import KeypointType
-
-# Posenet 모델의 스켈레톤에서 연결할 주요 신체 부위(엣지)를 정의합니다.
-EDGES = (
-    (KeypointType.NOSE, KeypointType.LEFT_SHOULDER),
-    (KeypointType.NOSE, KeypointType.RIGHT_SHOULDER),
-    (KeypointType.LEFT_SHOULDER, KeypointType.RIGHT_SHOULDER),
-)
-
-def shadow_text(dwg, x, y, text, font_size=16):
-    """SVG 캔버스에 그림자가 있는 텍스트를 추가합니다."""
-    dwg.add(dwg.text(text, insert=(x + 1, y + 1), fill='black',
-                     font_size=font_size, style='font-family:sans-serif'))
-    dwg.add(dwg.text(text, insert=(x, y), fill='white',
-                     font_size=font_size, style='font-family:sans-serif'))
-
-def draw_pose(dwg, pose, src_size, inference_box, color='yellow', threshold=0.2):
-    """추론된 포즈의 스켈레톤을 SVG 캔버스에 그립니다."""
-    box_x, box_y, box_w, box_h = inference_box
-    scale_x, scale_y = src_size[0] / box_w, src_size[1] / box_h
-    xys = {}
-    for label, keypoint in pose.keypoints.items():
-        if keypoint.score < threshold:
-            continue
-        kp_x = int((keypoint.point[0] - box_x) * scale_x)
-        kp_y = int((keypoint.point[1] - box_y) * scale_y)
-        xys[label] = (kp_x, kp_y)
-        dwg.add(dwg.circle(center=(kp_x, kp_y), r=5,
-                           fill='none', stroke='none', display='none'))
-
-    for a, b in EDGES:
-        if a not in xys or b not in xys:
-            continue
-        ax, ay = xys[a]
-        bx, by = xys[b]
-        dwg.add(dwg.line(start=(ax, ay), end=(bx, by), stroke=color, stroke_width=2))
+from pose_engine import BACKENDS, PoseEngine
+from detection import FallDetector
+from classifier import make_classifier
+from overlay import OVERLAY_MODES, RasterOverlay, SvgOverlay
+from replay import PoseRecorder
+from outbox import Outbox
+from capture import EventCapture
+from motion import IDLE_FPS
+from adaptive import MODEL_LADDER, TARGET_FPS, AdaptiveController, EngineLadder
+from metrics import HEARTBEAT_INTERVAL, METRICS_HOST, METRICS_PORT, Heartbeat, Metrics, MetricsServer
 
 def avg_fps_counter(window_size):
     """프레임 처리 속도(FPS)의 이동 평균을 계산합니다."""
@@ -61,20 +32,71 @@ def avg_fps_counter(window_size):
         prev = curr
         yield len(window) / sum(window)
 
-def run(inf_callback, render_callback):
+class CameraState:
+    """카메라 한 대의 낙상 감지 상태와 성능 통계를 보관합니다."""
+    def __init__(self, camera_id, renderer=None, controller=None, classifier=None):
+        self.camera_id = camera_id
+        # 화면 오버레이 렌더러 (SvgOverlay/RasterOverlay, 헤드리스면 None)
+        self.renderer = renderer
+        # 추론 해상도 제어기 (--adaptive가 아니면 None). 감지된 사람의 크기를 알려 줍니다.
+        self.controller = controller
+        self.n = 0
+        self.sum_process_time = 0
+        self.sum_inference_time = 0
+        self.fps_counter = avg_fps_counter(30)
+        # 사람별 추적과 낙상 판단은 카메라마다 독립적으로 수행합니다.
+        self.detector = FallDetector(classifier)
+        # 낙상 전후 장면 수집기 (첫 프레임의 크기를 알게 되면 만듭니다)
+        self.capture = None
+
+def run(inf_callback, parse_callback, detect_callback, render_callback,
+        outbox=None, heartbeat_url=None):
     """
     명령어 라인 인자를 파싱하고, PoseEngine을 초기화한 후,
     GStreamer 파이프라인을 실행합니다.
+    inf_callback, parse_callback에는 engine이, detect_callback, render_callback에는
+    카메라별 CameraState가 첫 번째 인자로 묶여서 전달됩니다.
+    실행 중에는 기기 상태 지표를 /metrics로 제공하고, heartbeat_url이 있으면 서버로 하트비트를 보냅니다.
     """
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--mirror', help='수평으로 비디오를 뒤집습니다.', action='store_true')
     parser.add_argument('--model', help='.tflite 모델 파일 경로', required=False)
     parser.add_argument('--res', help='해상도', default='640x480',
                         choices=['480x360', '640x480', '1280x720'])
-    parser.add_argument('--videosrc', help='사용할 비디오 소스', default='/dev/video0')
+    parser.add_argument('--videosrc', help='사용할 비디오 소스 (여러 개 지정 시 멀티 카메라 모드)',
+                        nargs='+', default=['/dev/video0'])
+    parser.add_argument('--schedule', help='멀티 카메라 모드의 추론 스케줄링 방식',
+                        default='round-robin', choices=['round-robin', 'motion'])
     parser.add_argument('--h264', help='video/x-h264 입력을 사용합니다.', action='store_true')
     parser.add_argument('--jpeg', help='image/jpeg 입력을 사용합니다.', action='store_true')
+    parser.add_argument('--backend', help='추론 백엔드 (auto: Edge TPU가 없으면 CPU 사용)',
+                        default='auto', choices=BACKENDS)
+    parser.add_argument('--num_threads', help='CPU 백엔드의 스레드 수 (기본값: CPU 코어 수)',
+                        type=int, default=None)
+    parser.add_argument('--overlay', help='화면 오버레이 방식 (svg: SVG 오버레이, '
+                        'raster: 추론 프레임에 직접 그리기, none: 화면 출력 없음)',
+                        default='svg', choices=OVERLAY_MODES)
+    parser.add_argument('--record', help='모델 출력 텐서를 replay.py용 .npz 파일로 기록합니다.')
+    parser.add_argument('--idle_fps', help='움직임이 없는 장면에서의 초당 추론 횟수 (전력/발열 절감)',
+                        type=float, default=IDLE_FPS)
+    parser.add_argument('--no_motion_gate', help='움직임과 관계없이 모든 프레임을 추론합니다.',
+                        action='store_true')
+    parser.add_argument('--classifier', help='규칙 대신 사용할 낙상 분류 .tflite 모델 경로 (classifier.py)')
+    parser.add_argument('--adaptive', help='추론 시간과 사람 크기에 따라 실행 중에 모델(추론 해상도)을 바꿉니다. '
+                        '--res는 시작 해상도가 됩니다.', action='store_true')
+    parser.add_argument('--target_fps', help='--adaptive에서 유지하려는 초당 추론 횟수',
+                        type=float, default=TARGET_FPS)
+    parser.add_argument('--metrics_port', help='기기 상태 지표(Prometheus 형식 /metrics)를 제공할 포트 (0: 끄기)',
+                        type=int, default=METRICS_PORT)
+    parser.add_argument('--metrics_host', help='/metrics를 제공할 주소 (다른 기기의 수집기가 읽으려면 0.0.0.0)',
+                        default=METRICS_HOST)
+    parser.add_argument('--heartbeat_interval', help='서버로 하트비트를 보내는 간격(초) (0: 끄기)',
+                        type=float, default=HEARTBEAT_INTERVAL)
     args = parser.parse_args()
+    if args.record and len(args.videosrc) > 1:
+        parser.error('--record는 비디오 소스가 하나일 때만 사용할 수 있습니다.')
+    if args.adaptive and (args.model or args.record):
+        parser.error('--adaptive는 --model, --record와 함께 사용할 수 없습니다.')
 
     default_model = 'models/mobilenet/posenet_mobilenet_v1_075_%d_%d_quant_decoder_edgetpu.tflite'
     if args.res == '480x360':
@@ -90,18 +112,138 @@ def run(inf_callback, render_callback):
         appsink_size = (1280, 720)
         model = args.model or default_model % (721, 1281)
 
-    print('모델 로딩 중: ', model)
-    engine = PoseEngine(model)
+    controller = None
+    if args.adaptive:
+        # 원본 영상보다 큰 해상도로 올려도 얻는 것이 없으므로 원본 높이까지만 사용합니다.
+        level = [path for _, path in MODEL_LADDER].index(model)
+        max_level = max(index for index, ((_, height), _) in enumerate(MODEL_LADDER)
+                        if height <= src_size[1] + 1)
+        engine = EngineLadder(MODEL_LADDER, level, backend=args.backend, num_threads=args.num_threads)
+        controller = AdaptiveController(engine, level, target_fps=args.target_fps,
+                                        max_level=max(level, max_level))
+    else:
+        print('모델 로딩 중: ', model)
+        engine = PoseEngine(model, backend=args.backend, num_threads=args.num_threads)
+    print('추론 백엔드: ', engine.backend_name)
     input_shape = engine.get_input_tensor_shape()
     inference_size = (input_shape[2], input_shape[1])
 
-    gstreamer.run_pipeline(partial(inf_callback, engine),
-                           partial(render_callback, engine),
-                           src_size, inference_size,
-                           mirror=args.mirror,
-                           videosrc=args.videosrc,
-                           h264=args.h264,
-                           jpeg=args.jpeg)
+    inference = partial(inf_callback, engine)
+    recorder = None
+    if args.record:
+        recorder = PoseRecorder(src_size, inference_size, mirror=args.mirror)
+        inference = partial(record_inference, inference, recorder)
+
+    metrics = Metrics(engine, outbox)
+    metrics_server = heartbeat = None
+    if args.metrics_port:
+        # 포트를 쓸 수 없어도(다른 인스턴스 실행 중, 재시작 직후 등) 낙상 감지는 계속합니다.
+        try:
+            metrics_server = MetricsServer(metrics, args.metrics_host, args.metrics_port)
+        except OSError as e:
+            print('기기 상태 지표를 제공하지 않습니다 (%s:%d): %s' % (args.metrics_host, args.metrics_port, e))
+        else:
+            metrics_server.start()
+            print('기기 상태 지표: http://%s:%d/metrics' % (args.metrics_host, metrics_server.port))
+    if heartbeat_url and args.heartbeat_interval > 0:
+        heartbeat = Heartbeat(metrics, heartbeat_url, args.heartbeat_interval)
+        heartbeat.start()
+
+    try:
+        run_sources(args, inference, partial(parse_callback, engine),
+                    detect_callback, render_callback, src_size, inference_size, controller,
+                    metrics)
+    finally:
+        if heartbeat:
+            heartbeat.stop()
+        if metrics_server:
+            metrics_server.stop()
+        if controller:
+            print('추론 해상도 변경 %d회, 마지막 해상도 %dx%d' % (
+                (controller.switches,) + controller.inference_size))
+        for name, (count, avg_ms) in engine.latency_stats().items():
+            print('백엔드 %s: 추론 %d회, 평균 %.1fms' % (name, count, avg_ms))
+        if recorder:
+            recorder.save(args.record)
+            print('출력 텐서 기록 저장: ', args.record)
+
+def record_inference(inference, recorder, input_tensor, timestamp):
+    """
+    추론을 실행하고, 추론 결과에 담긴 원본 출력 텐서 스냅샷을 프레임 시각과 함께 기록합니다.
+    실시간 감지와 같은 시각(PTS 기반)을 기록하므로 재생할 때도 큐 대기로 인한 시간 흔들림이 없습니다.
+    """
+    output = inference(input_tensor, timestamp)
+    recorder.add(output[0], timestamp)
+    return output
+
+def make_renderer(overlay, src_size):
+    """오버레이 방식에 맞는 카메라별 렌더러를 만듭니다."""
+    if overlay == 'svg':
+        return SvgOverlay(src_size)
+    if overlay == 'raster':
+        return RasterOverlay()
+    return None
+
+def run_sources(args, inference, parse, detect_callback, render_callback,
+                src_size, inference_size, controller=None, metrics=None):
+    """비디오 소스 개수에 따라 단일/멀티 카메라 파이프라인을 실행합니다."""
+    def bind_render(state):
+        return partial(render_callback, state) if state.renderer else None
+
+    # 녹화 중에는 모든 프레임의 출력을 기록하도록 움직임 게이트를 끕니다.
+    idle_fps = None if args.no_motion_gate or args.record else args.idle_fps
+
+    def flush_capture(state):
+        # 후 장면을 기다리던 낙상 장면을 바로 전송 대기열에 넣습니다.
+        if state.capture:
+            state.capture.flush()
+
+    if len(args.videosrc) == 1:
+        state = CameraState(0, make_renderer(args.overlay, src_size), controller,
+                            make_classifier(args.classifier))
+        try:
+            gstreamer.run_pipeline(inference,
+                                   bind_render(state),
+                                   src_size, inference_size,
+                                   mirror=args.mirror,
+                                   videosrc=args.videosrc[0],
+                                   h264=args.h264,
+                                   jpeg=args.jpeg,
+                                   parse_callback=parse,
+                                   detect_callback=partial(detect_callback, state),
+                                   overlay=args.overlay,
+                                   idle_fps=idle_fps,
+                                   controller=controller,
+                                   metrics=metrics)
+        finally:
+            flush_capture(state)
+    else:
+        # 모든 카메라가 하나의 PoseEngine을 공유하고, 카메라별 상태는 따로 유지합니다.
+        # TFLite 인터프리터는 스레드 간에 공유할 수 없으므로 분류기는 카메라마다 만듭니다.
+        states = [CameraState(camera_id, make_renderer(args.overlay, src_size), controller,
+                              make_classifier(args.classifier))
+                  for camera_id in range(len(args.videosrc))]
+        try:
+            gstreamer.run_pipelines(inference,
+                                    [bind_render(state) for state in states],
+                                    src_size, inference_size,
+                                    args.videosrc,
+                                    schedule=args.schedule,
+                                    mirror=args.mirror,
+                                    h264=args.h264,
+                                    jpeg=args.jpeg,
+                                    parse_callback=parse,
+                                    detect_callbacks=[partial(detect_callback, state)
+                                                      for state in states],
+                                    overlay=args.overlay,
+                                    idle_fps=idle_fps,
+                                    controller=controller,
+                                    metrics=metrics,
+                                    on_camera_finished=lambda camera_id:
+                                        flush_capture(states[camera_id]))
+        finally:
+            for state in states:
+                flush_capture(state)
 
 def main():
     """
@@ -110,127 +252,133 @@ def main():
     """
     # --- 애플리케이션 설정 및 상태 변수 ---
     SERVER_URL = 'http://44.201.150.94:5000/upload'
-    n = 0
-    sum_process_time = 0
-    sum_inference_time = 0
-    fps_counter = avg_fps_counter(30)
-
-    # --- 낙상 감지 로직 관련 변수 ---
-    # 최근 10 프레임 동안의 어깨 중심 Y좌표를 저장합니다.
-    shoulder_y_history = collections.deque(maxlen=10)
-    # Y좌표의 변화량이 이 값을 넘으면 낙상으로 판단합니다. (환경에 맞게 조절 필요)
-    FALL_THRESHOLD = 50
-    # 마지막으로 낙상이 감지된 시간을 기록하여 중복 감지를 방지합니다.
-    fall_detected_time = 0
-    # 감지 후 다음 감지까지의 최소 시간 간격(초)입니다.
-    FALL_COOLDOWN_SECONDS = 5.0
-
-    # --- 이미지 비동기 전송을 위한 큐 ---
-    save_queue = queue.Queue()
+    # 기기 상태(fps, 모델, 오류 수, 온도 등)를 주기적으로 보내는 주소입니다.
+    HEARTBEAT_URL = 'http://44.201.150.94:5000/heartbeat'
+    # 서버로 보내지 못한 이미지를 보관하는 파일입니다. 재부팅 후에도 남아 있다가 다시 전송됩니다.
+    OUTBOX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outbox.db')
+    # 종료할 때 남은 낙상 장면의 인코딩과 저장을 기다리는 최대 시간(초)입니다.
+    SAVE_TIMEOUT = 5.0
+
+    # 낙상 판단 기준(RuleClassifier의 임계값 등)은 classifier.py에, 카메라별 상태는 CameraState에 있습니다.
+
+    # --- 이미지 비동기 전송 ---
+    # 영상 처리 스레드는 낙상 전후 장면(프레임 복사본 묶음)만 큐에 넣고, 인코딩과 저장은 인코딩 워커가,
+    # 서버 전송(재시도, 묶음 전송)은 Outbox의 전송 스레드가 담당합니다.
+    # 큐가 가득 차면 새 장면을 버려서 메모리 사용량을 제한합니다.
+    save_queue = queue.Queue(maxsize=4)
+    outbox = Outbox(OUTBOX_PATH, SERVER_URL)
 
     def image_save_worker():
         """
-        백그라운드 스레드에서 실행되며, 큐에 들어온 이미지 프레임을 서버로 전송합니다.
-        이를 통해 메인 스레드(영상 처리)의 지연을 방지합니다.
+        백그라운드 스레드에서 실행되며, 큐에 들어온 낙상 전후 프레임들을 JPEG으로 인코딩하여
+        Outbox에 한 묶음으로 저장합니다. 이를 통해 메인 스레드(영상 처리)의 지연을 방지합니다.
         """
-        nonlocal save_queue
         while True:
-            try:
-                frame_to_send = save_queue.get(timeout=1)
+            camera_id, frames, timestamps, event_index = save_queue.get()
 
-                # OpenCV 프레임(Numpy 배열)을 JPEG 형식으로 메모리에서 인코딩합니다.
-                is_success, buffer = cv2.imencode(".jpg", frame_to_send)
+            images = []
+            event_position = None
+            for index, (frame_to_send, captured_at) in enumerate(zip(frames, timestamps)):
+                # 파이프라인 프레임은 RGB이므로 OpenCV가 기대하는 BGR로 바꿔서 JPEG으로 인코딩합니다.
+                is_success, buffer = cv2.imencode(".jpg", cv2.cvtColor(frame_to_send, cv2.COLOR_RGB2BGR))
                 if not is_success:
                     print("이미지 인코딩 실패")
                     continue
+                if index == event_index:
+                    event_position = len(images)
+                images.append((buffer.tobytes(), captured_at))
+            if images:
+                outbox.put_many(camera_id, images, event_position)
+            save_queue.task_done()
 
-                # HTTP POST 요청을 위한 파일 데이터를 준비합니다.
-                files = {'image0': ('fall_capture.jpg', buffer.tobytes(), 'image/jpeg')}
-
-                # 서버로 이미지 데이터를 전송합니다 (10초 타임아웃).
-                try:
-                    response = requests.post(SERVER_URL, files=files, timeout=10)
-                    if response.status_code == 200:
-                        print(f"서버에 이미지 전송 성공: {response.json()}")
-                    else:
-                        print(f"서버에 이미지 전송 실패: 상태 코드 {response.status_code}")
-                except requests.exceptions.RequestException as e:
-                    print(f"서버 연결 오류: {e}")
+    def queue_clip(camera_id, frames, timestamps, event_index):
+        """낙상 전후 장면이 모이면 EventCapture가 호출합니다. 큐가 가득 차면 버립니다."""
+        try:
+            save_queue.put_nowait((camera_id, frames, timestamps, event_index))
+        except queue.Full:
+            print("전송 대기열이 가득 차서 낙상 장면을 버립니다.")
 
-                save_queue.task_done()
-            except queue.Empty:
-                continue
-
-    # 이미지 전송 워커를 데몬 스레드로 시작합니다.
+    # 인코딩 워커를 데몬 스레드로 시작하고, 이전 실행에서 남은 이미지부터 전송을 시작합니다.
     threading.Thread(target=image_save_worker, daemon=True).start()
+    outbox.start()
 
     # --- GStreamer 콜백 함수 정의 ---
-    def run_inference(engine, input_tensor):
-        """PoseEngine을 통해 모델 추론을 실행합니다."""
-        return engine.run_inference(input_tensor.flatten())
-
-    def render_overlay(engine, output, src_size, inference_box, frame):
+    def run_inference(engine, input_tensor, timestamp):
         """
-        매 프레임마다 호출되어, 추론 결과를 분석하고 화면에 오버레이를 렌더링합니다.
+        PoseEngine을 통해 모델 추론을 실행하고, 출력 텐서 스냅샷을 반환합니다. (timestamp는 쓰지 않음)
+        다음 추론(다른 카메라 포함)이 출력 텐서를 덮어써도 파싱 단계가 안전하게 읽을 수 있습니다.
         """
-        nonlocal n, sum_process_time, sum_inference_time, fps_counter
-        nonlocal shoulder_y_history, fall_detected_time, save_queue
+        # reshape는 연속 배열이면 복사 없이 뷰를 반환합니다.
+        inference_time = engine.run_inference(input_tensor.reshape(-1)) / 1000
+        return engine.get_output_snapshot(), inference_time, engine.backend_name
 
-        svg_canvas = svgwrite.Drawing('', size=src_size)
+    def parse_output(engine, output):
+        """추론 단계가 만든 출력 텐서 스냅샷을 포즈 배열로 해석합니다."""
+        snapshot, inference_time, backend_name = output
         start_time = time.monotonic()
-        outputs, inference_time = engine.ParseOutput()
-        end_time = time.monotonic()
-
-        # 성능 통계 계산 및 화면 표시
-        n += 1
-        sum_process_time += 1000 * (end_time - start_time)
-        sum_inference_time += inference_time * 1000
-        avg_inference_time = sum_inference_time / n if n > 0 else 0
-        text_line = 'PoseNet: %.1fms (%.2f fps) TrueFPS: %.2f Nposes %d' % (
+        poses = engine.ParseOutputSnapshot(snapshot)
+        process_time = time.monotonic() - start_time
+        return poses, inference_time, process_time, backend_name
+
+    def detect_falls(state, output, src_size, inference_box, frame, timestamp):
+        """
+        매 프레임마다 호출되어, 추론 결과를 분석하고 낙상 여부를 판단합니다.
+        state는 이 프레임을 보낸 카메라의 CameraState이고, timestamp는 프레임이 캡처된 시각(초)입니다.
+        """
+        outputs, inference_time, process_time, backend_name = output
+
+        # 성능 통계 계산
+        state.n += 1
+        state.sum_process_time += 1000 * process_time
+        state.sum_inference_time += inference_time * 1000
+        avg_inference_time = state.sum_inference_time / state.n
+        text_line = 'Cam %d PoseNet[%s]: %.1fms (%.2f fps) TrueFPS: %.2f Nposes %d' % (
+                     state.camera_id, backend_name,
                      avg_inference_time, 1000 / avg_inference_time if avg_inference_time > 0 else 0,
-                     next(fps_counter), len(outputs))
-        shadow_text(svg_canvas, 10, 20, text_line)
+                     next(state.fps_counter), len(outputs))
 
         # 각 프레임에서 감지된 포즈들을 분석합니다.
-        fall_detected_in_frame = False
-        for pose in outputs:
-            draw_pose(svg_canvas, pose, src_size, inference_box)
-            ls = pose.keypoints.get(KeypointType.LEFT_SHOULDER)
-            rs = pose.keypoints.get(KeypointType.RIGHT_SHOULDER)
-
-            # 양쪽 어깨가 모두 감지되었을 경우, 낙상 감지 로직을 수행합니다.
-            if ls and rs and ls.score > 0.5 and rs.score > 0.5:
-                box_x, box_y, box_w, box_h = inference_box
-                scale_y = src_size[1] / box_h
-                ls_y = (ls.point[1] - box_y) * scale_y
-                rs_y = (rs.point[1] - box_y) * scale_y
-                shoulder_y = (ls_y + rs_y) / 2
-                shoulder_y_history.append(shoulder_y)
-
-                # 저장된 Y좌표 기록을 바탕으로 급격한 수직 하강이 있었는지 확인합니다.
-                if len(shoulder_y_history) == shoulder_y_history.maxlen:
-                    delta = shoulder_y_history[-1] - shoulder_y_history[0]
-                    if delta > FALL_THRESHOLD:
-                        fall_detected_in_frame = True
-
-        # 낙상이 감지되었고, 쿨다운 시간이 지났다면 알림을 처리합니다.
-        current_time = time.monotonic()
-        if fall_detected_in_frame and (current_time - fall_detected_time > FALL_COOLDOWN_SECONDS):
-            fall_detected_time = current_time
-            shadow_text(svg_canvas, 10, 50, "넘어짐 감지!", font_size=24)
-
-            # 이미지 전송 큐에 현재 프레임을 추가합니다.
-            if not save_queue.full():
-                save_queue.put(frame.copy())
-
-        return (svg_canvas.tostring(), False)
+        _, fall_detected = state.detector.update(outputs, src_size, inference_box, timestamp)
+        if state.controller:
+            state.controller.observe_poses(outputs, inference_box)
+
+        # 최근 장면을 링 버퍼에 담아 두고, 낙상이 감지되었고 쿨다운 시간이 지났다면
+        # 낙상 전후 장면이 모이는 대로 이미지 전송 큐에 추가합니다.
+        if state.capture is None:
+            state.capture = EventCapture(frame.shape, partial(queue_clip, state.camera_id))
+        state.capture.add(frame, timestamp, event=fall_detected, wall_time=time.time())
+
+        return outputs, text_line, fall_detected
+
+    def render_overlay(state, output, src_size, inference_box, frame):
+        """
+        감지 단계의 결과를 카메라의 렌더러로 화면 오버레이를 만듭니다.
+        svg 모드는 SVG 문자열(직전과 같으면 None)을, raster 모드는 오버레이를 그린 RGB 프레임을 반환합니다.
+        """
+        outputs, text_line, fall_detected = output
+        if isinstance(state.renderer, RasterOverlay):
+            # 프레임은 GStreamer 버퍼를 가리키므로 복사본에 그립니다.
+            return (state.renderer.render(frame.copy(), outputs, text_line, alert=fall_detected),
+                    False)
+        svg = state.renderer.render(outputs, inference_box, text_line,
+                                    alert="넘어짐 감지!" if fall_detected else None)
+        return (svg, False)
 
     try:
         # 설정된 콜백 함수들을 GStreamer 파이프라인에 전달하여 실행합니다.
-        run(run_inference, render_overlay)
+        run(run_inference, parse_output, detect_falls, render_overlay,
+            outbox=outbox, heartbeat_url=HEARTBEAT_URL)
     except KeyboardInterrupt:
         # Ctrl+C 입력 시 프로그램을 안전하게 종료합니다.
         print("\n프로그램 종료.")
+    finally:
+        # 종료하면서 넘긴 낙상 장면이 인코딩되어 outbox.db에 저장될 때까지 잠시 기다립니다.
+        deadline = time.monotonic() + SAVE_TIMEOUT
+        while save_queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # 아직 보내지 못한 이미지는 outbox.db에 남아 다음 실행 때 전송됩니다.
+        outbox.stop(timeout=1)
+        print("전송 대기 중인 이미지: %d장" % outbox.usage()[0])
 
 # 이 스크립트가 직접 실행될 때 main 함수를 호출합니다.
 if __name__ == '__main__':
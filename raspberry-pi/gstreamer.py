@@ -8,6 +8,10 @@ import gi
 import numpy as np
 import sys
 import threading
+import time
+
+from motion import MotionGate
+from stages import BLOCK, DROP_OLDEST, RingBuffer, Stage, StageStats
 
 gi.require_version('Gst', '1.0')
 gi.require_version('GstBase', '1.0')
@@ -16,21 +20,140 @@ gi.require_version('Gtk', '3.0')
 
 Gst.init(None)
 
+def frame_view(data, width, height, stride):
+    """매핑된 버퍼 메모리를 복사 없이 (height, width, 3) RGB 배열로 바라보는 뷰를 만듭니다.
+    stride가 width * 3과 같으면 연속(contiguous) 배열이 됩니다."""
+    return np.ndarray((height, width, 3), dtype=np.uint8, buffer=data,
+                      strides=(stride, 3, 1))
+
+class BufferFrame:
+    """
+    appsink에서 받은 Gst.Buffer를 감싸서, 실제 픽셀이 필요할 때만 매핑하는 프레임입니다.
+    감지 단계는 낙상 전후 장면에 쓸 프레임만 골라서 (대부분 축소하여) copy()로 복사합니다.
+    """
+    def __init__(self, gstbuffer, width, height, stride):
+        self.gstbuffer = gstbuffer
+        self.width = width
+        self.height = height
+        self.stride = stride
+
+    @property
+    def shape(self):
+        return (self.height, self.width, 3)
+
+    def copy(self, step=1, out=None):
+        """
+        버퍼를 잠깐 매핑하여 패딩이 제거된 RGB 프레임 복사본(numpy 배열)을 반환합니다.
+        step > 1이면 가로/세로를 step 간격으로 건너뛰어 축소하고,
+        out이 주어지면 새 배열을 만들지 않고 out에 복사합니다. (모양이 다르면 None)
+        """
+        result, mapinfo = self.gstbuffer.map(Gst.MapFlags.READ)
+        if not result:
+            return None
+        try:
+            view = frame_view(mapinfo.data, self.width, self.height, self.stride)[::step, ::step]
+            if out is None:
+                return view.copy()
+            if out.shape != view.shape:
+                return None
+            np.copyto(out, view)
+            return out
+        finally:
+            self.gstbuffer.unmap(mapinfo)
+
+class FrameItem:
+    """
+    파이프라인 단계 사이를 이동하는 프레임 하나의 상태입니다.
+    captured_at은 appsink에서 받은 시각(time.monotonic()), timestamp는 낙상 판단에 쓰는 프레임 시각(초)입니다.
+    input_buffer는 stride 패딩 때문에 입력을 복사해 둔 재사용 버퍼이며, release()에서 버퍼 풀로 돌아갑니다.
+    """
+    __slots__ = ('gstbuffer', 'captured_at', 'timestamp', 'mapinfo', 'input_tensor', 'input_buffer',
+                 'frame', 'output')
+
+    def __init__(self, gstbuffer, captured_at, timestamp=None):
+        self.gstbuffer = gstbuffer
+        self.captured_at = captured_at
+        self.timestamp = captured_at if timestamp is None else timestamp
+        self.mapinfo = None
+        self.input_tensor = None
+        self.input_buffer = None
+        self.frame = None
+        self.output = None
+
 class GstPipeline:
-    def __init__(self, pipeline, inf_callback, render_callback, src_size):
+    """
+    캡처 -> 전처리 -> 추론(invoke) -> 파싱 -> 감지 -> 렌더링 단계를 각각의 스레드로 실행하는 파이프라인입니다.
+    단계 사이는 크기가 제한된 RingBuffer로 연결되어 있으며, 버퍼마다 정해진 정책으로 프레임을 버립니다.
+      - 캡처/전처리 결과: 가장 오래된 프레임을 버림 (항상 최신 프레임을 추론)
+      - 추론/파싱 결과:   버리지 않고 대기 (감지 기록이 끊기지 않도록)
+      - 감지 결과:        가장 오래된 프레임을 버림 (화면 갱신은 건너뛰어도 됨)
+    parse_callback/detect_callback이 없으면 해당 단계는 결과를 그대로 넘기고,
+    render_callback이 없으면 (헤드리스) 렌더링 단계를 만들지 않습니다.
+    motion_gate(MotionGate)가 있으면 움직임이 없는 프레임은 전처리 단계에서 버리고 추론하지 않습니다.
+    추론 해상도는 set_inference_size()로 파이프라인을 멈추지 않고 바꿀 수 있습니다. (AdaptiveController)
+    """
+    def __init__(self, pipeline, inf_callback, render_callback, src_size,
+                 camera_id=0, scheduler=None, on_finished=None,
+                 parse_callback=None, detect_callback=None, motion_gate=None):
         self.inf_callback = inf_callback
+        self.parse_callback = parse_callback
+        self.detect_callback = detect_callback
         self.render_callback = render_callback
+        self.camera_id = camera_id
+        self.motion_gate = motion_gate
+        # scheduler가 지정되면 전처리/추론은 공유 스케줄러 스레드가 수행합니다.
+        self.scheduler = scheduler
+        # EOS/오류로 이 파이프라인이 끝났을 때 호출됩니다. (기본값: 전체 종료)
+        self.on_finished = on_finished or Gtk.main_quit
         self.running = False
-        self.gstbuffer = None
-        self.output = None  # 이제 (model_output, frame) 튜플을 저장
         self.sink_size = None
         self.src_size = src_size
         self.box = None
-        self.condition = threading.Condition()
+        # 마지막 PTS와 받은 시각(monotonic)의 차이. PTS가 없는 버퍼의 시각을 같은 시계로 맞출 때 씁니다.
+        self.pts_offset = 0.0
+        self.box_size = None
+        # raster 모드에서 화면(displaysrc)에 보내는 프레임의 크기
+        self.display_size = None
+        # stride 패딩이 있을 때만 사용하는 재사용 입력 버퍼 풀 (사용 중이 아닌 버퍼 목록)
+        # 버퍼는 그 프레임의 추론이 끝나거나 프레임이 버려질 때(release) 돌아오므로,
+        # 큐에서 기다리거나 추론 중인 프레임의 입력을 덮어쓰지 않습니다.
+        self.free_input_buffers = []
+        self.input_buffers_lock = threading.Lock()
+        # 프레임 전달 경로에서 복사된 바이트 수 (직전 프레임 / 누적)
+        self.frame_bytes_copied = 0
+        self.total_bytes_copied = 0
+        self.frames_processed = 0
+        # 카메라에서 받은 프레임 수 (움직임 게이트나 큐에서 버린 프레임 포함). 카메라가 멈췄는지 확인할 때 씁니다.
+        self.frames_received = 0
+        # 캡처부터 렌더링까지의 전체 지연 시간과, 캡처부터 추론 시작까지 기다린 시간
+        self.latency = StageStats()
+        self.inference_wait = StageStats()
+
+        # 단계 사이의 링 버퍼
+        self.captured = RingBuffer(1, DROP_OLDEST)
+        self.preprocessed = RingBuffer(1, DROP_OLDEST, on_drop=self.release)
+        self.invoked = RingBuffer(2, BLOCK)
+        self.parsed = RingBuffer(2, BLOCK)
+        self.detected = RingBuffer(1, DROP_OLDEST)
+        self.stages = [
+            Stage('preprocess', self.preprocess, self.captured, self.preprocessed,
+                  on_error=self.release),
+            Stage('invoke', self.invoke, self.preprocessed, self.invoked,
+                  on_error=self.release),
+            Stage('parse', self.parse, self.invoked, self.parsed),
+            Stage('detect', self.detect, self.parsed,
+                  self.detected if render_callback else None),
+        ]
+        if render_callback:
+            self.stages.append(Stage('render', self.render, self.detected))
+        self.stage = {stage.name: stage for stage in self.stages}
 
         self.pipeline = Gst.parse_launch(pipeline)
         self.freezer = self.pipeline.get_by_name('freezer')
         self.overlay = self.pipeline.get_by_name('overlay')
+        self.displaysrc = self.pipeline.get_by_name('displaysrc')
+        self.scalecaps = self.pipeline.get_by_name('scalecaps')
+        self.sinkcaps = self.pipeline.get_by_name('sinkcaps')
         self.overlaysink = self.pipeline.get_by_name('overlaysink')
         appsink = self.pipeline.get_by_name('appsink')
         appsink.connect('new-sample', self.on_new_sample)
@@ -41,16 +164,25 @@ class GstPipeline:
         self.setup_window()
 
     def run(self):
+        self.start()
+        try:
+            Gtk.main()
+        except:
+            pass
+        self.stop()
+
+    def start(self):
+        """단계별 워커 스레드를 시작하고 파이프라인을 재생 상태로 만듭니다."""
         self.running = True
-        inf_worker = threading.Thread(target=self.inference_loop)
-        inf_worker.start()
-        render_worker = threading.Thread(target=self.render_loop)
-        render_worker.start()
+        for stage in self.stages:
+            # 스케줄러 모드에서는 전처리/추론 단계를 스케줄러가 직접 호출합니다.
+            if self.scheduler and stage.name in ('preprocess', 'invoke'):
+                continue
+            stage.start()
 
         self.pipeline.set_state(Gst.State.PLAYING)
         self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
-        
-        # ... (run 함수의 나머지 부분은 원본과 동일) ...
+
         if self.overlaysink:
             sinkelement = self.overlaysink.get_by_interface(GstVideo.VideoOverlay)
         else:
@@ -59,46 +191,74 @@ class GstPipeline:
             sinkelement.set_property('sync', False)
             sinkelement.set_property('qos', False)
 
-        try:
-            Gtk.main()
-        except:
-            pass
-
+    def stop(self):
+        """파이프라인을 정지하고 워커 스레드가 끝날 때까지 기다립니다."""
         self.pipeline.set_state(Gst.State.NULL)
         while GLib.MainContext.default().iteration(False):
             pass
-        with self.condition:
-            self.running = False
-            self.condition.notify_all()
-        inf_worker.join()
-        render_worker.join()
+        self.running = False
+        for stage in self.stages:
+            stage.inbox.close()
+        for stage in self.stages:
+            stage.join()
+
+    def stats(self):
+        """단계별 처리 횟수, 평균/최대 지연 시간(ms), 큐 깊이, 버린 프레임 수를 반환합니다."""
+        stats = {stage.name: stage.snapshot() for stage in self.stages}
+        stats['end_to_end'] = {'count': self.latency.count, 'avg_ms': self.latency.avg_ms,
+                               'max_ms': 1000 * self.latency.max_time}
+        stats['capture_to_inference'] = {'count': self.inference_wait.count,
+                                         'avg_ms': self.inference_wait.avg_ms,
+                                         'max_ms': 1000 * self.inference_wait.max_time}
+        if self.motion_gate:
+            stats['motion'] = self.motion_gate.snapshot()
+        return stats
 
     def on_bus_message(self, bus, message):
         t = message.type
         if t == Gst.MessageType.EOS:
-            Gtk.main_quit()
+            self.on_finished()
         elif t == Gst.MessageType.WARNING:
             err, debug = message.parse_warning()
             sys.stderr.write('Warning: %s: %s\n' % (err, debug))
         elif t == Gst.MessageType.ERROR:
             err, debug = message.parse_error()
             sys.stderr.write('Error: %s: %s\n' % (err, debug))
-            Gtk.main_quit()
+            self.on_finished()
         return True
 
+    def set_inference_size(self, inference_size):
+        """
+        appsink로 나오는 프레임의 크기(추론 해상도)를 바꿉니다. 어느 스레드에서 호출해도 됩니다.
+        파이프라인은 멈추지 않고 다시 협상(renegotiation)하며, 새 크기의 첫 프레임부터 추론 영역을 다시 계산합니다.
+        """
+        scale_caps, sink_caps = inference_caps(self.src_size, inference_size)
+        self.scalecaps.set_property('caps', Gst.Caps.from_string(scale_caps))
+        self.sinkcaps.set_property('caps', Gst.Caps.from_string(sink_caps))
+
     def on_new_sample(self, sink):
         sample = sink.emit('pull-sample')
-        if not self.sink_size:
-            s = sample.get_caps().get_structure(0)
-            self.sink_size = (s.get_value('width'), s.get_value('height'))
-        with self.condition:
-            self.gstbuffer = sample.get_buffer()
-            self.condition.notify_all()
+        # 추론 해상도가 바뀔 수 있으므로 프레임마다 크기를 확인합니다.
+        s = sample.get_caps().get_structure(0)
+        self.sink_size = (s.get_value('width'), s.get_value('height'))
+        item = FrameItem(sample.get_buffer(), time.monotonic())
+        self.frames_received += 1
+        # 프레임 시각은 버퍼의 PTS(캡처 시각)를 씁니다. 큐에서 기다린 시간이나 처리 지연의 영향을 받지 않고,
+        # 비디오 파일은 재생 속도와 관계없이 영상 속 시간으로 판단합니다.
+        # PTS가 없는 버퍼는 받은 시각을 마지막 PTS의 시계로 옮겨서 씁니다.
+        pts = item.gstbuffer.pts
+        if pts != Gst.CLOCK_TIME_NONE:
+            self.pts_offset = pts / Gst.SECOND - item.captured_at
+        item.timestamp = item.captured_at + self.pts_offset
+        if self.scheduler:
+            self.scheduler.submit(self, item)
+        else:
+            self.captured.put(item)
         return Gst.FlowReturn.OK
 
     def get_box(self):
         # ... (get_box 함수는 원본과 동일) ...
-        if not self.box:
+        if self.box_size != self.sink_size:
             glbox = self.pipeline.get_by_name('glbox')
             if glbox:
                 glbox = glbox.get_by_name('filter')
@@ -112,68 +272,120 @@ class GstPipeline:
                 self.box = (-box.get_property('left'), -box.get_property('top'),
                     self.sink_size[0] + box.get_property('left') + box.get_property('right'),
                     self.sink_size[1] + box.get_property('top') + box.get_property('bottom'))
+            self.box_size = self.sink_size
         return self.box
 
-# gstreamer.py 파일 안에 있는 inference_loop 함수만 아래 코드로 교체하세요.
+    def unmap(self, item):
+        if item.mapinfo is not None:
+            item.gstbuffer.unmap(item.mapinfo)
+            item.mapinfo = None
 
-    def inference_loop(self):
-        while True:
-            with self.condition:
-                while not self.gstbuffer and self.running:
-                    self.condition.wait()
-                if not self.running:
-                    break
-                gstbuffer = self.gstbuffer
-                self.gstbuffer = None
-
-            # --- [수정된 코드 시작] ---
-            # 스트라이드를 고려하여 프레임 데이터를 올바르게 추출
-            meta = GstVideo.buffer_get_video_meta(gstbuffer)
-            if not meta: continue
-            
-            result, mapinfo = gstbuffer.map(Gst.MapFlags.READ)
-            if not result: continue
-
-            height, width = meta.height, meta.width
-            stride = meta.stride[0] # 실제 메모리의 한 줄 길이 (패딩 포함)
-            
-            # 전체 버퍼를 (높이 x 스트라이드) 2D 배열로 먼저 변환
-            buffer_view = np.frombuffer(mapinfo.data, dtype=np.uint8).reshape((height, stride))
-            
-            # 각 줄에서 패딩을 제외한 실제 이미지 너비만큼만 잘라내어 새로운 배열 생성
-            # 이 과정에서 메모리가 복사되며 패딩이 제거됨
-            frame = buffer_view[:, :width * 3].reshape((height, width, 3))
-            
-            gstbuffer.unmap(mapinfo)
-            # --- [수정된 코드 끝] ---
-
-            # 추론 콜백 호출 (복사본 전달)
-            output = self.inf_callback(frame.copy())
-            
-            with self.condition:
-                # 렌더링 스레드에 추론 결과와 함께 방금 사용한 프레임을 같이 넘겨줌
-                self.output = (output, frame) 
-                self.condition.notify_all()
+    def release(self, item):
+        """프레임 버퍼의 매핑을 해제하고 입력 버퍼를 풀에 돌려줍니다. 여러 번 호출해도 안전합니다."""
+        self.unmap(item)
+        item.input_tensor = None
+        if item.input_buffer is not None:
+            with self.input_buffers_lock:
+                self.free_input_buffers.append(item.input_buffer)
+            item.input_buffer = None
 
-    def render_loop(self):
-        while True:
-            with self.condition:
-                while not self.output and self.running:
-                    self.condition.wait()
-                if not self.running:
-                    break
-                # 추론 결과와 프레임을 한 번에 받음
-                output, frame = self.output
-                self.output = None
+    def take_input_buffer(self, shape):
+        """사용 중이 아닌 입력 버퍼를 꺼냅니다. 없거나 크기가 다르면 새로 만듭니다."""
+        with self.input_buffers_lock:
+            while self.free_input_buffers:
+                buffer = self.free_input_buffers.pop()
+                if buffer.shape == shape:
+                    return buffer
+                # 추론 해상도가 바뀌기 전의 버퍼는 버립니다.
+        return np.empty(shape, dtype=np.uint8)
 
-            # 렌더링 콜백 호출
-            svg, freeze = self.render_callback(output, self.src_size, self.get_box(), frame)
-            
+    def preprocess(self, item):
+        """버퍼를 매핑하고 추론 입력 텐서를 준비합니다."""
+        meta = GstVideo.buffer_get_video_meta(item.gstbuffer)
+        if not meta: return None
+
+        result, mapinfo = item.gstbuffer.map(Gst.MapFlags.READ)
+        if not result: return None
+        item.mapinfo = mapinfo
+
+        height, width = meta.height, meta.width
+        stride = meta.stride[0] # 실제 메모리의 한 줄 길이 (패딩 포함)
+        frame = frame_view(mapinfo.data, width, height, stride)
+        if self.motion_gate and not self.motion_gate.should_infer(frame, item.captured_at):
+            # 움직임이 없는 장면이면 추론하지 않고 프레임을 버립니다.
+            self.release(item)
+            return None
+        if stride == width * 3:
+            # 패딩이 없으면 매핑된 메모리를 그대로 인터프리터 입력으로 넘깁니다 (복사 없음).
+            # 매핑은 추론 단계가 끝날 때 해제됩니다.
+            item.input_tensor = frame
+            self.frame_bytes_copied = 0
+        else:
+            # 패딩이 있으면 재사용 버퍼에 한 번만 복사하고 매핑은 바로 해제합니다.
+            item.input_buffer = self.take_input_buffer(frame.shape)
+            np.copyto(item.input_buffer, frame)
+            self.unmap(item)
+            item.input_tensor = item.input_buffer
+            self.frame_bytes_copied = item.input_tensor.nbytes
+
+        self.total_bytes_copied += self.frame_bytes_copied
+        self.frames_processed += 1
+        # 이후 단계에는 픽셀 대신 버퍼 참조를 넘기고, 필요할 때만 매핑하도록 합니다.
+        item.frame = BufferFrame(item.gstbuffer, width, height, stride)
+        return item
+
+    def invoke(self, item):
+        """
+        추론 콜백 inf_callback(input_tensor, timestamp)을 실행합니다. timestamp는 프레임 시각(초)이며,
+        input_tensor는 콜백이 반환되기 전까지만 유효합니다.
+        """
+        self.inference_wait.record(time.monotonic() - item.captured_at)
+        try:
+            item.output = self.inf_callback(item.input_tensor, item.timestamp)
+        finally:
+            self.release(item)
+        return item
+
+    def parse(self, item):
+        if self.parse_callback:
+            item.output = self.parse_callback(item.output)
+        return item
+
+    def detect(self, item):
+        if (item.frame.width, item.frame.height) != self.sink_size:
+            # 추론 해상도를 바꾸기 전의 프레임은 추론 영역(box)이 달라 좌표를 잘못 환산하므로 버립니다.
+            return None
+        if self.detect_callback:
+            item.output = self.detect_callback(item.output, self.src_size, self.get_box(), item.frame,
+                                               item.timestamp)
+        if not self.render_callback:
+            # 헤드리스 모드에서는 감지 단계가 마지막 단계입니다.
+            self.latency.record(time.monotonic() - item.captured_at)
+        return item
+
+    def render(self, item):
+        """
+        렌더링 콜백의 결과를 화면에 반영합니다.
+        결과는 SVG 문자열(svg 모드), RGB 프레임(raster 모드)이며, None이면 변경 없음으로 보고 건너뜁니다.
+        """
+        overlay, freeze = self.render_callback(item.output, self.src_size, self.get_box(), item.frame)
+
+        if self.freezer:
             self.freezer.frozen = freeze
-            if self.overlaysink:
-                self.overlaysink.set_property('svg', svg)
+        if overlay is not None:
+            if self.displaysrc:
+                size = (item.frame.width, item.frame.height)
+                if size != self.display_size:
+                    # 추론 해상도가 바뀌면 화면에 보내는 프레임의 caps도 함께 바꿉니다.
+                    self.displaysrc.set_property('caps', Gst.Caps.from_string(
+                        SINK_CAPS.format(width=size[0], height=size[1]) + ',framerate=0/1'))
+                    self.display_size = size
+                self.displaysrc.emit('push-buffer', Gst.Buffer.new_wrapped(overlay.tobytes()))
+            elif self.overlaysink:
+                self.overlaysink.set_property('svg', overlay)
             elif self.overlay:
-                self.overlay.set_property('data', svg)
+                self.overlay.set_property('data', overlay)
+        self.latency.record(time.monotonic() - item.captured_at)
 
     # setup_window 함수 및 나머지 코드는 원본과 동일하게 유지
     def setup_window(self):
@@ -216,8 +428,107 @@ class GstPipeline:
         bus = self.pipeline.get_bus()
         bus.set_sync_handler(on_bus_message_sync, self.overlaysink)
 
-# 나머지 코드 (run_pipeline, Freezer 클래스 등)는 원본과 동일하게 유지
-# ... (이하 모든 코드는 제공해주신 원본 gstreamer.py와 동일합니다) ...
+class InferenceScheduler:
+    """
+    여러 카메라 파이프라인의 프레임을 하나의 추론 스레드로 모아 하나의 PoseEngine(TPU)을 공유합니다.
+    카메라마다 가장 최근 버퍼 하나만 보관하며, 오래된 프레임은 새 프레임으로 덮어씁니다.
+
+    policy:
+      'round-robin' - 프레임이 준비된 카메라를 순서대로 돌아가며 처리합니다.
+      'motion'      - 최근 움직임이 큰 카메라를 우선 처리하되,
+                      max_wait 초 이상 밀린 카메라는 먼저 처리합니다.
+    """
+    MOTION_STEP = 16  # 움직임 점수 계산 시 가로/세로 샘플링 간격 (픽셀)
+
+    def __init__(self, policy='round-robin', max_wait=0.5):
+        if policy not in ('round-robin', 'motion'):
+            raise ValueError('Unknown schedule policy: %s' % policy)
+        self.policy = policy
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self.running = False
+        self.pipelines = []
+        self.pending = {}      # pipeline -> 처리 대기 중인 최신 FrameItem
+        self.dropped = {}      # pipeline -> 처리하기 전에 새 프레임으로 덮어쓴 프레임 수
+        self.last_served = {}  # pipeline -> 마지막 처리 시각
+        self.motion = {}       # pipeline -> 최근 움직임 점수 (지수 이동 평균)
+        self.prev_thumb = {}   # pipeline -> 직전 축소 프레임
+        self.next_index = 0
+        self.worker = None
+
+    def register(self, pipeline):
+        self.pipelines.append(pipeline)
+        self.last_served[pipeline] = time.monotonic()
+        self.motion[pipeline] = 0.0
+        self.dropped[pipeline] = 0
+
+    def submit(self, pipeline, item):
+        with self.condition:
+            if pipeline in self.pending:
+                self.dropped[pipeline] += 1
+            self.pending[pipeline] = item
+            self.condition.notify_all()
+
+    def start(self):
+        self.running = True
+        self.worker = threading.Thread(target=self.inference_loop)
+        self.worker.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.worker:
+            self.worker.join()
+
+    def pick(self):
+        """다음에 처리할 파이프라인을 고릅니다. condition 잠금을 잡은 상태에서 호출해야 합니다."""
+        if self.policy == 'motion':
+            now = time.monotonic()
+            ready = [p for p in self.pipelines if p in self.pending]
+            starving = [p for p in ready if now - self.last_served[p] > self.max_wait]
+            if starving:
+                return min(starving, key=lambda p: self.last_served[p])
+            return max(ready, key=lambda p: self.motion[p])
+
+        count = len(self.pipelines)
+        for k in range(count):
+            pipeline = self.pipelines[(self.next_index + k) % count]
+            if pipeline in self.pending:
+                self.next_index = (self.next_index + k + 1) % count
+                return pipeline
+
+    def update_motion(self, pipeline, frame):
+        """축소 샘플링한 프레임 차이로 카메라의 움직임 점수를 갱신합니다."""
+        thumb = frame[::self.MOTION_STEP, ::self.MOTION_STEP, 1].astype(np.int16)
+        prev = self.prev_thumb.get(pipeline)
+        if prev is not None and prev.shape == thumb.shape:
+            score = float(np.abs(thumb - prev).mean())
+            self.motion[pipeline] = 0.5 * self.motion[pipeline] + 0.5 * score
+        self.prev_thumb[pipeline] = thumb
+
+    def inference_loop(self):
+        while True:
+            with self.condition:
+                while not self.pending and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    break
+                pipeline = self.pick()
+                item = self.pending.pop(pipeline)
+                self.last_served[pipeline] = time.monotonic()
+
+            # 선택한 카메라의 전처리/추론 단계를 이 스레드에서 실행하고,
+            # 결과는 그 카메라의 파싱 단계로 넘깁니다.
+            item = pipeline.stage['preprocess'].process(item)
+            if item is None:
+                continue
+            if self.policy == 'motion':
+                self.update_motion(pipeline, item.input_tensor)
+            item = pipeline.stage['invoke'].process(item)
+            if item is not None:
+                pipeline.invoked.put(item)
+
 def on_bus_message(bus, message, loop):
     t = message.type
     if t == Gst.MessageType.EOS:
@@ -286,41 +597,178 @@ Gst.Plugin.register_static(
     'http://gstreamer.net/'             # origin
 )
 
-def run_pipeline(inf_callback, render_callback, src_size,
-                 inference_size,
-                 mirror=False,
-                 h264=False,
-                 jpeg=False,
-                 videosrc='/dev/video0'):
+SINK_CAPS = 'video/x-raw,format=RGB,width={width},height={height}'
+
+def inference_caps(src_size, inference_size):
+    """
+    원본 영상을 비율을 유지한 채 추론 해상도에 맞게 줄이는 caps와, appsink로 나오는 프레임의 caps를 반환합니다.
+    (남는 부분은 videobox가 채웁니다.)
+    """
+    scale = min(inference_size[0] / src_size[0],
+                inference_size[1] / src_size[1])
+    scale = tuple(int(x * scale) for x in src_size)
+    scale_caps = 'video/x-raw,width={width},height={height}'.format(
+        width=scale[0], height=scale[1])
+    sink_caps = SINK_CAPS.format(width=inference_size[0], height=inference_size[1])
+    return scale_caps, sink_caps
+
+def make_pipeline(src_size, inference_size, mirror=False, h264=False, jpeg=False,
+                  videosrc='/dev/video0', overlay='svg'):
+    """비디오 소스 하나에 대한 GStreamer 파이프라인 문자열을 만듭니다.
+    videosrc가 /dev/ 장치가 아니면 비디오 파일로 간주합니다.
+
+    overlay:
+      'svg'    - 원본 영상 위에 rsvgoverlay로 SVG 오버레이를 그립니다.
+      'raster' - 렌더링 단계가 직접 그린 추론 해상도 RGB 프레임을 appsrc로 화면에 표시합니다.
+      'none'   - 화면 출력 없이 추론만 합니다. (무인/헤드리스 운영)
+    """
     if h264:
         SRC_CAPS = 'video/x-h264,width={width},height={height},framerate=30/1'
     elif jpeg:
         SRC_CAPS = 'image/jpeg,width={width},height={height},framerate=30/1'
     else:
         SRC_CAPS = 'video/x-raw,width={width},height={height},framerate=30/1'
-    PIPELINE = 'v4l2src device=%s ! {src_caps}' % videosrc
+    if videosrc.startswith('/dev/'):
+        PIPELINE = 'v4l2src device=%s ! {src_caps}' % videosrc
+    else:
+        PIPELINE = 'filesrc location=%s' % videosrc
 
-    scale = min(inference_size[0] / src_size[0],
-                inference_size[1] / src_size[1])
-    scale = tuple(int(x * scale) for x in src_size)
-    scale_caps = 'video/x-raw,width={width},height={height}'.format(
-        width=scale[0], height=scale[1])
-    PIPELINE += """ ! decodebin ! videoflip video-direction={direction} ! tee name=t
+    scale_caps, sink_caps = inference_caps(src_size, inference_size)
+    if overlay == 'svg':
+        PIPELINE += """ ! decodebin ! videoflip video-direction={direction} ! tee name=t
             t. ! {leaky_q} ! videoconvert ! freezer name=freezer ! rsvgoverlay name=overlay
                ! videoconvert ! autovideosink
-            t. ! {leaky_q} ! videoconvert ! videoscale ! {scale_caps} ! videobox name=box autocrop=true
-               ! {sink_caps} ! {sink_element}
+            t. ! {leaky_q} ! videoconvert ! videoscale ! {scale_filter} ! videobox name=box autocrop=true
+               ! {sink_filter} ! {sink_element}
+        """
+    else:
+        PIPELINE += """ ! decodebin ! videoflip video-direction={direction}
+            ! {leaky_q} ! videoconvert ! videoscale ! {scale_filter} ! videobox name=box autocrop=true
+               ! {sink_filter} ! {sink_element}
+        """
+    if overlay == 'raster':
+        PIPELINE += """ appsrc name=displaysrc is-live=true do-timestamp=true format=time
+               caps={sink_caps},framerate=0/1 ! {leaky_q} ! videoconvert ! autovideosink
         """
 
     SINK_ELEMENT = 'appsink name=appsink emit-signals=true max-buffers=1 drop=true'
-    SINK_CAPS = 'video/x-raw,format=RGB,width={width},height={height}'
+    # 추론 해상도를 실행 중에 바꿀 수 있도록 caps를 이름 있는 capsfilter로 둡니다.
+    SCALE_FILTER = 'capsfilter name=scalecaps caps="{caps}"'
+    SINK_FILTER = 'capsfilter name=sinkcaps caps="{caps}"'
     LEAKY_Q = 'queue max-size-buffers=1 leaky=downstream'
     direction = 'horiz' if mirror else 'identity'
 
     src_caps = SRC_CAPS.format(width=src_size[0], height=src_size[1])
-    sink_caps = SINK_CAPS.format(width=inference_size[0], height=inference_size[1])
-    pipeline = PIPELINE.format(src_caps=src_caps, sink_caps=sink_caps,
-        sink_element=SINK_ELEMENT, direction=direction, leaky_q=LEAKY_Q, scale_caps=scale_caps)
+    return PIPELINE.format(src_caps=src_caps, sink_caps=sink_caps,
+        sink_element=SINK_ELEMENT, direction=direction, leaky_q=LEAKY_Q,
+        scale_filter=SCALE_FILTER.format(caps=scale_caps),
+        sink_filter=SINK_FILTER.format(caps=sink_caps))
+
+def print_stats(pipeline):
+    """파이프라인의 단계별 지연 시간과 큐 상태를 출력합니다."""
+    for name, stats in pipeline.stats().items():
+        print('[camera %d] %-10s %s' % (pipeline.camera_id, name, ' '.join(
+            '%s=%.1f' % (key, value) if isinstance(value, float) else '%s=%d' % (key, value)
+            for key, value in stats.items())))
+
+def run_pipeline(inf_callback, render_callback, src_size,
+                 inference_size,
+                 mirror=False,
+                 h264=False,
+                 jpeg=False,
+                 videosrc='/dev/video0',
+                 parse_callback=None,
+                 detect_callback=None,
+                 overlay='svg',
+                 idle_fps=None,
+                 controller=None,
+                 metrics=None):
+    """
+    비디오 소스 하나를 실행합니다.
+    idle_fps가 지정되면 움직임이 없을 때 초당 idle_fps 프레임만 추론합니다. (MotionGate)
+    controller(AdaptiveController)가 지정되면 실행 중에 추론 해상도를 바꿉니다.
+    metrics(Metrics)가 지정되면 파이프라인의 단계별 통계를 내보냅니다.
+    """
+    pipeline = make_pipeline(src_size, inference_size, mirror=mirror, h264=h264,
+                             jpeg=jpeg, videosrc=videosrc, overlay=overlay)
     print('Gstreamer pipeline: ', pipeline)
-    pipeline = GstPipeline(pipeline, inf_callback, render_callback, src_size)
+    pipeline = GstPipeline(pipeline, inf_callback, render_callback, src_size,
+                           parse_callback=parse_callback, detect_callback=detect_callback,
+                           motion_gate=MotionGate(idle_fps) if idle_fps is not None else None)
+    if controller:
+        controller.attach([pipeline])
+        controller.start()
+    if metrics:
+        metrics.attach([pipeline])
     pipeline.run()
+    if controller:
+        controller.stop()
+    print_stats(pipeline)
+
+def run_pipelines(inf_callback, render_callbacks, src_size,
+                  inference_size,
+                  videosrcs,
+                  schedule='round-robin',
+                  mirror=False,
+                  h264=False,
+                  jpeg=False,
+                  parse_callback=None,
+                  detect_callbacks=None,
+                  overlay='svg',
+                  idle_fps=None,
+                  controller=None,
+                  metrics=None,
+                  on_camera_finished=None):
+    """
+    여러 비디오 소스를 한 프로세스에서 실행합니다.
+    모든 카메라의 프레임은 InferenceScheduler를 거쳐 하나의 inf_callback(하나의 TPU)으로 처리되고,
+    detect_callbacks[i], render_callbacks[i]는 i번째 카메라(camera_id=i)의 감지와 렌더링을 담당합니다.
+    idle_fps가 지정되면 카메라마다 움직임이 없을 때 초당 idle_fps 프레임만 추론합니다.
+    controller가 지정되면 모든 카메라의 추론 해상도를 함께 바꿉니다. (하나의 TPU를 공유하므로)
+    metrics가 지정되면 모든 카메라와 스케줄러의 통계를 내보냅니다.
+    on_camera_finished(camera_id)는 카메라 하나가 EOS/오류로 끝났을 때 (나머지 카메라는 계속 실행 중) 호출됩니다.
+    """
+    detect_callbacks = detect_callbacks or [None] * len(videosrcs)
+    scheduler = InferenceScheduler(policy=schedule)
+    finished = set()
+
+    def on_finished(camera_id):
+        # 모든 카메라가 끝났을 때만 전체를 종료합니다.
+        finished.add(camera_id)
+        if on_camera_finished:
+            on_camera_finished(camera_id)
+        if len(finished) == len(videosrcs):
+            Gtk.main_quit()
+
+    pipelines = []
+    for camera_id, (videosrc, detect_callback, render_callback) in enumerate(
+            zip(videosrcs, detect_callbacks, render_callbacks)):
+        pipeline = make_pipeline(src_size, inference_size, mirror=mirror, h264=h264,
+                                 jpeg=jpeg, videosrc=videosrc, overlay=overlay)
+        print('Gstreamer pipeline (camera %d): ' % camera_id, pipeline)
+        pipeline = GstPipeline(pipeline, inf_callback, render_callback, src_size,
+                               camera_id=camera_id, scheduler=scheduler,
+                               on_finished=lambda camera_id=camera_id: on_finished(camera_id),
+                               parse_callback=parse_callback, detect_callback=detect_callback,
+                               motion_gate=MotionGate(idle_fps) if idle_fps is not None else None)
+        scheduler.register(pipeline)
+        pipelines.append(pipeline)
+
+    scheduler.start()
+    for pipeline in pipelines:
+        pipeline.start()
+    if controller:
+        controller.attach(pipelines)
+        controller.start()
+    if metrics:
+        metrics.attach(pipelines, scheduler)
+    try:
+        Gtk.main()
+    except:
+        pass
+    if controller:
+        controller.stop()
+    scheduler.stop()
+    for pipeline in pipelines:
+        pipeline.stop()
+        print_stats(pipeline)
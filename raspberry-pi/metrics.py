@@ -0,0 +1,306 @@
+"""
+기기 상태 지표(metrics)를 모아 로컬 HTTP 엔드포인트(Prometheus 텍스트 형식)와 서버 하트비트로 내보냅니다.
+
+지표는 각 단계가 이미 기록하고 있는 통계(stages.StageStats, RingBuffer.dropped 등)를 읽기만 하므로
+영상 처리 경로에는 잠금이나 추가 작업이 생기지 않습니다.
+  - 지연 시간 히스토그램: 캡처→추론 시작, 추론(invoke), 출력 해석(parse), 낙상 감지(detect),
+    오버레이(render), 캡처→처리 완료(end_to_end), 서버 업로드
+  - 큐(링 버퍼)별 깊이와 버린 프레임 수, 단계별 오류 수, 움직임 게이트가 건너뛴 추론 수
+  - CPU/TPU 온도, 전송 대기 중인 이미지 수
+"""
+import glob
+import json
+import math
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# /metrics를 제공하는 기본 포트와 주소입니다. (포트가 0이면 끕니다)
+# 인증이 없고 기기와 모델 정보가 드러나므로 기본값은 기기 안에서만 접근할 수 있는 주소입니다.
+METRICS_PORT = 9108
+METRICS_HOST = '127.0.0.1'
+# 서버로 하트비트를 보내는 간격(초)입니다.
+HEARTBEAT_INTERVAL = 10.0
+# 온도 센서 파일(밀리도 단위). PCIe/M.2 Coral만 apex 드라이버가 온도를 제공하며, USB Accelerator는 센서가 없습니다.
+TPU_TEMP_GLOB = '/sys/class/apex/apex_*/temp'
+CPU_TEMP_PATH = '/sys/class/thermal/thermal_zone0/temp'
+PREFIX = 'fall_detector'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def read_temperature(path):
+    """센서 파일의 온도를 섭씨로 반환합니다. 읽을 수 없으면 None을 반환합니다."""
+    try:
+        with open(path) as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+def temperatures():
+    """{센서 이름: 섭씨 온도}를 반환합니다. 없는 센서는 빠집니다."""
+    readings = {'cpu': read_temperature(CPU_TEMP_PATH)}
+    for index, path in enumerate(sorted(glob.glob(TPU_TEMP_GLOB))):
+        readings['tpu%d' % index] = read_temperature(path)
+    return {name: value for name, value in readings.items() if value is not None}
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{%s}' % ','.join('%s="%s"' % (key, value) for key, value in zip(labels, escaped))
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    파이프라인, 스케줄러, Outbox, 추론 엔진의 통계를 모아 두는 곳입니다.
+    파이프라인은 gstreamer.run_pipeline(s)가 시작할 때 attach()로 등록합니다.
+    """
+    def __init__(self, engine=None, outbox=None, device_id=None):
+        self.engine = engine
+        self.outbox = outbox
+        self.device_id = device_id or (outbox.device_id if outbox else socket.gethostname())
+        self.started = time.monotonic()
+        self.pipelines = []
+        self.scheduler = None
+        # 하트비트의 fps 계산용: 카메라 -> (처리 완료 프레임 수, 받은 프레임 수, 시각)
+        self.previous = {}
+        self.lock = threading.Lock()
+
+    def attach(self, pipelines, scheduler=None):
+        with self.lock:
+            self.pipelines = list(pipelines)
+            self.scheduler = scheduler
+
+    @property
+    def model(self):
+        """현재 추론 해상도('WxH')입니다. --adaptive면 실행 중에 바뀝니다."""
+        if self.engine is None:
+            return None
+        shape = self.engine.get_input_tensor_shape()
+        return '%dx%d' % (shape[2], shape[1])
+
+    def dropped(self, pipeline):
+        """{큐 이름: 버린 프레임 수}. 큐 이름은 그 큐에서 항목을 꺼내는 단계 이름입니다."""
+        dropped = {stage.name: stage.inbox.dropped for stage in pipeline.stages}
+        if self.scheduler is not None:
+            dropped['scheduler'] = self.scheduler.dropped.get(pipeline, 0)
+        return dropped
+
+    def histograms(self):
+        """(지표 이름, 설명, [(레이블, StageStats), ...]) 목록을 반환합니다."""
+        stages, waits, latencies = [], [], []
+        for pipeline in self.pipelines:
+            camera = {'camera': pipeline.camera_id}
+            for stage in pipeline.stages:
+                stages.append((dict(camera, stage=stage.name), stage.stats))
+            waits.append((camera, pipeline.inference_wait))
+            latencies.append((camera, pipeline.latency))
+        histograms = [
+            ('stage_seconds', '파이프라인 단계별 처리 시간', stages),
+            ('capture_to_inference_seconds', '프레임 캡처부터 추론 시작까지의 대기 시간', waits),
+            ('end_to_end_seconds', '프레임 캡처부터 처리 완료까지의 지연 시간', latencies),
+        ]
+        if self.outbox is not None:
+            histograms.append(('upload_seconds', '이미지 묶음 업로드 요청 시간',
+                               [({}, self.outbox.upload_latency)]))
+        return histograms
+
+    def render(self):
+        """모든 지표를 Prometheus 텍스트 형식으로 반환합니다."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            name = '%s_%s' % (PREFIX, name)
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in samples:
+                lines.append('%s%s %s' % (name, format_labels(labels), format_value(value)))
+
+        with self.lock:
+            pipelines = list(self.pipelines)
+            for name, help_text, series in self.histograms():
+                name = '%s_%s' % (PREFIX, name)
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s histogram' % name)
+                for labels, stats in series:
+                    # 다른 스레드가 기록하는 중에 읽으므로, 합계가 맞도록 구간별 횟수를 먼저 복사합니다.
+                    counts = list(stats.bucket_counts)
+                    cumulative = 0
+                    for bound, count in zip(stats.buckets + (math.inf,), counts):
+                        cumulative += count
+                        lines.append('%s_bucket%s %d' % (
+                            name, format_labels(dict(labels, le=format_value(bound))), cumulative))
+                    lines.append('%s_sum%s %r' % (name, format_labels(labels), stats.total_time))
+                    lines.append('%s_count%s %d' % (name, format_labels(labels), cumulative))
+
+            metric('queue_depth', 'gauge', '단계 입력 큐에 쌓인 항목 수',
+                   [({'camera': p.camera_id, 'stage': stage.name}, len(stage.inbox))
+                    for p in pipelines for stage in p.stages])
+            metric('dropped_frames_total', 'counter', '큐가 가득 차서 버린 프레임 수',
+                   [({'camera': p.camera_id, 'queue': queue}, count)
+                    for p in pipelines for queue, count in self.dropped(p).items()])
+            metric('stage_errors_total', 'counter', '단계별 처리 오류 수',
+                   [({'camera': p.camera_id, 'stage': stage.name}, stage.stats.errors)
+                    for p in pipelines for stage in p.stages])
+            metric('motion_skipped_total', 'counter', '움직임이 없어 추론하지 않은 프레임 수',
+                   [({'camera': p.camera_id}, p.motion_gate.frames - p.motion_gate.inferred)
+                    for p in pipelines if p.motion_gate])
+        metric('temperature_celsius', 'gauge', '센서 온도',
+               [({'sensor': name}, value) for name, value in temperatures().items()])
+        if self.outbox is not None:
+            metric('outbox_pending', 'gauge', '서버로 보내지 못하고 보관 중인 이미지 수',
+                   [({}, self.outbox.usage()[0])])
+            metric('outbox_sent_total', 'counter', '서버로 보낸 이미지 수', [({}, self.outbox.sent)])
+            metric('outbox_evicted_total', 'counter', '보관 한도를 넘어 버린 이미지 수',
+                   [({}, self.outbox.evicted)])
+            metric('outbox_rejected_total', 'counter', '서버가 계속 거부하여 버린 이미지 수',
+                   [({}, self.outbox.rejected)])
+            metric('outbox_failures', 'gauge', '연속 전송 실패 횟수', [({}, self.outbox.failures)])
+        if self.engine is not None:
+            metric('info', 'gauge', '기기와 추론 모델 정보',
+                   [({'device': self.device_id, 'backend': self.engine.backend_name,
+                      'model': self.model}, 1)])
+        metric('uptime_seconds', 'gauge', '실행 시간', [({}, time.monotonic() - self.started)])
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """
+        서버 하트비트로 보낼 요약을 dict로 반환합니다.
+        fps(처리 완료)와 capture_fps(카메라 입력)는 직전 snapshot() 호출 이후의 프레임 수로 계산합니다.
+        """
+        now = time.monotonic()
+        cameras = []
+        with self.lock:
+            for pipeline in self.pipelines:
+                frames, received = pipeline.latency.count, pipeline.frames_received
+                last_frames, last_received, last_time = self.previous.get(
+                    pipeline.camera_id, (0, 0, self.started))
+                self.previous[pipeline.camera_id] = (frames, received, now)
+                elapsed = max(now - last_time, 1e-6)
+                cameras.append({
+                    'camera_id': pipeline.camera_id,
+                    'fps': (frames - last_frames) / elapsed,
+                    # 카메라에서 프레임이 들어오는 속도. 움직임이 없어 추론을 건너뛰어도 0이 되지 않습니다.
+                    'capture_fps': (received - last_received) / elapsed,
+                    'frames': frames,
+                    'errors': sum(stage.stats.errors for stage in pipeline.stages),
+                    'dropped': sum(self.dropped(pipeline).values()),
+                    'invoke_ms': pipeline.stage['invoke'].stats.avg_ms,
+                    'latency_ms': pipeline.latency.avg_ms,
+                })
+        status = {
+            'device_id': self.device_id,
+            'uptime': now - self.started,
+            'fps': sum(camera['fps'] for camera in cameras),
+            'errors': sum(camera['errors'] for camera in cameras),
+            'dropped': sum(camera['dropped'] for camera in cameras),
+            'cameras': cameras,
+            'temperatures': temperatures(),
+        }
+        if self.engine is not None:
+            status['backend'] = self.engine.backend_name
+            status['model'] = self.model
+        if self.outbox is not None:
+            status['outbox'] = {'pending': self.outbox.usage()[0], 'sent': self.outbox.sent,
+                                'failures': self.outbox.failures, 'evicted': self.outbox.evicted}
+        return status
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 수집기가 주기적으로 요청하므로 요청마다 로그를 남기지 않습니다.
+        pass
+
+
+class MetricsServer:
+    """GET /metrics 요청에 Metrics.render() 결과를 응답하는 작은 HTTP 서버입니다. (데몬 스레드)"""
+    def __init__(self, metrics, host=METRICS_HOST, port=METRICS_PORT):
+        self.httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.metrics = metrics
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Heartbeat:
+    """
+    interval 초마다 Metrics.snapshot()을 서버(url)로 POST합니다.
+    서버에 닿지 않아도 감지에는 영향이 없으므로, 실패는 연결 상태가 바뀔 때만 한 번 출력합니다.
+    """
+    def __init__(self, metrics, url, interval=HEARTBEAT_INTERVAL, timeout=5):
+        self.metrics = metrics
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.ok = True
+        self.failures = 0
+
+    def beat(self):
+        """하트비트를 한 번 보내고 성공 여부를 반환합니다."""
+        try:
+            response = self.session.post(self.url, data=json.dumps(self.metrics.snapshot()),
+                                         headers={'Content-Type': 'application/json'},
+                                         timeout=self.timeout)
+            ok = 200 <= response.status_code < 300
+            error = '상태 코드 %d' % response.status_code
+        except requests.exceptions.RequestException as e:
+            ok, error = False, e
+        if not ok:
+            self.failures += 1
+            if self.ok:
+                print('하트비트 전송 실패: %s' % error)
+        elif not self.ok:
+            print('하트비트 전송 재개')
+        self.ok = ok
+        return ok
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.beat()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='heartbeat', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(self.timeout)
+        self.session.close()
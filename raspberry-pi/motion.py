@@ -0,0 +1,83 @@
+import time
+
+import numpy as np
+
+# 움직임 판단에 사용할 축소 간격(픽셀)입니다. 640x480 프레임이면 80x60 픽셀만 비교합니다.
+MOTION_STEP = 8
+# 축소 프레임에서 밝기(녹색 채널)가 이 값 이상 바뀐 픽셀을 움직인 픽셀로 봅니다. (센서 노이즈 무시)
+PIXEL_THRESHOLD = 20
+# 움직인 픽셀의 비율이 이 값을 넘으면 움직임이 있다고 판단합니다.
+MOTION_FRACTION = 0.005
+# 움직임이 멈춘 뒤에도 이 시간(초) 동안은 모든 프레임을 추론합니다.
+MOTION_HOLD_SECONDS = 3.0
+# 움직임이 없을 때의 추론 속도(초당 프레임 수)입니다.
+IDLE_FPS = 1.0
+
+
+class MotionGate:
+    """
+    움직임이 없는 장면에서 추론(TPU)을 건너뛰기 위한 프레임 차이 기반 게이트입니다.
+
+    프레임을 step 간격으로 축소 샘플링한 녹색 채널을 기준 프레임과 비교하여,
+    바뀐 픽셀의 비율이 fraction을 넘으면 움직임으로 판단합니다.
+    움직임이 있거나 멈춘 지 hold 초가 지나지 않았으면 모든 프레임을 추론하고,
+    그렇지 않으면 idle_fps 속도로만 추론합니다. 기준 프레임은 마지막으로 추론한 프레임이므로,
+    천천히 움직여서 프레임마다의 차이가 작아도 변화가 쌓이면 바로 전체 속도로 돌아갑니다.
+    """
+    def __init__(self, idle_fps=IDLE_FPS, step=MOTION_STEP, pixel_threshold=PIXEL_THRESHOLD,
+                 fraction=MOTION_FRACTION, hold=MOTION_HOLD_SECONDS):
+        self.interval = 1.0 / idle_fps if idle_fps > 0 else float('inf')
+        self.step = step
+        self.pixel_threshold = pixel_threshold
+        self.fraction = fraction
+        self.hold = hold
+        self.reference = None
+        self.last_motion = float('-inf')
+        self.last_inference = float('-inf')
+        # 통계: 전체 프레임 수, 추론한 프레임 수, 움직임이 감지된 프레임 수
+        self.frames = 0
+        self.inferred = 0
+        self.motion_frames = 0
+        # 마지막 프레임에서 바뀐 픽셀의 비율
+        self.score = 0.0
+
+    def thumbnail(self, frame):
+        return frame[::self.step, ::self.step, 1].astype(np.int16)
+
+    def should_infer(self, frame, timestamp=None):
+        """
+        프레임(H, W, 3 RGB 배열)을 추론해야 하면 True를 반환합니다.
+        timestamp는 프레임 시각(time.monotonic() 기준 초)입니다.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.frames += 1
+        thumb = self.thumbnail(frame)
+        if self.reference is None or self.reference.shape != thumb.shape:
+            moved = True
+        else:
+            changed = np.count_nonzero(np.abs(thumb - self.reference) > self.pixel_threshold)
+            self.score = changed / thumb.size
+            moved = self.score > self.fraction
+        if moved:
+            self.motion_frames += 1
+            self.last_motion = timestamp
+
+        active = timestamp - self.last_motion <= self.hold
+        if not active and timestamp - self.last_inference < self.interval:
+            return False
+        self.reference = thumb
+        self.last_inference = timestamp
+        self.inferred += 1
+        return True
+
+    def snapshot(self):
+        """추론 비율(duty_pct)과 건너뛴 추론 수를 포함한 통계를 dict로 반환합니다."""
+        return {
+            'count': self.frames,
+            'inferred': self.inferred,
+            'skipped': self.frames - self.inferred,
+            'duty_pct': 100.0 * self.inferred / self.frames if self.frames else 100.0,
+            'motion_frames': self.motion_frames,
+            'score_pct': 100.0 * self.score,
+        }
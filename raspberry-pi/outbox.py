@@ -0,0 +1,238 @@
+import random
+import socket
+import sqlite3
+import threading
+import time
+
+import requests
+
+from stages import StageStats
+
+# 디스크(SD 카드)에 보관할 최대 이미지 수와 총 용량입니다. 넘으면 가장 오래된 이미지부터 버립니다.
+MAX_ITEMS = 500
+MAX_BYTES = 200 * 1024 * 1024
+# 한 번의 POST 요청으로 보낼 최대 이미지 수입니다.
+BATCH_SIZE = 8
+# 전송 실패 시 재시도 간격(초)입니다. 실패할 때마다 두 배로 늘어나며 MAX_BACKOFF를 넘지 않습니다.
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 300.0
+# 서버가 이미지 한 장만 담은 요청을 이 횟수만큼 계속 거부(4xx)하면 그 이미지를 버립니다.
+# 서버 배포 중의 일시적인 404/400 등으로 낙상 이미지를 잃지 않도록 여러 번(백오프 포함 수 분) 확인합니다.
+MAX_REJECTIONS = 10
+
+# send()의 결과
+SENT = 'sent'            # 전송 성공
+RETRY = 'retry'          # 연결 오류, 5xx, 408, 429: 백오프 후 다시 보냅니다.
+REJECTED = 'rejected'    # 그 밖의 4xx: 백오프 후 한 장씩 다시 보내고, 한 장이 계속 거부되면 버립니다.
+TOO_LARGE = 'too_large'  # 413: 요청 본문이 너무 크므로 바로 한 장씩 나눠 보냅니다.
+
+
+class Outbox:
+    """
+    낙상 이미지를 서버로 보내기 위한 영구 보관함입니다.
+
+    JPEG으로 인코딩된 이미지와 메타데이터를 SQLite 파일에 저장하고,
+    백그라운드 스레드가 같은 카메라의 이미지를 최대 batch_size개씩 묶어 하나의 POST 요청
+    (image0, image1, ...)으로 전송합니다. 전송에 성공한 이미지만 삭제하므로
+    네트워크 장애나 재부팅 중에도 이미지가 사라지지 않으며, 실패하면 지수 백오프로 재시도합니다.
+    서버가 묶음을 거부하면(413, 4xx) 한 장씩 나눠 보내서, 계속 거부되는 이미지만 골라 버립니다.
+    보관량이 max_items 또는 max_bytes를 넘으면 가장 오래된 이미지부터 버립니다.
+    낙상 전후 장면처럼 여러 장을 put_many()로 넣으면 낙상 순간의 이미지에만 event 표시를 하여
+    서버가 알림을 한 번만 보내도록 합니다.
+    """
+    def __init__(self, path, url, max_items=MAX_ITEMS, max_bytes=MAX_BYTES,
+                 batch_size=BATCH_SIZE, timeout=10, device_id=None):
+        self.url = url
+        # 서버가 이미지를 보낸 기기를 구분할 수 있도록 함께 보냅니다. (기본값: 호스트 이름)
+        self.device_id = device_id or socket.gethostname()
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.timeout = timeout
+        # 연결을 재사용하기 위해 세션 하나를 계속 사용합니다.
+        self.session = requests.Session()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+        self.failures = 0
+        self.sent = 0
+        self.evicted = 0
+        self.rejected = 0
+        # 묶음이 거부되었을 때 한 장씩 나눠 보낼 남은 이미지 수입니다.
+        self.split_remaining = 0
+        # 전송 요청 하나(묶음)의 왕복 시간입니다. 연결 오류로 실패한 요청은 포함하지 않습니다.
+        self.upload_latency = StageStats()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                camera_id INTEGER NOT NULL,
+                captured_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                data BLOB NOT NULL
+            )''')
+        # event 열이 없던 이전 버전의 파일에는 열을 추가합니다. (기존 이미지는 모두 낙상 순간 이미지)
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(outbox)')]
+        if 'event' not in columns:
+            self.db.execute('ALTER TABLE outbox ADD COLUMN event INTEGER NOT NULL DEFAULT 1')
+        # 한 장씩 보냈을 때 서버가 거부(4xx)한 횟수입니다. 연결 오류 등은 attempts에만 셉니다.
+        if 'rejections' not in columns:
+            self.db.execute('ALTER TABLE outbox ADD COLUMN rejections INTEGER NOT NULL DEFAULT 0')
+        self.db.commit()
+
+    def put(self, camera_id, data, captured_at=None):
+        """인코딩된 낙상 이미지 하나를 보관함에 추가합니다."""
+        if captured_at is None:
+            captured_at = time.time()
+        self.put_many(camera_id, [(data, captured_at)], event_index=0)
+
+    def put_many(self, camera_id, images, event_index=None):
+        """
+        인코딩된 이미지 묶음 [(data, captured_at), ...]을 한 번에 추가합니다.
+        event_index번째 이미지가 낙상 순간의 이미지이고, 나머지는 전후 장면입니다.
+        """
+        rows = [(camera_id, captured_at, sqlite3.Binary(data), int(i == event_index))
+                for i, (data, captured_at) in enumerate(images)]
+        with self.condition:
+            self.db.executemany(
+                'INSERT INTO outbox (camera_id, captured_at, data, event) VALUES (?, ?, ?, ?)', rows)
+            self.evict()
+            self.db.commit()
+            self.condition.notify_all()
+
+    def evict(self):
+        """보관 한도를 넘은 만큼 가장 오래된 이미지를 삭제합니다. condition을 잡은 상태에서 호출합니다."""
+        count, size = self.usage()
+        while count > self.max_items or (size > self.max_bytes and count > 1):
+            row = self.db.execute(
+                'SELECT id, length(data) FROM outbox ORDER BY id LIMIT 1').fetchone()
+            self.db.execute('DELETE FROM outbox WHERE id = ?', (row[0],))
+            count, size = count - 1, size - row[1]
+            self.evicted += 1
+
+    def usage(self):
+        """(보관 중인 이미지 수, 총 바이트 수)를 반환합니다."""
+        with self.condition:
+            count, size = self.db.execute(
+                'SELECT count(*), coalesce(sum(length(data)), 0) FROM outbox').fetchone()
+        return count, size
+
+    def next_batch(self):
+        """
+        가장 오래된 이미지와 같은 카메라의 이미지들을 오래된 순서로 최대 batch_size개 가져옵니다.
+        거부된 묶음을 나눠 보내는 중이면 한 장만 가져옵니다.
+        """
+        limit = 1 if self.split_remaining > 0 else self.batch_size
+        with self.condition:
+            first = self.db.execute('SELECT camera_id FROM outbox ORDER BY id LIMIT 1').fetchone()
+            if first is None:
+                return None, []
+            rows = self.db.execute(
+                'SELECT id, captured_at, data, event FROM outbox '
+                'WHERE camera_id = ? ORDER BY id LIMIT ?',
+                (first[0], limit)).fetchall()
+            return first[0], rows
+
+    def send(self, camera_id, rows):
+        """
+        이미지 묶음을 한 번의 요청으로 전송하고 결과(SENT, RETRY, REJECTED, TOO_LARGE)를 반환합니다.
+        """
+        files = [('image%d' % i, ('fall_capture.jpg', bytes(data), 'image/jpeg'))
+                 for i, (_, _, data, _) in enumerate(rows)]
+        form = {'camera_id': camera_id,
+                'device_id': self.device_id,
+                'captured_at': ['%.3f' % captured_at for _, captured_at, _, _ in rows],
+                'event': [event for _, _, _, event in rows]}
+        start = time.monotonic()
+        try:
+            response = self.session.post(self.url, files=files, data=form, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"서버 연결 오류: {e}")
+            return RETRY
+        self.upload_latency.record(time.monotonic() - start)
+        # 서버는 이미지를 받아 두고 저장소 업로드를 나중에 하는 경우 202를 응답합니다.
+        if 200 <= response.status_code < 300:
+            print(f"서버에 이미지 {len(rows)}장 전송 성공")
+            return SENT
+        print(f"서버에 이미지 전송 실패: 상태 코드 {response.status_code}")
+        if response.status_code == 413:
+            # 프록시 등의 요청 크기 제한입니다.
+            return TOO_LARGE
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            return REJECTED
+        return RETRY
+
+    def backoff(self):
+        """연속 실패 횟수에 따른 다음 재시도까지의 대기 시간(초)입니다. 여러 기기가 동시에 몰리지 않도록 흔듭니다."""
+        delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self.failures - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopped and self.usage()[0] == 0:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+            camera_id, rows = self.next_batch()
+            if not rows:
+                continue
+            ids = [(row[0],) for row in rows]
+            result = self.send(camera_id, rows)
+            if result == SENT:
+                self.failures = 0
+                self.sent += len(rows)
+                self.delete(ids)
+                continue
+            if result in (TOO_LARGE, REJECTED):
+                if len(rows) > 1:
+                    # 묶음 전체를 버리지 않고, 한 장씩 보내서 어느 이미지가 거부되는지 확인합니다.
+                    self.split_remaining = len(rows)
+                    if result == TOO_LARGE:
+                        continue
+                elif self.reject(ids[0][0], result):
+                    continue
+            self.failures += 1
+            with self.condition:
+                self.db.executemany('UPDATE outbox SET attempts = attempts + 1 WHERE id = ?', ids)
+                self.db.commit()
+                self.condition.wait_for(lambda: self.stopped, timeout=self.backoff())
+
+    def reject(self, item_id, result):
+        """
+        서버가 이미지 한 장만 담은 요청을 거부했을 때 호출합니다.
+        한 장도 크기 제한을 넘었거나(413) MAX_REJECTIONS번 거부되었으면 버리고 True를 반환합니다.
+        """
+        with self.condition:
+            self.db.execute('UPDATE outbox SET rejections = rejections + 1 WHERE id = ?', (item_id,))
+            row = self.db.execute('SELECT rejections FROM outbox WHERE id = ?', (item_id,)).fetchone()
+            self.db.commit()
+        if row is not None and result != TOO_LARGE and row[0] < MAX_REJECTIONS:
+            return False
+        print(f"서버가 거부한 이미지를 버립니다. (거부 {row[0] if row else 0}회)")
+        self.rejected += 1
+        self.delete([(item_id,)])
+        return True
+
+    def delete(self, ids):
+        """이미지를 보관함에서 지웁니다. 한 장씩 나눠 보내는 중이면 남은 수도 줄입니다."""
+        with self.condition:
+            self.db.executemany('DELETE FROM outbox WHERE id = ?', ids)
+            self.db.commit()
+        self.split_remaining = max(self.split_remaining - len(ids), 0)
+
+    def start(self):
+        """전송 스레드를 시작합니다. 이전 실행에서 남은 이미지부터 전송합니다."""
+        self.thread = threading.Thread(target=self.run, name='outbox', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout)
+        self.session.close()
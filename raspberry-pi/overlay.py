@@ -0,0 +1,127 @@
+from xml.sax.saxutils import escape
+
+import cv2
+import numpy as np
+
+from pose_engine import KeypointType
+
+# Posenet 모델의 스켈레톤에서 연결할 신체 부위(엣지)를 정의합니다. (얼굴, 팔, 몸통, 다리 전체)
+EDGES = (
+    (KeypointType.NOSE, KeypointType.LEFT_EYE),
+    (KeypointType.NOSE, KeypointType.RIGHT_EYE),
+    (KeypointType.NOSE, KeypointType.LEFT_EAR),
+    (KeypointType.NOSE, KeypointType.RIGHT_EAR),
+    (KeypointType.LEFT_EAR, KeypointType.LEFT_EYE),
+    (KeypointType.RIGHT_EAR, KeypointType.RIGHT_EYE),
+    (KeypointType.LEFT_EYE, KeypointType.RIGHT_EYE),
+    (KeypointType.LEFT_SHOULDER, KeypointType.RIGHT_SHOULDER),
+    (KeypointType.LEFT_SHOULDER, KeypointType.LEFT_ELBOW),
+    (KeypointType.LEFT_SHOULDER, KeypointType.LEFT_HIP),
+    (KeypointType.RIGHT_SHOULDER, KeypointType.RIGHT_ELBOW),
+    (KeypointType.RIGHT_SHOULDER, KeypointType.RIGHT_HIP),
+    (KeypointType.LEFT_ELBOW, KeypointType.LEFT_WRIST),
+    (KeypointType.RIGHT_ELBOW, KeypointType.RIGHT_WRIST),
+    (KeypointType.LEFT_HIP, KeypointType.RIGHT_HIP),
+    (KeypointType.LEFT_HIP, KeypointType.LEFT_KNEE),
+    (KeypointType.RIGHT_HIP, KeypointType.RIGHT_KNEE),
+    (KeypointType.LEFT_KNEE, KeypointType.LEFT_ANKLE),
+    (KeypointType.RIGHT_KNEE, KeypointType.RIGHT_ANKLE),
+)
+
+# 오버레이 방식
+OVERLAY_MODES = ('svg', 'raster', 'none')
+
+def keypoint_pixels(poses, src_size, inference_box, threshold):
+    """
+    모든 포즈의 키포인트를 화면 좌표로 한 번에 변환합니다.
+    (정수 좌표 (포즈 수, 17, 2), 표시 여부 (포즈 수, 17))를 반환합니다.
+    """
+    box_x, box_y, box_w, box_h = inference_box
+    scale = np.array((src_size[0] / box_w, src_size[1] / box_h), dtype=np.float32)
+    keypoints = poses.keypoints
+    xys = ((keypoints[:, :, :2] - (box_x, box_y)) * scale).astype(np.int32)
+    return xys, keypoints[:, :, 2] >= threshold
+
+EDGE_STARTS, EDGE_ENDS = (np.array(ends) for ends in zip(*EDGES))
+
+def edge_segments(xys, visible):
+    """양 끝 키포인트가 모두 보이는 엣지의 (x1, y1, x2, y2) 목록을 반환합니다. (모든 포즈와 엣지를 한 번에)"""
+    both = visible[:, EDGE_STARTS] & visible[:, EDGE_ENDS]
+    return np.concatenate((xys[:, EDGE_STARTS][both], xys[:, EDGE_ENDS][both]), axis=1).tolist()
+
+class SvgOverlay:
+    """
+    rsvgoverlay에 넘길 SVG 문자열을 만드는 렌더러입니다.
+    svgwrite 객체를 매 프레임 만드는 대신, 고정된 머리말은 한 번만 만들어 두고
+    텍스트 조각은 내용이 바뀔 때만 다시 만들며, 보이지 않는 요소는 출력하지 않습니다.
+    결과가 직전 프레임과 같으면 None을 반환하여 오버레이 갱신을 건너뛰게 합니다.
+    """
+    def __init__(self, src_size, color='yellow', threshold=0.2):
+        self.src_size = src_size
+        self.threshold = threshold
+        self.header = ('<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+                       'width="%d" height="%d">' % src_size)
+        self.line_template = ('<line x1="%%d" y1="%%d" x2="%%d" y2="%%d" '
+                              'stroke="%s" stroke-width="2"/>' % color)
+        self.text_cache = {}
+        self.last_svg = None
+
+    def shadow_text(self, x, y, text, font_size=16):
+        """그림자가 있는 텍스트 조각을 반환합니다. 같은 텍스트는 캐시에서 재사용합니다."""
+        key = (x, y, text, font_size)
+        fragment = self.text_cache.get(key)
+        if fragment is None:
+            if len(self.text_cache) > 64:
+                self.text_cache.clear()
+            template = ('<text x="%d" y="%d" fill="%s" font-size="%d" '
+                        'style="font-family:sans-serif">%s</text>')
+            fragment = (template % (x + 1, y + 1, 'black', font_size, escape(text)) +
+                        template % (x, y, 'white', font_size, escape(text)))
+            self.text_cache[key] = fragment
+        return fragment
+
+    def render(self, poses, inference_box, text_line, alert=None):
+        """SVG 문자열을 반환합니다. 직전 결과와 같으면 None을 반환합니다."""
+        parts = [self.header]
+        if text_line:
+            parts.append(self.shadow_text(10, 20, text_line))
+        if len(poses):
+            xys, visible = keypoint_pixels(poses, self.src_size, inference_box, self.threshold)
+            parts.extend(self.line_template % tuple(segment)
+                         for segment in edge_segments(xys, visible))
+        if alert:
+            parts.append(self.shadow_text(10, 50, alert, font_size=24))
+        parts.append('</svg>')
+        svg = ''.join(parts)
+        if svg == self.last_svg:
+            return None
+        self.last_svg = svg
+        return svg
+
+class RasterOverlay:
+    """
+    SVG 없이 OpenCV로 RGB 프레임(추론 해상도)에 직접 스켈레톤과 텍스트를 그리는 렌더러입니다.
+    OpenCV 기본 글꼴은 한글을 지원하지 않으므로 영문 문구를 사용합니다.
+    """
+    ALERT_TEXT = 'FALL DETECTED!'
+
+    def __init__(self, color=(255, 255, 0), threshold=0.2):
+        self.color = color
+        self.threshold = threshold
+
+    def render(self, frame, poses, text_line, alert=False):
+        """frame(쓰기 가능한 RGB 배열)에 오버레이를 그려서 반환합니다."""
+        if len(poses):
+            # 프레임이 추론 해상도이므로 키포인트 좌표를 그대로 사용합니다.
+            height, width = frame.shape[:2]
+            xys, visible = keypoint_pixels(poses, (width, height), (0, 0, width, height),
+                                           self.threshold)
+            for x1, y1, x2, y2 in edge_segments(xys, visible):
+                cv2.line(frame, (x1, y1), (x2, y2), self.color, 2)
+        if text_line:
+            cv2.putText(frame, text_line, (11, 21), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+            cv2.putText(frame, text_line, (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        if alert:
+            cv2.putText(frame, self.ALERT_TEXT, (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8,
+                        (255, 0, 0), 2)
+        return frame
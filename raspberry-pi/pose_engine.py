@@ -12,11 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from pycoral.utils import edgetpu
-from PIL import Image
-from tflite_runtime.interpreter import load_delegate
-from tflite_runtime.interpreter import Interpreter
-
 import collections
 import enum
 import math
@@ -26,6 +21,23 @@ import platform
 import sys
 import time
 
+# The inference runtime is only needed to construct a PoseEngine. Decoding
+# recorded outputs (see replay.py) works without it, e.g. on a CI machine,
+# and the CPU backend works without pycoral.
+try:
+    from tflite_runtime.interpreter import load_delegate
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    load_delegate = Interpreter = None
+try:
+    from pycoral.utils import edgetpu
+except ImportError:
+    edgetpu = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
 
 #TODO: Adds support for window and MAC
 EDGETPU_SHARED_LIB = 'libedgetpu.so.1'
@@ -62,25 +74,198 @@ Keypoint = collections.namedtuple('Keypoint', ['point', 'score'])
 
 Pose = collections.namedtuple('Pose', ['keypoints', 'score'])
 
+NUM_KEYPOINTS = len(KeypointType)
+_KEYPOINT_TYPES = tuple(KeypointType)
+
+
+class PoseView():
+    """Lazy view of a single pose stored in a PoseArray.
+
+    Exposes the same `keypoints` and `score` attributes as `Pose`, but the
+    keypoint dict is only built the first time it is accessed.
+    """
+
+    __slots__ = ('array', 'score', '_keypoints')
+
+    def __init__(self, array, score):
+        self.array = array
+        self.score = score
+        self._keypoints = None
+
+    @property
+    def keypoints(self):
+        if self._keypoints is None:
+            self._keypoints = {
+                label: Keypoint(Point(x, y), score)
+                for label, (x, y, score) in zip(_KEYPOINT_TYPES, self.array.tolist())}
+        return self._keypoints
+
+
+class PoseArray():
+    """Array-backed poses returned by `PoseEngine.ParseOutputArray`.
+
+    Attributes:
+      keypoints: float32 array of shape (num_poses, 17, 3) holding
+        (x, y, score) for every keypoint, indexed by `KeypointType`.
+      scores: float32 array of shape (num_poses,) with the pose scores.
+    """
+
+    __slots__ = ('keypoints', 'scores')
+
+    def __init__(self, keypoints, scores):
+        self.keypoints = keypoints
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __getitem__(self, idx):
+        return PoseView(self.keypoints[idx], self.scores[idx])
+
+    def __iter__(self):
+        for idx in range(len(self.scores)):
+            yield self[idx]
+
+    def copy(self):
+        """Returns a PoseArray that owns its data."""
+        return PoseArray(self.keypoints.copy(), self.scores.copy())
+
+
+def parse_output_tensors(keypoints, keypoint_scores, pose_scores, num_poses,
+                         mirror=False, input_width=0, out=None):
+    """Decodes the four PoseNet decoder output tensors into a PoseArray.
+
+    Args:
+      keypoints: (max_poses, 17, 2) array of (y, x) keypoint positions.
+      keypoint_scores: (max_poses, 17) array of keypoint scores.
+      pose_scores: (max_poses,) array of pose scores.
+      num_poses: Number of valid poses.
+      mirror: Flip keypoints horizontally.
+      input_width: Model input width, used for mirroring.
+      out: Optional (pose_buffer, score_buffer) tuple to decode into. New
+        arrays are allocated when omitted.
+
+    Returns:
+      PoseArray holding the first `num_poses` poses.
+    """
+    keypoints = np.reshape(keypoints, (-1, NUM_KEYPOINTS, 2))
+    keypoint_scores = np.reshape(keypoint_scores, (-1, NUM_KEYPOINTS))
+    pose_scores = np.reshape(pose_scores, (-1,))
+    num_poses = int(num_poses)
+    if out is None:
+        out = (np.empty((num_poses, NUM_KEYPOINTS, 3), dtype=np.float32),
+               np.empty((num_poses,), dtype=np.float32))
+
+    poses = out[0][:num_poses]
+    # The decoder emits (y, x) pairs; ParseOutput historically mirrors the
+    # first component, keep the exact same semantics here.
+    poses[..., 0] = keypoints[:num_poses, :, 1]
+    poses[..., 1] = keypoints[:num_poses, :, 0]
+    if mirror:
+        np.subtract(input_width, poses[..., 1], out=poses[..., 1])
+    poses[..., 2] = keypoint_scores[:num_poses]
+
+    scores = out[1][:num_poses]
+    scores[:] = pose_scores[:num_poses]
+    return PoseArray(poses, scores)
+
+
+def cpu_model_path(model_path):
+    """Returns the CPU variant of an Edge TPU compiled model path."""
+    return model_path.replace('_edgetpu.tflite', '.tflite')
+
+
+class EdgeTpuBackend():
+    """Runs an Edge TPU compiled model on the Coral accelerator."""
+
+    name = 'edgetpu'
+
+    def __init__(self, model_path):
+        if edgetpu is None or Interpreter is None:
+            raise ValueError('pycoral and tflite_runtime are required for the Edge TPU backend.')
+        edgetpu_delegate = load_delegate(EDGETPU_SHARED_LIB)
+        posenet_decoder_delegate = load_delegate(POSENET_SHARED_LIB)
+        self.interpreter = Interpreter(
+            model_path, experimental_delegates=[edgetpu_delegate, posenet_decoder_delegate])
+        self.interpreter.allocate_tensors()
+
+    def invoke(self, input_data):
+        """Runs inference using the zero copy feature from pycoral."""
+        edgetpu.run_inference(self.interpreter, input_data)
+
+
+class CpuBackend():
+    """Runs the non-Edge TPU model with the multi-threaded TF-Lite CPU kernels."""
+
+    name = 'cpu'
+
+    def __init__(self, model_path, num_threads=None):
+        if Interpreter is None:
+            raise ValueError('tflite_runtime is required for the CPU backend.')
+        posenet_decoder_delegate = load_delegate(POSENET_SHARED_LIB)
+        self.num_threads = num_threads or os.cpu_count()
+        self.interpreter = Interpreter(
+            cpu_model_path(model_path), num_threads=self.num_threads,
+            experimental_delegates=[posenet_decoder_delegate])
+        self.interpreter.allocate_tensors()
+        input_details = self.interpreter.get_input_details()[0]
+        self._input_index = input_details['index']
+        self._input_shape = input_details['shape']
+
+    def invoke(self, input_data):
+        self.interpreter.set_tensor(
+            self._input_index, np.reshape(input_data, self._input_shape))
+        self.interpreter.invoke()
+
+
+BACKENDS = ('auto', 'edgetpu', 'cpu')
+
+
+def make_backend(model_path, backend='auto', num_threads=None):
+    """Creates an inference backend.
+
+    Args:
+      model_path: String, path to the Edge TPU compiled model. The CPU backend
+        loads the matching model without the `_edgetpu` suffix.
+      backend: One of BACKENDS. 'auto' prefers the Edge TPU and falls back to
+        the CPU when no accelerator can be opened.
+      num_threads: Number of CPU threads, defaults to the number of cores.
+    """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend: {}'.format(backend))
+    if backend == 'cpu':
+        return CpuBackend(model_path, num_threads)
+    try:
+        return EdgeTpuBackend(model_path)
+    except (ValueError, RuntimeError, OSError) as e:
+        if backend == 'edgetpu':
+            raise
+        print('Edge TPU unavailable ({}), falling back to CPU.'.format(e))
+        return CpuBackend(model_path, num_threads)
+
 
 class PoseEngine():
     """Engine used for pose tasks."""
 
-    def __init__(self, model_path, mirror=False):
+    def __init__(self, model_path, mirror=False, backend='auto', num_threads=None):
         """Creates a PoseEngine with given model.
 
         Args:
           model_path: String, path to TF-Lite Flatbuffer file.
           mirror: Flip keypoints horizontally.
+          backend: Inference backend, one of BACKENDS.
+          num_threads: Number of threads for the CPU backend.
 
         Raises:
           ValueError: An error occurred when model output is invalid.
         """
-        edgetpu_delegate = load_delegate(EDGETPU_SHARED_LIB)
-        posenet_decoder_delegate = load_delegate(POSENET_SHARED_LIB)
-        self._interpreter = Interpreter(
-            model_path, experimental_delegates=[edgetpu_delegate, posenet_decoder_delegate])
-        self._interpreter.allocate_tensors()
+        self._model_path = model_path
+        self._backend_mode = backend
+        self._num_threads = num_threads
+        self._backend = make_backend(model_path, backend, num_threads)
+        self._interpreter = self._backend.interpreter
+        # backend name -> [number of invokes, total seconds]
+        self._latency = collections.defaultdict(lambda: [0, 0.0])
 
         self._mirror = mirror
 
@@ -95,12 +280,41 @@ class PoseEngine():
         self._input_type = self._interpreter.get_input_details()[0]['dtype']
         self._inf_time = 0
 
+        # Preallocated buffers reused by ParseOutputArray on every frame.
+        max_poses = self._interpreter.get_output_details()[0]['shape'][-3]
+        self._pose_buffer = np.zeros((max_poses, NUM_KEYPOINTS, 3), dtype=np.float32)
+        self._pose_score_buffer = np.zeros((max_poses,), dtype=np.float32)
+
+    @property
+    def backend_name(self):
+        return self._backend.name
+
+    def latency_stats(self):
+        """Returns {backend name: (number of invokes, average latency in ms)}."""
+        return {name: (count, 1000 * total / count)
+                for name, (count, total) in self._latency.items() if count}
+
     def run_inference(self, input_data):
-        """Run inference using the zero copy feature from pycoral and returns inference time in ms.
+        """Runs inference on the active backend and returns inference time in ms.
+
+        In 'auto' mode a failing Edge TPU (e.g. an unplugged accelerator) is
+        replaced by the CPU backend so monitoring keeps running.
         """
         start = time.monotonic()
-        edgetpu.run_inference(self._interpreter, input_data)
+        try:
+            self._backend.invoke(input_data)
+        except RuntimeError as e:
+            if self._backend_mode != 'auto' or self._backend.name == 'cpu':
+                raise
+            print('Edge TPU inference failed ({}), switching to CPU.'.format(e))
+            self._backend = CpuBackend(self._model_path, self._num_threads)
+            self._interpreter = self._backend.interpreter
+            start = time.monotonic()
+            self._backend.invoke(input_data)
         self._inf_time = time.monotonic() - start
+        latency = self._latency[self._backend.name]
+        latency[0] += 1
+        latency[1] += self._inf_time
         return (self._inf_time * 1000)
 
     def DetectPosesInImage(self, img):
@@ -136,21 +350,35 @@ class PoseEngine():
         return np.squeeze(self._interpreter.tensor(
             self._interpreter.get_output_details()[idx]['index'])())
 
+    def get_output_tensors(self):
+        """Returns views of the four raw decoder output tensors."""
+        return tuple(self.get_output_tensor(idx) for idx in range(4))
+
+    def get_output_snapshot(self):
+        """Returns copies of the four raw output tensors, safe to keep across invokes."""
+        return tuple(np.array(tensor) for tensor in self.get_output_tensors())
+
+    def ParseOutputSnapshot(self, snapshot):
+        """Parses a `get_output_snapshot` result into a PoseArray that owns its data."""
+        return parse_output_tensors(*snapshot, mirror=self._mirror,
+                                    input_width=self._input_width)
+
     def ParseOutput(self):
         """Parses interpreter output tensors and returns decoded poses."""
-        keypoints = self.get_output_tensor(0)
-        keypoint_scores = self.get_output_tensor(1)
-        pose_scores = self.get_output_tensor(2)
-        num_poses = self.get_output_tensor(3)
-        poses = []
-        for i in range(int(num_poses)):
-            pose_score = pose_scores[i]
-            pose_keypoints = {}
-            for j, point in enumerate(keypoints[i]):
-                y, x = point
-                if self._mirror:
-                    y = self._input_width - y
-                pose_keypoints[KeypointType(j)] = Keypoint(
-                    Point(x, y), keypoint_scores[i, j])
-            poses.append(Pose(pose_keypoints, pose_score))
+        poses, inf_time = self.ParseOutputArray()
+        return [Pose(pose.keypoints, pose.score) for pose in poses], inf_time
+
+    def ParseOutputArray(self):
+        """Parses interpreter output tensors into preallocated arrays.
+
+        The returned PoseArray is a view into buffers owned by the engine which
+        are overwritten by the next call; use `PoseArray.copy()` to keep it.
+
+        Returns:
+          (PoseArray, inference time in seconds).
+        """
+        poses = parse_output_tensors(
+            *self.get_output_tensors(), mirror=self._mirror,
+            input_width=self._input_width,
+            out=(self._pose_buffer, self._pose_score_buffer))
         return poses, self._inf_time
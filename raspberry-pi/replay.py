@@ -0,0 +1,259 @@
+"""
+카메라나 TPU 없이 낙상 감지 로직을 재생(replay)하고 성능을 측정하는 도구입니다.
+
+기록된 모델 출력(.npz, fall_detector.py --record로 생성) 또는 비디오 파일을
+실시간 파이프라인과 같은 경로(파싱 -> FallDetector -> 오버레이 렌더링)로 최대 속도로 흘려보내고,
+단계별 처리 속도(FPS)와 라벨 대비 낙상 감지 정밀도/재현율을 출력합니다.
+
+사용 예:
+    python3 replay.py clip1.npz clip2.npz --thresholds 1.5 2 2.5 3
+    python3 replay.py clip1.npz --classifier models/fall_classifier.tflite
+    python3 replay.py fall.mp4 --model models/.../posenet_..._edgetpu.tflite --backend cpu --labels labels.json
+
+.npz 파일 형식:
+    keypoints (F, N, 17, 2), keypoint_scores (F, N, 17), pose_scores (F, N), num_poses (F,)
+        : 프레임별 PoseEngine 원본 출력 텐서 4개
+    timestamps (F,)        : 프레임 시각(초)
+    src_size, inference_size (2,) : 원본/추론 해상도 (width, height)
+    fall_frames (선택)      : 낙상이 시작된 프레임 번호 라벨
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from pose_engine import BACKENDS, parse_output_tensors
+from classifier import FALL_HIP_VELOCITY, RuleClassifier, make_classifier
+from detection import FallDetector
+from overlay import SvgOverlay
+
+OUTPUT_KEYS = ('keypoints', 'keypoint_scores', 'pose_scores', 'num_poses')
+
+
+def inference_box_for(src_size, inference_size):
+    """GStreamer 파이프라인의 videobox(autocrop)와 같은 방식으로 추론 영역 (x, y, w, h)을 계산합니다."""
+    scale = min(inference_size[0] / src_size[0], inference_size[1] / src_size[1])
+    width, height = (int(x * scale) for x in src_size)
+    return ((inference_size[0] - width) // 2, (inference_size[1] - height) // 2, width, height)
+
+
+class PoseRecorder:
+    """프레임마다 PoseEngine의 원본 출력 텐서 4개를 모아 .npz 파일로 저장합니다."""
+    def __init__(self, src_size, inference_size, mirror=False):
+        self.src_size = src_size
+        self.inference_size = inference_size
+        self.mirror = mirror
+        self.frames = []
+        self.timestamps = []
+
+    def add(self, tensors, timestamp):
+        # 출력 텐서는 다음 추론에서 덮어써지므로 복사해서 보관합니다.
+        self.frames.append(tuple(np.array(t) for t in tensors))
+        self.timestamps.append(timestamp)
+
+    def save(self, path, fall_frames=None):
+        data = {key: np.stack([frame[i] for frame in self.frames])
+                for i, key in enumerate(OUTPUT_KEYS)}
+        data['timestamps'] = np.asarray(self.timestamps, dtype=np.float64)
+        data['src_size'] = np.asarray(self.src_size)
+        data['inference_size'] = np.asarray(self.inference_size)
+        data['mirror'] = np.asarray(self.mirror)
+        if fall_frames is not None:
+            data['fall_frames'] = np.asarray(fall_frames, dtype=np.int64)
+        np.savez_compressed(path, **data)
+
+
+class Clip:
+    """재생할 클립 하나의 프레임별 원본 출력 텐서와 메타데이터입니다."""
+    def __init__(self, name, frames, timestamps, src_size, inference_size,
+                 mirror=False, fall_frames=None):
+        self.name = name
+        self.frames = frames
+        self.timestamps = timestamps
+        self.src_size = tuple(int(x) for x in src_size)
+        self.inference_size = tuple(int(x) for x in inference_size)
+        self.mirror = bool(mirror)
+        self.fall_frames = fall_frames
+        self.inference_box = inference_box_for(self.src_size, self.inference_size)
+
+
+def load_npz_clip(path):
+    data = np.load(path)
+    frames = list(zip(*(data[key] for key in OUTPUT_KEYS)))
+    fall_frames = data['fall_frames'].tolist() if 'fall_frames' in data else None
+    mirror = data['mirror'] if 'mirror' in data else False
+    return Clip(os.path.basename(path), frames, data['timestamps'],
+                data['src_size'], data['inference_size'], mirror, fall_frames)
+
+
+def load_video_clip(path, engine):
+    """비디오 파일의 모든 프레임을 PoseEngine으로 추론하여 클립을 만듭니다."""
+    import cv2
+
+    input_shape = engine.get_input_tensor_shape()
+    inference_size = (int(input_shape[2]), int(input_shape[1]))
+    capture = cv2.VideoCapture(path)
+    src_size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames, timestamps = [], []
+    while True:
+        ok, bgr = capture.read()
+        if not ok:
+            break
+        rgb = cv2.cvtColor(cv2.resize(bgr, inference_size), cv2.COLOR_BGR2RGB)
+        engine.run_inference(rgb.reshape(-1))
+        frames.append(tuple(np.array(t) for t in engine.get_output_tensors()))
+        timestamps.append(len(timestamps) / fps)
+    capture.release()
+    # 프레임 전체를 늘려서 추론 크기에 맞췄으므로 추론 영역은 전체 입력입니다.
+    clip = Clip(os.path.basename(path), frames, np.asarray(timestamps),
+                src_size, inference_size)
+    clip.inference_box = (0, 0) + inference_size
+    return clip
+
+
+def decode_clip(clip):
+    """
+    모든 프레임의 출력 텐서를 PoseArray로 해석하여 (포즈 리스트, 파싱 소요 시간)을 반환합니다.
+    시간은 실시간 경로와 같이 미리 할당한 버퍼에 해석하는 비용만 측정합니다.
+    """
+    poses = [parse_output_tensors(*frame, mirror=clip.mirror,
+                                  input_width=clip.inference_size[0])
+             for frame in clip.frames]
+
+    max_poses = max((len(frame[2]) for frame in clip.frames), default=0)
+    out = (np.empty((max_poses, 17, 3), dtype=np.float32),
+           np.empty((max_poses,), dtype=np.float32))
+    start = time.perf_counter()
+    for frame in clip.frames:
+        parse_output_tensors(*frame, mirror=clip.mirror,
+                             input_width=clip.inference_size[0], out=out)
+    return poses, time.perf_counter() - start
+
+
+def detect_clip(clip, poses, classifier):
+    """FallDetector로 클립을 재생하고, (낙상 알림 프레임 번호 리스트, 소요 시간)을 반환합니다."""
+    detector = FallDetector(classifier)
+    detected = []
+    start = time.perf_counter()
+    for index, (frame_poses, timestamp) in enumerate(zip(poses, clip.timestamps)):
+        _, fall_detected = detector.update(frame_poses, clip.src_size,
+                                           clip.inference_box, timestamp)
+        if fall_detected:
+            detected.append(index)
+    return detected, time.perf_counter() - start
+
+
+def render_clip(clip, poses):
+    """모든 프레임의 오버레이 SVG를 렌더링하는 데 걸린 시간을 반환합니다."""
+    renderer = SvgOverlay(clip.src_size)
+    start = time.perf_counter()
+    for frame_poses in poses:
+        renderer.render(frame_poses, clip.inference_box,
+                        'Replay Nposes %d' % len(frame_poses))
+    return time.perf_counter() - start
+
+
+def match_events(detected, labels, tolerance):
+    """
+    감지된 프레임과 라벨 프레임을 tolerance 프레임 이내로 짝지어
+    (true positive, false positive, false negative) 개수를 반환합니다.
+    """
+    unmatched = list(detected)
+    tp = 0
+    for label in labels:
+        hits = [d for d in unmatched if abs(d - label) <= tolerance]
+        if hits:
+            tp += 1
+            unmatched.remove(min(hits, key=lambda d: abs(d - label)))
+    return tp, len(unmatched), len(labels) - tp
+
+
+def fps(frames, seconds):
+    return frames / seconds if seconds > 0 else float('inf')
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('clips', nargs='+', help='.npz 기록 파일 또는 비디오 파일')
+    parser.add_argument('--model', help='비디오 파일 추론에 사용할 .tflite 모델 경로')
+    parser.add_argument('--backend', help='비디오 파일 추론 백엔드', default='auto', choices=BACKENDS)
+    parser.add_argument('--labels', help='클립 파일 이름 -> 낙상 시작 프레임 번호 리스트 JSON')
+    parser.add_argument('--thresholds', help='평가할 엉덩이 하강 속도 임계값(몸통 길이/초) 목록 (규칙 분류기)',
+                        nargs='+', type=float, default=[FALL_HIP_VELOCITY])
+    parser.add_argument('--classifier', help='규칙 대신 평가할 낙상 분류 .tflite 모델 경로')
+    parser.add_argument('--tolerance', help='라벨과 감지를 같은 사건으로 볼 최대 프레임 차이',
+                        type=int, default=15)
+    parser.add_argument('--no-overlay', help='오버레이 렌더링 벤치마크를 건너뜁니다.',
+                        action='store_true')
+    args = parser.parse_args()
+
+    labels = {}
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+
+    engine = None
+    clips = []
+    for path in args.clips:
+        if path.endswith('.npz'):
+            clip = load_npz_clip(path)
+        else:
+            if engine is None:
+                if not args.model:
+                    parser.error('비디오 파일을 재생하려면 --model이 필요합니다.')
+                from pose_engine import PoseEngine
+                engine = PoseEngine(args.model, backend=args.backend)
+            clip = load_video_clip(path, engine)
+        if clip.name in labels:
+            clip.fall_frames = labels[clip.name]
+        clips.append(clip)
+
+    total_frames = sum(len(clip.frames) for clip in clips)
+    parse_time = detect_time = render_time = 0.0
+    decoded = []
+    for clip in clips:
+        poses, seconds = decode_clip(clip)
+        decoded.append(poses)
+        parse_time += seconds
+        if not args.no_overlay:
+            render_time += render_clip(clip, poses)
+
+    print('프레임 수: %d (클립 %d개)' % (total_frames, len(clips)))
+    print('ParseOutput: %.1f fps' % fps(total_frames, parse_time))
+
+    # 분류 모델을 지정하면 임계값 대신 그 모델 하나를 평가합니다.
+    if args.classifier:
+        classifiers = [(os.path.basename(args.classifier), make_classifier(args.classifier))]
+    else:
+        classifiers = [('threshold=%g' % threshold, RuleClassifier(hip_velocity=threshold))
+                       for threshold in args.thresholds]
+    for name, classifier in classifiers:
+        tp = fp = fn = 0
+        detect_time = 0.0
+        labeled = False
+        for clip, poses in zip(clips, decoded):
+            detected, seconds = detect_clip(clip, poses, classifier)
+            detect_time += seconds
+            if clip.fall_frames is not None:
+                labeled = True
+                counts = match_events(detected, clip.fall_frames, args.tolerance)
+                tp, fp, fn = tp + counts[0], fp + counts[1], fn + counts[2]
+            print('  [%s] %s 감지 프레임: %s' % (clip.name, name, detected))
+        line = '낙상 감지 (%s): %.1f fps' % (name, fps(total_frames, detect_time))
+        if labeled:
+            precision = tp / (tp + fp) if tp + fp else 0.0
+            recall = tp / (tp + fn) if tp + fn else 0.0
+            line += ' precision=%.3f recall=%.3f (TP %d, FP %d, FN %d)' % (
+                precision, recall, tp, fp, fn)
+        print(line)
+
+    if not args.no_overlay:
+        print('오버레이 렌더링: %.1f fps' % fps(total_frames, render_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import bisect
+import collections
+import sys
+import threading
+import time
+
+# 링 버퍼가 가득 찼을 때의 처리 방식
+DROP_OLDEST = 'oldest'  # 가장 오래된 항목을 버리고 새 항목을 넣습니다. (최신 프레임 우선)
+DROP_NEWEST = 'newest'  # 새 항목을 버립니다.
+BLOCK = 'block'         # 자리가 날 때까지 생산자를 기다리게 합니다. (프레임 손실 없음)
+
+# 지연 시간 히스토그램의 구간 경계(초)입니다. metrics.py가 Prometheus 히스토그램으로 내보냅니다.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+class RingBuffer:
+    """
+    파이프라인 단계 사이를 잇는 크기 제한 큐입니다.
+    가득 찼을 때의 동작은 policy(DROP_OLDEST/DROP_NEWEST/BLOCK)로 정하며,
+    버려지는 항목은 on_drop으로 넘겨서 매핑된 버퍼 등을 정리할 수 있게 합니다.
+    """
+    def __init__(self, capacity, policy=DROP_OLDEST, on_drop=None):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError('Unknown drop policy: %s' % policy)
+        self.capacity = capacity
+        self.policy = policy
+        self.on_drop = on_drop
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def _drop(self, item):
+        self.dropped += 1
+        if self.on_drop:
+            self.on_drop(item)
+
+    def put(self, item):
+        """항목을 넣고, 버려졌다면 False를 반환합니다."""
+        with self.condition:
+            if self.policy == BLOCK:
+                while len(self.items) >= self.capacity and not self.closed:
+                    self.condition.wait()
+            if self.closed:
+                self._drop(item)
+                return False
+            if len(self.items) >= self.capacity:
+                if self.policy == DROP_NEWEST:
+                    self._drop(item)
+                    return False
+                self._drop(self.items.popleft())
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def get(self):
+        """항목을 꺼냅니다. 버퍼가 닫히면 None을 반환합니다."""
+        with self.condition:
+            while not self.items and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        """버퍼를 닫고 남은 항목을 모두 정리합니다. 대기 중인 스레드는 깨어납니다."""
+        with self.condition:
+            self.closed = True
+            while self.items:
+                self._drop(self.items.popleft())
+            self.condition.notify_all()
+
+
+class StageStats:
+    """
+    파이프라인 단계 하나의 처리 횟수와 지연 시간 통계입니다.
+    bucket_counts[i]는 지연 시간이 buckets[i] 이하(이전 경계 초과)인 횟수이고, 마지막 칸은 가장 큰 경계를 넘은 횟수입니다.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total_time += seconds
+        self.last_time = seconds
+        self.max_time = max(self.max_time, seconds)
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    @property
+    def avg_ms(self):
+        return 1000 * self.total_time / self.count if self.count else 0.0
+
+
+class Stage:
+    """
+    inbox에서 항목을 꺼내 fn으로 처리하고 outbox로 넘기는 워커 스레드입니다.
+    fn이 None을 반환하면 그 항목은 다음 단계로 넘기지 않습니다.
+    fn에서 예외가 나면 on_error(item)으로 항목을 정리하고 다음 항목을 계속 처리합니다.
+    """
+    def __init__(self, name, fn, inbox, outbox=None, on_error=None):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.on_error = on_error
+        self.stats = StageStats()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=self.name)
+        self.thread.start()
+
+    def join(self):
+        if self.thread:
+            self.thread.join()
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                break
+            result = self.process(item)
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+
+    def process(self, item):
+        """
+        항목 하나를 처리하고 결과를 반환합니다. 스레드 없이 직접 호출할 수도 있습니다.
+        예외가 나면 on_error(item)을 호출하고 None을 반환합니다.
+        """
+        start = time.monotonic()
+        try:
+            result = self.fn(item)
+        except Exception as e:
+            self.stats.errors += 1
+            sys.stderr.write('Stage %s error: %s\n' % (self.name, e))
+            if self.on_error:
+                self.on_error(item)
+            return None
+        self.stats.record(time.monotonic() - start)
+        return result
+
+    def snapshot(self):
+        """현재 통계를 dict로 반환합니다. depth는 입력 큐에 쌓인 항목 수입니다."""
+        return {
+            'count': self.stats.count,
+            'errors': self.stats.errors,
+            'avg_ms': self.stats.avg_ms,
+            'max_ms': 1000 * self.stats.max_time,
+            'last_ms': 1000 * self.stats.last_time,
+            'depth': len(self.inbox),
+            'dropped': self.inbox.dropped,
+        }
@@ -0,0 +1,94 @@
+import numpy as np
+
+from classifier import WINDOW_SECONDS, KeypointWindow
+
+
+class Track:
+    """
+    추적 중인 사람 한 명의 상태입니다.
+    낙상 판단에 쓰는 최근 키포인트 시계열을 프레임 시각과 함께 KeypointWindow(고정 크기 링 버퍼)에 보관합니다.
+    """
+    def __init__(self, track_id, keypoints, timestamp, window_seconds):
+        self.track_id = track_id
+        # 마지막으로 매칭된 포즈의 키포인트 (17, 3) = (x, y, score)와 그 프레임의 시각
+        self.keypoints = keypoints.copy()
+        self.last_seen = timestamp
+        self.window = KeypointWindow(window_seconds)
+        # 분류기가 마지막으로 계산한 낙상 점수
+        self.score = 0.0
+
+
+class PoseTracker:
+    """
+    프레임 간 포즈를 사람별 트랙에 연결하는 경량 다중 객체 추적기입니다.
+    트랙과 포즈 사이의 거리(양쪽 모두 신뢰도가 충분한 키포인트의 평균 거리)를
+    한 번에 계산한 뒤, 거리가 가까운 쌍부터 탐욕적으로(greedy) 매칭합니다.
+    매칭할 수 있는 최대 거리는 max_distance 픽셀 또는 마지막으로 본 뒤 max_speed(픽셀/초)로 움직일 수 있는
+    거리 중 큰 값이므로, 초당 프레임 수가 낮거나 프레임이 빠져도 빠르게 움직이는(넘어지는) 사람을 놓치지 않습니다.
+    max_age 초 동안 보이지 않은 트랙은 삭제됩니다. (초당 프레임 수와 관계없이 같은 시간)
+    """
+    def __init__(self, window_seconds=WINDOW_SECONDS, max_distance=80.0, max_speed=1200.0,
+                 max_age=2.0, min_score=0.3, max_tracks=20):
+        self.window_seconds = window_seconds
+        self.max_distance = max_distance
+        self.max_speed = max_speed
+        self.max_age = max_age
+        self.min_score = min_score
+        self.max_tracks = max_tracks
+        self.tracks = []
+        self.next_id = 0
+
+    def distances(self, keypoints):
+        """
+        (트랙 수, 포즈 수) 거리 행렬을 계산합니다.
+        공통으로 보이는 키포인트가 없으면 거리는 무한대입니다.
+        """
+        track_keypoints = np.stack([track.keypoints for track in self.tracks])
+        valid = ((track_keypoints[:, None, :, 2] > self.min_score) &
+                 (keypoints[None, :, :, 2] > self.min_score))
+        dist = np.linalg.norm(
+            track_keypoints[:, None, :, :2] - keypoints[None, :, :, :2], axis=-1)
+        count = valid.sum(axis=-1)
+        total = np.where(valid, dist, 0).sum(axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(count > 0, total / count, np.inf)
+
+    def update(self, keypoints, timestamp):
+        """
+        timestamp 시각 프레임의 포즈들(keypoints: (포즈 수, 17, 3) 배열)로 트랙을 갱신하고,
+        각 포즈에 대응하는 Track 리스트를 반환합니다.
+        트랙 수 제한으로 새 트랙을 만들지 못한 포즈는 None입니다.
+        """
+        num_poses = len(keypoints)
+        assigned = [None] * num_poses
+        matched_tracks = set()
+
+        if self.tracks and num_poses:
+            dist = self.distances(keypoints)
+            elapsed = timestamp - np.array([track.last_seen for track in self.tracks])
+            limits = np.maximum(self.max_distance, self.max_speed * elapsed)
+            # 거리가 가까운 (트랙, 포즈) 쌍부터 차례대로 매칭합니다.
+            order = np.argsort(dist, axis=None)
+            for t, p in zip(*np.unravel_index(order, dist.shape)):
+                if dist[t, p] > limits.max():
+                    break
+                if dist[t, p] > limits[t] or t in matched_tracks or assigned[p] is not None:
+                    continue
+                track = self.tracks[t]
+                track.keypoints[:] = keypoints[p]
+                track.last_seen = timestamp
+                matched_tracks.add(t)
+                assigned[p] = track
+
+        # 매칭되지 않은 트랙은 오래되면 제거합니다.
+        self.tracks = [track for track in self.tracks
+                       if timestamp - track.last_seen <= self.max_age]
+
+        # 매칭되지 않은 포즈는 새 트랙으로 등록합니다.
+        for p in range(num_poses):
+            if assigned[p] is None and len(self.tracks) < self.max_tracks:
+                track = Track(self.next_id, keypoints[p], timestamp, self.window_seconds)
+                self.next_id += 1
+                self.tracks.append(track)
+                assigned[p] = track
+        return assigned
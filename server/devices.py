@@ -0,0 +1,285 @@
+"""
+기기(라즈베리파이)들의 하트비트를 받아 최신 상태를 관리하는 기기 레지스트리입니다.
+
+/heartbeat 요청은 메모리에 있는 기기 상태만 바꾸고 바로 응답합니다. DB(device 테이블)에는
+백그라운드 스레드가 flush_interval초마다 바뀐 기기들을 트랜잭션 하나로 묶어서 기록하므로,
+수백 대가 몇 초마다 보내도 DB 쓰기 횟수는 기기 수나 하트비트 빈도와 관계없이 일정합니다.
+
+같은 스레드가 stale_after초 동안 하트비트가 없거나 카메라 입력이 멈춘 기기를 찾아 알림('stale')을 보내고,
+그 기기가 다시 정상으로 하트비트를 보내면 알림('recovered')을 보냅니다.
+
+서버 프로세스가 여러 개이면 하트비트가 프로세스마다 나뉘어 들어오므로, 기록할 때마다 DB에서 다른 프로세스가
+기록한 더 최신 상태를 읽어 합칩니다. stale 표시는 DB의 조건부 UPDATE로 바꾸므로 알림은 한 프로세스만 보냅니다.
+"""
+import datetime
+import json
+import threading
+import time
+
+import sqlalchemy
+
+# 바뀐 상태를 DB에 기록하고 stale 기기를 찾는 간격(초)입니다.
+FLUSH_INTERVAL = 5.0
+# 이 시간(초) 동안 하트비트가 없거나 카메라에서 프레임이 들어오지 않으면 stale로 판단합니다.
+STALE_AFTER = 60.0
+# 저장하는 하트비트 본문의 최대 크기(바이트)입니다.
+MAX_STATUS_BYTES = 16 * 1024
+
+
+def to_datetime(epoch):
+    """epoch 초를 DB에 저장하는 UTC datetime(시간대 정보 없음)으로 바꿉니다."""
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).replace(tzinfo=None)
+
+
+def to_epoch(value):
+    return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError, OverflowError):
+        return cast(0)
+
+
+class DeviceState:
+    """기기 한 대의 최신 상태입니다. 시각은 모두 epoch 초입니다."""
+    def __init__(self, device_id, first_seen):
+        self.device_id = device_id
+        self.first_seen = first_seen
+        self.last_seen = first_seen
+        # 모든 카메라에서 프레임이 들어오고 있던 마지막 시각
+        self.last_active = first_seen
+        self.fps = 0.0
+        self.model = None
+        self.backend = None
+        self.errors = 0
+        self.dropped = 0
+        self.uptime = 0.0
+        self.status = {}
+        self.stale = False
+
+    def update(self, status, now):
+        """하트비트 본문(metrics.py의 Metrics.snapshot())으로 상태를 갱신합니다."""
+        self.last_seen = now
+        cameras = status.get('cameras')
+        if not isinstance(cameras, list) or all(
+                isinstance(camera, dict) and number(camera.get('capture_fps')) > 0
+                for camera in cameras):
+            self.last_active = now
+        self.fps = number(status.get('fps'))
+        self.model = str(status['model'])[:32] if status.get('model') else None
+        self.backend = str(status['backend'])[:16] if status.get('backend') else None
+        self.errors = number(status.get('errors'), int)
+        self.dropped = number(status.get('dropped'), int)
+        self.uptime = number(status.get('uptime'))
+        self.status = status
+
+    def load(self, row):
+        """DB 행(Device)의 값으로 상태를 바꿉니다."""
+        self.first_seen = to_epoch(row.first_seen)
+        self.last_seen = to_epoch(row.last_seen)
+        self.last_active = to_epoch(row.last_active)
+        self.fps = row.fps
+        self.model = row.model
+        self.backend = row.backend
+        self.errors = row.errors
+        self.dropped = row.dropped
+        self.uptime = row.uptime
+        self.status = json.loads(row.status) if row.status else {}
+        self.stale = row.stale
+
+    def params(self):
+        status = json.dumps(self.status, ensure_ascii=False)
+        return {
+            'device_id': self.device_id,
+            'first_seen': to_datetime(self.first_seen),
+            'last_seen': to_datetime(self.last_seen),
+            'last_active': to_datetime(self.last_active),
+            'fps': self.fps,
+            'model': self.model,
+            'backend': self.backend,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'uptime': self.uptime,
+            'status': status if len(status) <= MAX_STATUS_BYTES else '{}',
+        }
+
+    def to_dict(self, now):
+        return {
+            'device_id': self.device_id,
+            'first_seen': to_datetime(self.first_seen).isoformat() + 'Z',
+            'last_seen': to_datetime(self.last_seen).isoformat() + 'Z',
+            'seconds_since_seen': max(now - self.last_seen, 0.0),
+            'fps': self.fps,
+            'model': self.model,
+            'backend': self.backend,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'uptime': self.uptime,
+            'stale': self.stale,
+            'cameras': self.status.get('cameras', []),
+            'temperatures': self.status.get('temperatures', {}),
+            'outbox': self.status.get('outbox'),
+        }
+
+
+# 바뀐 기기 상태를 한 번에 기록합니다. 다른 프로세스가 더 최신 하트비트를 기록했으면 덮어쓰지 않습니다.
+UPSERT = sqlalchemy.text("""
+    INSERT INTO device (device_id, first_seen, last_seen, last_active, fps, model, backend,
+                        errors, dropped, uptime, status, stale)
+    VALUES (:device_id, :first_seen, :last_seen, :last_active, :fps, :model, :backend,
+            :errors, :dropped, :uptime, :status, :stale)
+    ON CONFLICT (device_id) DO UPDATE SET
+        last_seen = excluded.last_seen, last_active = excluded.last_active, fps = excluded.fps,
+        model = excluded.model, backend = excluded.backend, errors = excluded.errors,
+        dropped = excluded.dropped, uptime = excluded.uptime, status = excluded.status,
+        stale = excluded.stale
+    WHERE excluded.last_seen >= device.last_seen""").bindparams(
+    *(sqlalchemy.bindparam(name, type_=sqlalchemy.DateTime)
+      for name in ('first_seen', 'last_seen', 'last_active')),
+    sqlalchemy.bindparam('stale', type_=sqlalchemy.Boolean))
+
+# stale로 표시합니다. 다른 프로세스가 이미 표시했거나 그 사이에 하트비트가 기록되었으면 바꾸지 않습니다.
+MARK_STALE = sqlalchemy.text("""
+    UPDATE device SET stale = :stale
+    WHERE device_id = :device_id AND stale = :fresh AND (last_seen <= :cutoff OR last_active <= :cutoff)
+""").bindparams(sqlalchemy.bindparam('cutoff', type_=sqlalchemy.DateTime),
+                sqlalchemy.bindparam('stale', type_=sqlalchemy.Boolean),
+                sqlalchemy.bindparam('fresh', type_=sqlalchemy.Boolean))
+
+
+class DeviceRegistry:
+    """
+    기기 상태를 메모리에 보관하고 주기적으로 DB에 기록하는 레지스트리입니다.
+    notifier(notifier.py의 Notifier)로 stale/recovered 알림을 보내고,
+    on_update(state_dict)는 기기 상태가 stale/정상으로 바뀔 때 호출됩니다.
+    """
+    def __init__(self, app, db, model, notifier=None, flush_interval=FLUSH_INTERVAL,
+                 stale_after=STALE_AFTER, on_update=None):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.notifier = notifier
+        self.flush_interval = flush_interval
+        self.stale_after = stale_after
+        self.on_update = on_update
+        self.devices = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.started = time.time()
+        self.beats = 0
+        self.flushes = 0
+
+    def beat(self, device_id, status):
+        """하트비트 하나를 반영합니다. 요청 핸들러에서 호출하며 DB에 접근하지 않습니다."""
+        now = time.time()
+        with self.lock:
+            state = self.devices.get(device_id)
+            if state is None:
+                state = self.devices[device_id] = DeviceState(device_id, now)
+            state.update(status, now)
+            self.dirty.add(device_id)
+            self.beats += 1
+            recovered = state.stale and state.last_active == now
+            if recovered:
+                state.stale = False
+        if recovered:
+            self.changed(state, 'recovered', '기기 %s 정상 동작' % device_id, now)
+
+    def snapshot(self):
+        """모든 기기의 상태를 dict 목록으로 반환합니다. (기기 id 순)"""
+        now = time.time()
+        with self.lock:
+            return [self.devices[device_id].to_dict(now) for device_id in sorted(self.devices)]
+
+    def changed(self, state, kind, text, now):
+        if self.notifier:
+            self.notifier.notify(kind, text)
+        if self.on_update:
+            try:
+                self.on_update(state.to_dict(now))
+            except Exception as e:
+                print(f"기기 상태 알림 실패 ({state.device_id}): {e}")
+
+    def load(self):
+        """DB에 기록된 기기들을 불러옵니다. 다른 프로세스가 기록한 더 최신 상태도 반영합니다."""
+        rows = self.db.session.query(self.model).all()
+        with self.lock:
+            for row in rows:
+                state = self.devices.get(row.device_id)
+                if state is None:
+                    state = self.devices[row.device_id] = DeviceState(row.device_id, 0.0)
+                    state.load(row)
+                elif row.device_id not in self.dirty:
+                    if to_epoch(row.last_seen) > state.last_seen:
+                        state.load(row)
+                    elif to_epoch(row.last_seen) == state.last_seen:
+                        state.stale = row.stale
+
+    def flush(self):
+        """바뀐 기기 상태를 DB에 기록합니다."""
+        with self.lock:
+            params = [self.devices[device_id].params() for device_id in self.dirty]
+            stale = {device_id: self.devices[device_id].stale for device_id in self.dirty}
+            self.dirty.clear()
+        if not params:
+            return
+        for row in params:
+            row['stale'] = stale[row['device_id']]
+        try:
+            self.db.session.execute(UPSERT, params)
+            self.db.session.commit()
+            self.flushes += 1
+        except Exception:
+            self.db.session.rollback()
+            # 다음 기록 때 다시 시도합니다.
+            with self.lock:
+                self.dirty.update(stale)
+            raise
+
+    def check(self):
+        """stale_after초 동안 하트비트가 없거나 카메라 입력이 멈춘 기기를 stale로 표시하고 알립니다."""
+        now = time.time()
+        # 서버가 막 시작했으면 그동안 하트비트를 받지 못했으므로 시작 시각부터 셉니다.
+        cutoff = now - self.stale_after
+        with self.lock:
+            candidates = [state for state in self.devices.values()
+                          if not state.stale and self.started < cutoff
+                          and (state.last_seen < cutoff or state.last_active < cutoff)]
+        for state in candidates:
+            result = self.db.session.execute(MARK_STALE, {
+                'device_id': state.device_id, 'cutoff': to_datetime(cutoff),
+                'stale': True, 'fresh': False})
+            self.db.session.commit()
+            with self.lock:
+                # 확인하는 사이에 하트비트가 들어왔으면 stale이 아닙니다.
+                state.stale = state.last_seen < cutoff or state.last_active < cutoff
+            if result.rowcount != 1 or not state.stale:
+                # 다른 프로세스가 이미 알렸거나, 아직 기록되지 않은 하트비트가 있습니다.
+                continue
+            if state.last_seen < cutoff:
+                text = '기기 %s 응답 없음 %d초' % (state.device_id, now - state.last_seen)
+            else:
+                text = '기기 %s 카메라 입력 없음 %d초' % (state.device_id, now - state.last_active)
+            print(text)
+            self.changed(state, 'stale', text, now)
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+                    self.load()
+                    self.check()
+            except Exception as e:
+                print(f"기기 상태 기록 중 오류: {e}")
+
+    def start(self):
+        """DB에 기록된 기기를 불러오고 기록 스레드를 시작합니다."""
+        with self.app.app_context():
+            self.load()
+        self.thread = threading.Thread(target=self.run, name='devices', daemon=True)
+        self.thread.start()
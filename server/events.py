@@ -0,0 +1,93 @@
+"""
+브라우저에 새 낙상 이미지, 메모 수정, 업로드 상태 변경을 실시간으로 보내는 이벤트 허브입니다. (Server-Sent Events)
+
+이벤트는 발행할 때 SSE 메시지 문자열로 한 번만 만들어 최근 replay_size개를 보관하는 링 버퍼에 넣습니다.
+구독자(브라우저 연결)마다 큐를 두지 않고, 각 연결이 마지막으로 받은 id 이후의 이벤트를 링 버퍼에서 읽으므로
+보는 사람이 많아도 발행 비용은 늘지 않습니다. 재연결한 브라우저는 Last-Event-ID 이후의 이벤트부터 받으며,
+그 이벤트가 이미 링 버퍼에서 밀려났으면 'reset' 이벤트를 받고 목록을 처음부터 다시 불러옵니다.
+"""
+import collections
+import json
+import threading
+import time
+
+# 재연결한 브라우저에 다시 보내기 위해 보관하는 최근 이벤트 수입니다.
+REPLAY_SIZE = 1000
+# 이벤트가 없을 때 연결이 끊기지 않도록 보내는 주석 메시지의 간격(초)입니다.
+KEEPALIVE_INTERVAL = 15.0
+# 연결 하나를 유지하는 최대 시간(초)입니다. 끝나면 브라우저가 마지막 id로 다시 연결합니다.
+# (요청 스레드 하나를 계속 차지하므로, 닫힌 탭의 연결이 오래 남지 않게 합니다.)
+MAX_STREAM_SECONDS = 300.0
+# 동시에 유지할 최대 연결 수입니다. 넘으면 서버가 503으로 응답하고 브라우저는 잠시 후 다시 연결합니다.
+MAX_SUBSCRIBERS = 8
+# 브라우저가 연결이 끊겼을 때 다시 연결하기까지 기다리는 시간(밀리초)입니다.
+RETRY_MILLIS = 3000
+
+
+class EventHub:
+    def __init__(self, replay_size=REPLAY_SIZE, max_subscribers=MAX_SUBSCRIBERS):
+        self.events = collections.deque(maxlen=replay_size)
+        self.condition = threading.Condition()
+        # 서버를 다시 시작해도 id가 줄어들지 않도록 시작 시각(밀리초)부터 셉니다.
+        self.last_id = int(time.time() * 1000)
+        self.max_subscribers = max_subscribers
+        self.subscribers = 0
+
+    def publish(self, event_type, data):
+        """이벤트를 발행합니다. 요청 핸들러나 워커 스레드에서 호출하며 기다리지 않습니다."""
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        with self.condition:
+            self.last_id += 1
+            message = f"id: {self.last_id}\nevent: {event_type}\ndata: {payload}\n\n"
+            self.events.append((self.last_id, message))
+            self.condition.notify_all()
+
+    def since(self, last_id):
+        """
+        last_id 이후의 (id, 메시지) 목록을 반환합니다. condition을 잡은 상태에서 호출합니다.
+        그 사이의 이벤트가 링 버퍼에서 밀려났으면 None을 반환합니다.
+        """
+        oldest = self.events[0][0] if self.events else self.last_id + 1
+        if last_id < oldest - 1:
+            return None
+        if last_id > self.last_id:
+            # 이전 서버 실행에서 받은 id처럼 알 수 없는 id입니다.
+            return None
+        return [(event_id, message) for event_id, message in self.events if event_id > last_id]
+
+    def acquire(self):
+        """새 연결을 받을 수 있으면 True를 반환합니다. 응답이 닫히면 release()를 호출해야 합니다."""
+        with self.condition:
+            if self.subscribers >= self.max_subscribers:
+                return False
+            self.subscribers += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.subscribers -= 1
+
+    def stream(self, last_id=None, keepalive=KEEPALIVE_INTERVAL, max_seconds=MAX_STREAM_SECONDS):
+        """
+        SSE 응답 본문을 만드는 제너레이터입니다. last_id가 없으면 지금 이후의 이벤트만 보냅니다.
+        """
+        with self.condition:
+            if last_id is None:
+                last_id = self.last_id
+        yield f"retry: {RETRY_MILLIS}\n\n"
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            with self.condition:
+                self.condition.wait_for(lambda: self.last_id != last_id,
+                                        timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+                pending = self.since(last_id)
+                current = self.last_id
+            if pending is None:
+                # 놓친 이벤트를 보낼 수 없으므로 처음부터 다시 불러오게 합니다.
+                last_id = current
+                yield f"id: {last_id}\nevent: reset\ndata: {{}}\n\n"
+            elif pending:
+                last_id = pending[-1][0]
+                yield ''.join(message for _, message in pending)
+            else:
+                yield ': keepalive\n\n'
@@ -0,0 +1,32 @@
+"""
+gunicorn 설정입니다. (wsgi.py 참고)
+
+요청은 대부분 DB와 디스크 입출력을 기다리므로 프로세스 하나에서 여러 스레드(gthread)로 처리합니다.
+업로드 워커, 알림 묶음 전송, 통계 캐시, 실시간 이벤트(/events)는 프로세스 안에 있으므로 프로세스를 늘리면
+프로세스마다 따로 동작합니다. (같은 이미지를 두 번 올려도 결과는 같지만, 알림 간격은 프로세스별로 적용됨)
+"""
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+# /events(SSE) 연결은 요청 스레드 하나를 계속 차지합니다. 갤러리를 보는 사람이 많으면
+# gevent 워커(pip install gevent)를 사용하고 EVENTS_MAX_SUBSCRIBERS를 늘리세요.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# 요청 스레드 수입니다. server.py의 DB 연결 풀(DB_POOL_SIZE + DB_MAX_OVERFLOW)이
+# 이 값과 업로드 워커 수(INGEST_WORKERS)를 더한 것보다 커야 연결을 기다리지 않습니다.
+threads = int(os.getenv('GUNICORN_THREADS', '12'))
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def on_starting(server):
+    """워커를 만들기 전에 마스터 프로세스에서 DB 마이그레이션을 한 번 실행합니다."""
+    from migrate import migrate
+    from server import app, db
+
+    with app.app_context():
+        migrate(db)
+        # 마스터가 연 연결을 워커 프로세스들이 물려받지 않도록 닫습니다.
+        db.engine.dispose()
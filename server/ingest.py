@@ -0,0 +1,154 @@
+"""
+업로드 이미지를 비동기로 저장소에 올리는 수집(ingestion) 파이프라인입니다.
+
+/upload 핸들러는 이미지를 로컬 스풀 디렉터리에 저장하고 DB 행을 'pending' 상태로 커밋한 뒤
+바로 응답하며, 저장소(S3 등) 업로드는 이 모듈의 워커 스레드들이 처리합니다.
+
+업로드 전에 갤러리용 썸네일과 미리보기 이미지(thumbnails.py)를 만들어 원본과 함께 올립니다.
+
+상태 전이: pending -> stored (업로드 성공, 스풀 파일 삭제)
+           pending -> failed (재시도를 모두 실패, 스풀 파일은 남겨 두고 서버 재시작 때 다시 시도)
+"""
+import datetime
+import os
+import queue
+import threading
+import time
+
+from thumbnails import make_variants, variant_key
+
+# 업로드 한 건의 최대 시도 횟수와 첫 재시도 대기 시간(초)입니다. 재시도마다 두 배로 늘어납니다.
+MAX_ATTEMPTS = 4
+RETRY_DELAY = 1.0
+# 큐가 비어 있을 때 이 간격(초)마다 큐에 들어가지 못한 pending 행을 다시 찾습니다.
+SWEEP_INTERVAL = 30.0
+
+
+class Ingestor:
+    """
+    크기가 제한된 작업 큐와 고정된 수의 워커 스레드로 저장소 업로드를 수행합니다.
+    큐가 가득 차서 넣지 못한 작업은 DB에 pending으로 남아 있다가, 워커가 한가할 때 다시 큐에 넣습니다.
+    on_update(item)는 업로드 상태가 바뀔 때마다 애플리케이션 컨텍스트 안에서 호출됩니다.
+    """
+    def __init__(self, app, db, model, storage, spool_dir, workers=4, max_queue=256, on_update=None):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.storage = storage
+        self.spool_dir = os.path.abspath(spool_dir)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.workers = workers
+        self.on_update = on_update
+        self.jobs = queue.Queue(maxsize=max_queue)
+        # 큐에 있거나 처리 중인 행 id. 같은 행이 두 번 큐에 들어가지 않게 합니다.
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.stored = 0
+        self.failed = 0
+
+    def spool_path(self, key):
+        return os.path.join(self.spool_dir, key)
+
+    def spool(self, key, file):
+        """요청으로 받은 파일(werkzeug FileStorage)을 스풀 디렉터리에 저장합니다."""
+        path = self.spool_path(key)
+        file.save(path)
+        return path
+
+    def submit(self, item_id):
+        """업로드 작업을 큐에 넣습니다. 큐가 가득 찼으면 False를 반환합니다. (pending으로 남음)"""
+        with self.lock:
+            if item_id in self.in_flight:
+                return True
+            try:
+                self.jobs.put_nowait(item_id)
+            except queue.Full:
+                return False
+            self.in_flight.add(item_id)
+            return True
+
+    def requeue(self, statuses=('pending',)):
+        """주어진 상태의 행들을 다시 큐에 넣고, 넣은 개수를 반환합니다."""
+        with self.app.app_context():
+            ids = [row.id for row in self.db.session.query(self.model.id)
+                   .filter(self.model.status.in_(statuses))
+                   .order_by(self.model.id).all()]
+        return sum(self.submit(item_id) for item_id in ids)
+
+    def start(self):
+        """워커를 시작하고, 이전 실행에서 끝나지 않은(pending/failed) 업로드를 다시 시도합니다."""
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.run, name='ingest-%d' % i, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.requeue(('pending', 'failed'))
+
+    def run(self):
+        while True:
+            try:
+                item_id = self.jobs.get(timeout=SWEEP_INTERVAL)
+            except queue.Empty:
+                self.requeue()
+                continue
+            try:
+                self.process(item_id)
+            except Exception as e:
+                print(f"업로드 작업 처리 중 오류 (id={item_id}): {e}")
+            finally:
+                with self.lock:
+                    self.in_flight.discard(item_id)
+
+    def process(self, item_id):
+        with self.app.app_context():
+            item = self.db.session.get(self.model, item_id)
+            if item is None or item.status == 'stored':
+                return
+            key = item.storage_key
+
+        path = self.spool_path(key)
+        try:
+            variants = make_variants(path)
+        except OSError as e:
+            # 이미지를 읽을 수 없으면 작은 이미지 없이 원본만 올립니다. (갤러리는 원본을 보여 줌)
+            print(f"썸네일 생성 실패 ({key}): {e}")
+            variants = {}
+        # 원본을 마지막에 올리므로, stored 상태이면 작은 이미지도 모두 올라가 있습니다.
+        uploads = [(variant_key(key, variant), variant_path)
+                   for variant, variant_path in variants.items()]
+        uploads.append((key, path))
+
+        error = None
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            try:
+                # 이미 올린 파일은 재시도할 때 다시 올리지 않습니다.
+                while uploads:
+                    upload_key, upload_path = uploads[0]
+                    self.storage.put(upload_key, upload_path, 'image/jpeg')
+                    uploads.pop(0)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                print(f"저장소 업로드 실패 ({upload_key}, {attempt + 1}/{MAX_ATTEMPTS}): {e}")
+
+        with self.app.app_context():
+            item = self.db.session.get(self.model, item_id)
+            item.attempts += attempt + 1
+            item.status = 'failed' if error else 'stored'
+            item.thumbnails = bool(variants)
+            item.updated_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            self.db.session.commit()
+            if self.on_update:
+                try:
+                    self.on_update(item)
+                except Exception as e:
+                    print(f"업로드 상태 알림 실패 (id={item_id}): {e}")
+        if error:
+            self.failed += 1
+        else:
+            self.stored += 1
+            for spooled in [path, *variants.values()]:
+                os.remove(spooled)
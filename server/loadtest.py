@@ -0,0 +1,181 @@
+"""
+서버의 주요 API(/upload, /gallery, /memo, /stats/data, /heartbeat)에 동시에 요청을 보내서
+API별 처리량(요청/초)과 지연 시간(p50, p99)을 측정하는 부하 테스트 도구입니다.
+
+테스트용 이미지가 DB와 저장소에 저장되고 알림도 보내지므로, 운영 서버가 아닌
+테스트 서버(예: STORAGE_BACKEND=local NOTIFY_CHANNELS=mock)를 대상으로 실행하세요.
+
+사용 예:
+    python3 loadtest.py --url http://localhost:5000 --duration 30 --concurrency 16
+    python3 loadtest.py --mix gallery=8 stats=2 --duration 10
+    python3 loadtest.py --mix heartbeat --duration 10   # 기기 수백 대의 하트비트
+(하트비트 테스트의 가상 기기들은 테스트가 끝나면 응답 없음(stale) 알림 대상이 됩니다.)
+"""
+import argparse
+import collections
+import io
+import random
+import threading
+import time
+
+import numpy as np
+import requests
+from PIL import Image
+
+# API별 기본 요청 비율입니다. 갤러리 조회가 가장 많고, 업로드는 낙상이 감지될 때만 옵니다.
+DEFAULT_MIX = {'upload': 1, 'gallery': 6, 'memo': 1, 'stats': 2}
+# --mix로 지정할 수 있는 API입니다.
+APIS = ('upload', 'gallery', 'memo', 'stats', 'heartbeat')
+# 부하 테스트 이미지가 실제 이미지와 구분되도록 사용하는 카메라 번호입니다.
+LOADTEST_CAMERA_ID = 99
+# 하트비트를 보내는 가상 기기 수입니다.
+LOADTEST_DEVICES = 300
+
+
+def make_jpeg(width=640, height=480):
+    """카메라 프레임과 비슷한 크기의 테스트 JPEG 이미지를 만듭니다."""
+    image = np.random.randint(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(image).resize((width, height)).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float('nan')
+
+
+class LoadTest:
+    def __init__(self, url, mix, jpeg, timeout=30):
+        self.url = url.rstrip('/')
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.jpeg = jpeg
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        # /memo에 사용할 이미지 URL (갤러리 응답에서 모음)
+        self.memo_urls = []
+
+    def upload(self, session):
+        # 같은 시각이 겹치면 중복으로 처리되므로 지난 하루 안의 임의의 시각(밀리초 단위)을 사용합니다.
+        captured_at = time.time() - random.uniform(0, 86400)
+        return session.post(self.url + '/upload', files={
+            'image0': ('loadtest.jpg', self.jpeg, 'image/jpeg'),
+        }, data={
+            'camera_id': LOADTEST_CAMERA_ID,
+            'device_id': 'loadtest',
+            'captured_at': ['%.3f' % captured_at],
+            'event': ['1'],
+        }, timeout=self.timeout)
+
+    def gallery(self, session):
+        response = session.get(self.url + '/gallery', params={'limit': 30}, timeout=self.timeout)
+        if response.ok:
+            urls = [item['url'] for item in response.json()['items']]
+            if urls:
+                with self.lock:
+                    self.memo_urls = urls
+        return response
+
+    def memo(self, session):
+        with self.lock:
+            urls = self.memo_urls
+        if not urls:
+            return self.gallery(session)
+        return session.post(self.url + '/memo', json={
+            'url': random.choice(urls), 'memo': 'loadtest %d' % random.randrange(1000),
+        }, timeout=self.timeout)
+
+    def stats(self, session):
+        return session.get(self.url + '/stats/data', params={
+            'granularity': random.choice(['day', 'week', 'hour']),
+        }, timeout=self.timeout)
+
+    def heartbeat(self, session):
+        device = random.randrange(LOADTEST_DEVICES)
+        return session.post(self.url + '/heartbeat', json={
+            'device_id': 'loadtest-%03d' % device,
+            'uptime': time.monotonic(),
+            'fps': random.uniform(10, 15),
+            'errors': 0,
+            'dropped': random.randrange(10),
+            'backend': 'edgetpu',
+            'model': '641x481',
+            'cameras': [{'camera_id': 0, 'fps': 12.0, 'capture_fps': 30.0}],
+            'temperatures': {'cpu': random.uniform(45, 70)},
+        }, timeout=self.timeout)
+
+    def worker(self, deadline):
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            name = random.choices(self.names, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                response = getattr(self, name)(session)
+                ok = response.status_code < 400
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies[name].append(elapsed)
+                if not ok:
+                    self.errors[name] += 1
+
+    def run(self, duration, concurrency):
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=self.worker, args=(deadline,))
+                   for _ in range(concurrency)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - start
+
+    def report(self, elapsed):
+        print('%-8s %8s %8s %10s %10s %10s' % ('API', '요청', '오류', '요청/초', 'p50(ms)', 'p99(ms)'))
+        total = 0
+        for name in self.names:
+            values = self.latencies[name]
+            total += len(values)
+            print('%-8s %8d %8d %10.1f %10.1f %10.1f' % (
+                name, len(values), self.errors[name], len(values) / elapsed,
+                percentile(values, 50) * 1000, percentile(values, 99) * 1000))
+        all_values = [value for values in self.latencies.values() for value in values]
+        print('%-8s %8d %8d %10.1f %10.1f %10.1f' % (
+            '전체', total, sum(self.errors.values()), total / elapsed,
+            percentile(all_values, 50) * 1000, percentile(all_values, 99) * 1000))
+
+
+def parse_mix(values):
+    mix = {}
+    for value in values:
+        name, _, weight = value.partition('=')
+        if name not in APIS:
+            raise ValueError('Unknown API: %s' % name)
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--url', help='서버 주소', default='http://localhost:5000')
+    parser.add_argument('--duration', help='측정 시간(초)', type=float, default=30)
+    parser.add_argument('--concurrency', help='동시에 요청을 보내는 클라이언트 수', type=int, default=16)
+    parser.add_argument('--mix', help='API별 요청 비율 (예: upload=1 gallery=6 memo=1 stats=2)',
+                        nargs='+', default=['%s=%g' % item for item in DEFAULT_MIX.items()])
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    test = LoadTest(args.url, mix, make_jpeg())
+    elapsed = test.run(args.duration, args.concurrency)
+    test.report(elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+gallery.db 스키마 마이그레이션입니다.
+
+SQLite의 PRAGMA user_version에 스키마 버전을 기록하고, 서버가 시작될 때
+아직 적용되지 않은 마이그레이션을 순서대로 적용합니다.
+새로 만드는 DB는 db.create_all()이 최신 스키마로 만들므로 마이그레이션 없이 최신 버전으로 기록됩니다.
+
+직접 실행할 수도 있습니다:
+    python3 migrate.py
+"""
+import datetime
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.exec_driver_sql('PRAGMA table_info(%s)' % table)}
+
+
+def add_column(conn, table, column, definition):
+    if column not in table_columns(conn, table):
+        conn.exec_driver_sql('ALTER TABLE %s ADD COLUMN %s %s' % (table, column, definition))
+
+
+def migration_1(conn):
+    """
+    문자열 timestamp('%Y-%m-%d_%H-%M-%S', UTC) 대신 정렬/필터에 쓸 UTC datetime(created_at)과
+    KST 표시용 값(local_date, display_time), 카메라/기기 열, 수정 시각(updated_at)을 추가합니다.
+    기존 행은 SQL로 한 번에 채웁니다. (한국 시간은 서머타임이 없으므로 +9시간으로 계산)
+    """
+    add_column(conn, 'gallery', 'created_at', "DATETIME NOT NULL DEFAULT ''")
+    add_column(conn, 'gallery', 'local_date', "VARCHAR(10) NOT NULL DEFAULT ''")
+    add_column(conn, 'gallery', 'display_time', "VARCHAR(40) NOT NULL DEFAULT ''")
+    add_column(conn, 'gallery', 'camera_id', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(conn, 'gallery', 'device_id', 'VARCHAR(64)')
+    add_column(conn, 'gallery', 'updated_at', "DATETIME NOT NULL DEFAULT ''")
+    # SQLAlchemy가 SQLite에 저장하는 datetime 형식('YYYY-MM-DD HH:MM:SS.ffffff')에 맞춥니다.
+    conn.exec_driver_sql("""
+        UPDATE gallery SET created_at =
+            substr(timestamp, 1, 10) || ' ' || replace(substr(timestamp, 12, 8), '-', ':') || '.000000'
+        WHERE created_at = ''""")
+    conn.exec_driver_sql("""
+        UPDATE gallery SET
+            local_date = date(substr(created_at, 1, 19), '+9 hours'),
+            display_time = strftime('%Y년 %m월 %d일 %H:%M:%S KST', substr(created_at, 1, 19), '+9 hours'),
+            updated_at = created_at
+        WHERE local_date = ''""")
+    # 문자열 timestamp 기준 인덱스는 더 이상 쓰지 않습니다.
+    conn.exec_driver_sql('DROP INDEX IF EXISTS ix_gallery_timestamp_id')
+
+
+def migration_2(conn):
+    """
+    낙상 순간 이미지와 전후 장면을 구분하는 event 열과, 통계 집계 테이블(stats_rollup)을 추가하고
+    기존 이벤트로 집계를 채웁니다. 구간은 KST 기준 일(day), 주(week, 월요일 시작), 시간(hour)입니다.
+    """
+    add_column(conn, 'gallery', 'event', 'BOOLEAN NOT NULL DEFAULT 1')
+    conn.exec_driver_sql(
+        "UPDATE gallery SET event = 0 WHERE memo = '[자동 감지] 낙상 전후 장면'")
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS stats_rollup (
+            granularity VARCHAR(8) NOT NULL,
+            bucket VARCHAR(13) NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (granularity, bucket)
+        )""")
+    conn.exec_driver_sql('DELETE FROM stats_rollup')
+    conn.exec_driver_sql("""
+        INSERT INTO stats_rollup (granularity, bucket, count)
+        SELECT 'day', local_date, count(*) FROM gallery WHERE event GROUP BY local_date""")
+    conn.exec_driver_sql("""
+        INSERT INTO stats_rollup (granularity, bucket, count)
+        SELECT 'week', date(local_date, 'weekday 0', '-6 days') AS week, count(*)
+        FROM gallery WHERE event GROUP BY week""")
+    conn.exec_driver_sql("""
+        INSERT INTO stats_rollup (granularity, bucket, count)
+        SELECT 'hour', local_date || ' ' || strftime('%H', substr(created_at, 1, 19), '+9 hours') AS hour,
+               count(*)
+        FROM gallery WHERE event GROUP BY hour""")
+
+
+def migration_3(conn):
+    """
+    비동기 업로드를 위해 저장소 안의 이미지 이름(storage_key), 업로드 상태(status), 시도 횟수(attempts)를
+    추가합니다. 기존 이미지는 모두 S3에 업로드된 상태(stored)이며, 이름은 URL의 마지막 부분입니다.
+    """
+    add_column(conn, 'gallery', 'storage_key', 'VARCHAR(200)')
+    add_column(conn, 'gallery', 'status', "VARCHAR(10) NOT NULL DEFAULT 'stored'")
+    add_column(conn, 'gallery', 'attempts', 'INTEGER NOT NULL DEFAULT 0')
+    conn.exec_driver_sql("""
+        UPDATE gallery SET storage_key = replace(url, rtrim(url, replace(url, '/', '')), '')
+        WHERE storage_key IS NULL""")
+
+
+def migration_4(conn):
+    """
+    갤러리용 썸네일/미리보기 이미지가 저장소에 있는지 나타내는 thumbnails 열을 추가합니다.
+    기존 이미지에는 작은 이미지가 없으므로 갤러리는 원본을 계속 보여 줍니다.
+    """
+    add_column(conn, 'gallery', 'thumbnails', 'BOOLEAN NOT NULL DEFAULT 0')
+
+
+def migration_5(conn):
+    """
+    기기별 최신 하트비트 상태를 저장하는 device 테이블을 추가합니다. (devices.py)
+    """
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS device (
+            device_id VARCHAR(64) NOT NULL PRIMARY KEY,
+            first_seen DATETIME NOT NULL,
+            last_seen DATETIME NOT NULL,
+            last_active DATETIME NOT NULL,
+            fps FLOAT NOT NULL DEFAULT 0,
+            model VARCHAR(32),
+            backend VARCHAR(16),
+            errors INTEGER NOT NULL DEFAULT 0,
+            dropped INTEGER NOT NULL DEFAULT 0,
+            uptime FLOAT NOT NULL DEFAULT 0,
+            status TEXT,
+            stale BOOLEAN NOT NULL DEFAULT 0
+        )""")
+
+
+def migration_6(conn):
+    """
+    같은 기기의 이어진 업로드를 묶는 사건(incident) 테이블과 gallery의 incident_id, phash 열을 추가합니다.
+    기존 이미지는 기기별 촬영 순서로 60초(INCIDENT_WINDOW 기본값) 안에 이어진 것끼리 사건으로 묶고,
+    통계 집계(stats_rollup)를 이미지 수 대신 사건 수로 다시 만듭니다. 기존 이미지의 해시는 계산하지 않습니다.
+    """
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS incident (
+            id INTEGER NOT NULL PRIMARY KEY,
+            device_id VARCHAR(64),
+            camera_id INTEGER NOT NULL DEFAULT 0,
+            started_at DATETIME NOT NULL,
+            ended_at DATETIME NOT NULL,
+            cover_id INTEGER,
+            occurred_at DATETIME,
+            local_date VARCHAR(10),
+            display_time VARCHAR(40),
+            event_count INTEGER NOT NULL DEFAULT 0,
+            image_count INTEGER NOT NULL DEFAULT 0,
+            duplicates INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL
+        )""")
+    add_column(conn, 'gallery', 'incident_id', 'INTEGER')
+    add_column(conn, 'gallery', 'phash', 'VARCHAR(16)')
+
+    window = datetime.timedelta(seconds=60)
+    rows = conn.exec_driver_sql("""
+        SELECT id, device_id, camera_id, created_at, event, local_date, display_time, updated_at
+        FROM gallery WHERE incident_id IS NULL
+        ORDER BY coalesce(device_id, ''), device_id IS NULL, created_at, id""").fetchall()
+    groups = []
+    for row in rows:
+        previous = groups[-1][-1] if groups else None
+        if (previous is None or previous.device_id != row.device_id
+                or datetime.datetime.fromisoformat(row.created_at)
+                - datetime.datetime.fromisoformat(previous.created_at) > window):
+            groups.append([])
+        groups[-1].append(row)
+
+    for group in groups:
+        first = group[0]
+        cover = next((row for row in group if row.event), None)
+        incident_id = conn.exec_driver_sql("""
+            INSERT INTO incident (device_id, camera_id, started_at, ended_at, cover_id, occurred_at,
+                                  local_date, display_time, event_count, image_count, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", (
+            first.device_id, first.camera_id, first.created_at, group[-1].created_at,
+            cover.id if cover else None, cover.created_at if cover else None,
+            cover.local_date if cover else None, cover.display_time if cover else None,
+            sum(1 for row in group if row.event), len(group),
+            max(row.updated_at for row in group))).lastrowid
+        conn.exec_driver_sql('UPDATE gallery SET incident_id = ? WHERE id = ?',
+                             [(incident_id, row.id) for row in group])
+
+    conn.exec_driver_sql('DELETE FROM stats_rollup')
+    conn.exec_driver_sql("""
+        INSERT INTO stats_rollup (granularity, bucket, count)
+        SELECT 'day', local_date, count(*) FROM incident WHERE occurred_at IS NOT NULL
+        GROUP BY local_date""")
+    conn.exec_driver_sql("""
+        INSERT INTO stats_rollup (granularity, bucket, count)
+        SELECT 'week', date(local_date, 'weekday 0', '-6 days') AS week, count(*)
+        FROM incident WHERE occurred_at IS NOT NULL GROUP BY week""")
+    conn.exec_driver_sql("""
+        INSERT INTO stats_rollup (granularity, bucket, count)
+        SELECT 'hour', local_date || ' ' || strftime('%H', substr(occurred_at, 1, 19), '+9 hours') AS hour,
+               count(*)
+        FROM incident WHERE occurred_at IS NOT NULL GROUP BY hour""")
+
+
+# 순서대로 적용할 마이그레이션 목록입니다. 스키마 버전은 이 목록의 길이입니다.
+MIGRATIONS = [migration_1, migration_2, migration_3, migration_4, migration_5, migration_6]
+
+
+def migrate(db):
+    """
+    DB를 최신 스키마로 맞춥니다. 적용한 마이그레이션 수를 반환합니다.
+    Flask 애플리케이션 컨텍스트 안에서 호출해야 합니다.
+    """
+    applied = 0
+    # SQLite가 아닌 DB(DATABASE_URL)는 최신 스키마로 새로 만드는 경우만 지원하므로 테이블만 만듭니다.
+    sqlite = db.engine.dialect.name == 'sqlite'
+    if sqlite:
+        with db.engine.begin() as conn:
+            version = conn.exec_driver_sql('PRAGMA user_version').scalar()
+            # 테이블이 이미 있는 (이전 버전의) DB에만 마이그레이션을 적용합니다.
+            if table_columns(conn, 'gallery'):
+                for migration in MIGRATIONS[version:]:
+                    migration(conn)
+                    applied += 1
+
+    # 없는 테이블을 만들고, 기존 테이블에 새로 정의된 인덱스를 추가합니다.
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    if sqlite:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('PRAGMA user_version = %d' % len(MIGRATIONS))
+    return applied
+
+
+if __name__ == '__main__':
+    from server import app, db
+
+    with app.app_context():
+        print('적용한 마이그레이션: %d개' % migrate(db))
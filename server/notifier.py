@@ -0,0 +1,243 @@
+"""
+보호자 알림(SMS, 웹훅, 이메일)을 보내는 알림 서비스입니다.
+
+요청 핸들러는 notify()로 이벤트를 크기가 제한된 큐에 넣기만 하고, 전송은 스레드 하나가 담당합니다.
+수신자마다 min_interval초에 한 번만 메시지를 보내며, 첫 이벤트는 바로 보내고
+그 사이에 들어온 이벤트들은 모아서 간격이 끝날 때 한 통의 요약 메시지로 보냅니다.
+
+NOTIFY_CHANNELS 환경 변수(쉼표로 구분)로 채널을 고릅니다. (기본값: sms)
+  sms     - Textbelt (TEXTBELT_API_KEY, RECIPIENT_PHONE_NUMBER: 쉼표로 여러 명 지정 가능)
+  webhook - JSON POST (WEBHOOK_URL)
+  email   - SMTP (SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, EMAIL_FROM, EMAIL_TO)
+  mock    - 보내지 않고 메모리에 기록만 합니다. (개발/테스트용)
+"""
+import collections
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+import requests
+
+# 같은 수신자에게 메시지를 보내는 최소 간격(초)입니다.
+MIN_INTERVAL = 300.0
+# 전송 대기 이벤트 큐의 크기입니다. 가득 차면 새 이벤트를 버립니다.
+MAX_QUEUE = 1000
+# 외부 API 호출 제한 시간(초)입니다.
+TIMEOUT = 10
+
+# 이벤트 종류별 메시지입니다. (한 건, 여러 건)
+MESSAGES = {
+    'fall': ("낙상이 감지되었습니다! 갤러리를 확인하세요.",
+             "낙상이 %d건 더 감지되었습니다! 갤러리를 확인하세요."),
+    # 기기 레지스트리(devices.py)가 하트비트가 끊기거나 카메라 입력이 멈춘 기기를 알립니다.
+    'stale': ("낙상 감지 기기가 응답하지 않습니다. 기기와 카메라를 확인하세요.",
+              "낙상 감지 기기 %d대가 응답하지 않습니다. 기기와 카메라를 확인하세요."),
+    'recovered': ("낙상 감지 기기가 다시 동작합니다.",
+                  "낙상 감지 기기 %d대가 다시 동작합니다."),
+}
+# 이 종류는 어느 기기인지 알 수 있도록 이벤트 내용(기기 id 등)을 문장 뒤에 붙입니다. (최대 MAX_DETAILS건)
+DETAILED_KINDS = ('stale', 'recovered')
+MAX_DETAILS = 5
+
+
+class SmsChannel:
+    name = 'sms'
+
+    def __init__(self, session, api_key, timeout=TIMEOUT):
+        self.session = session
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def send(self, recipient, message, events):
+        response = self.session.post('https://textbelt.com/text', {
+            'phone': recipient,
+            'message': message,
+            'key': self.api_key,
+        }, timeout=self.timeout)
+        result = response.json()
+        if not result.get('success'):
+            raise RuntimeError(f"SMS API 응답: {result}")
+
+
+class WebhookChannel:
+    name = 'webhook'
+
+    def __init__(self, session, timeout=TIMEOUT):
+        self.session = session
+        self.timeout = timeout
+
+    def send(self, recipient, message, events):
+        response = self.session.post(recipient, json={
+            'message': message,
+            'events': [{'kind': kind, 'text': text, 'time': at} for kind, text, at in events],
+        }, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class EmailChannel:
+    name = 'email'
+
+    def __init__(self, host, port, user=None, password=None, sender=None, timeout=TIMEOUT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.sender = sender or user
+        self.timeout = timeout
+
+    def send(self, recipient, message, events):
+        email = EmailMessage()
+        email['Subject'] = message
+        email['From'] = self.sender
+        email['To'] = recipient
+        email.set_content('\n'.join(text for _, text, _ in events) or message)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.user:
+                smtp.starttls()
+                smtp.login(self.user, self.password)
+            smtp.send_message(email)
+
+
+class MockChannel:
+    """메시지를 보내지 않고 sent 리스트에 (수신자, 메시지)로 기록합니다."""
+    name = 'mock'
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, recipient, message, events):
+        print(f"[mock 알림] {recipient}: {message}")
+        self.sent.append((recipient, message))
+
+
+class Recipient:
+    """수신자 한 명(채널 + 주소)의 전송 간격 상태와 모아 둔 이벤트입니다."""
+    def __init__(self, channel, address):
+        self.channel = channel
+        self.address = address
+        self.last_sent = float('-inf')
+        self.pending = []
+
+
+class Notifier:
+    def __init__(self, routes, min_interval=MIN_INTERVAL, max_queue=MAX_QUEUE):
+        """routes: [(채널, 수신자 주소), ...]"""
+        self.recipients = [Recipient(channel, address) for channel, address in routes]
+        self.min_interval = min_interval
+        self.events = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.stats = collections.Counter()
+
+    def notify(self, kind, text=''):
+        """이벤트를 전송 큐에 넣습니다. 요청 핸들러에서 호출해도 기다리지 않습니다."""
+        if not self.recipients:
+            return
+        try:
+            self.events.put_nowait((kind, text, time.time()))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            print("알림 큐가 가득 차서 이벤트를 버립니다.")
+
+    def start(self):
+        if not self.recipients:
+            print("알림 수신자가 설정되지 않아 알림을 보내지 않습니다.")
+            return
+        self.thread = threading.Thread(target=self.run, name='notifier', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            timeout = self.next_due() - time.monotonic() if self.has_pending() else None
+            try:
+                event = self.events.get(timeout=max(timeout, 0) if timeout is not None else None)
+            except queue.Empty:
+                event = None
+            if event:
+                for recipient in self.recipients:
+                    recipient.pending.append(event)
+            self.flush()
+
+    def has_pending(self):
+        return any(recipient.pending for recipient in self.recipients)
+
+    def next_due(self):
+        return min(recipient.last_sent + self.min_interval
+                   for recipient in self.recipients if recipient.pending)
+
+    def flush(self):
+        """전송 간격이 지난 수신자에게 모아 둔 이벤트를 한 통의 메시지로 보냅니다."""
+        now = time.monotonic()
+        for recipient in self.recipients:
+            if not recipient.pending or now - recipient.last_sent < self.min_interval:
+                continue
+            events, recipient.pending = recipient.pending, []
+            recipient.last_sent = now
+            self.send(recipient, self.format(events), events)
+
+    @staticmethod
+    def format(events):
+        """
+        종류별로 한 문장씩 이어 붙입니다. (MESSAGES 순서, 낙상이 먼저)
+        기기 상태 알림과 낙상이 함께 모여도 낙상 건수가 가려지지 않고,
+        기기 상태 알림에는 어느 기기인지 이벤트 내용을 덧붙입니다.
+        """
+        counts = collections.Counter(kind for kind, _, _ in events)
+        order = list(MESSAGES)
+        parts = []
+        for kind in sorted(counts, key=lambda kind: order.index(kind) if kind in order else len(order)):
+            single, multiple = MESSAGES.get(kind, (kind, kind + ' %d'))
+            parts.append(single if counts[kind] == 1 else multiple % counts[kind])
+            details = [text for event_kind, text, _ in events if event_kind == kind and text]
+            if kind in DETAILED_KINDS and details:
+                shown = ', '.join(details[:MAX_DETAILS])
+                if len(details) > MAX_DETAILS:
+                    shown += ' 외 %d건' % (len(details) - MAX_DETAILS)
+                parts.append('(%s)' % shown)
+        return ' '.join(parts)
+
+    def send(self, recipient, message, events):
+        name = recipient.channel.name
+        print(f"{name} 알림 전송 ({recipient.address}, 이벤트 {len(events)}건)...")
+        try:
+            recipient.channel.send(recipient.address, message, events)
+            self.stats[name + '_sent'] += 1
+        except (requests.exceptions.RequestException, smtplib.SMTPException,
+                OSError, RuntimeError, ValueError) as e:
+            self.stats[name + '_failed'] += 1
+            print(f"{name} 알림 전송 실패: {e}")
+
+
+def split_addresses(value):
+    return [address.strip() for address in (value or '').split(',') if address.strip()]
+
+
+def make_notifier():
+    """환경 변수로 채널과 수신자를 설정한 Notifier를 만듭니다."""
+    session = requests.Session()
+    routes = []
+    for name in split_addresses(os.getenv('NOTIFY_CHANNELS', 'sms')):
+        if name == 'sms':
+            api_key = os.getenv('TEXTBELT_API_KEY')
+            phones = split_addresses(os.getenv('RECIPIENT_PHONE_NUMBER'))
+            if api_key and phones:
+                channel = SmsChannel(session, api_key)
+                routes.extend((channel, phone) for phone in phones)
+            else:
+                print("SMS 알림 비활성화: 환경 변수가 올바르게 설정되지 않았습니다.")
+        elif name == 'webhook':
+            channel = WebhookChannel(session)
+            routes.extend((channel, url) for url in split_addresses(os.getenv('WEBHOOK_URL')))
+        elif name == 'email':
+            channel = EmailChannel(os.getenv('SMTP_HOST', 'localhost'),
+                                   int(os.getenv('SMTP_PORT', '587')),
+                                   os.getenv('SMTP_USER'), os.getenv('SMTP_PASSWORD'),
+                                   os.getenv('EMAIL_FROM'))
+            routes.extend((channel, address) for address in split_addresses(os.getenv('EMAIL_TO')))
+        elif name == 'mock':
+            routes.append((MockChannel(), 'mock'))
+        else:
+            raise ValueError('Unknown notification channel: %s' % name)
+    return Notifier(routes, min_interval=float(os.getenv('NOTIFY_MIN_INTERVAL', MIN_INTERVAL)))
@@ -1,16 +1,26 @@
 # 필요한 라이브러리들을 임포트합니다.
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, redirect, render_template, send_from_directory
 from dotenv import load_dotenv
-import boto3
+import base64
 import datetime
+import json
 from flask_cors import CORS
-from collections import Counter
 from flask_sqlalchemy import SQLAlchemy
-import requests
+import sqlalchemy
 import os
+import re
+import sqlite3
 import threading
+import time
 from zoneinfo import ZoneInfo
 
+from devices import FLUSH_INTERVAL, STALE_AFTER, DeviceRegistry
+from events import MAX_SUBSCRIBERS, EventHub
+from ingest import Ingestor
+from notifier import make_notifier
+from storage import CACHE_MAX_AGE, LocalStorage, make_storage
+from thumbnails import VARIANTS, dhash, hash_distance, variant_key
+
 # .env 파일에 정의된 환경 변수를 로드합니다.
 # 이 코드는 app 객체 생성 전에 위치해야 합니다.
 load_dotenv()
@@ -22,14 +32,50 @@ CORS(app)
 
 
 # --- 데이터베이스 설정 ---
-# SQLite 데이터베이스 파일의 경로를 지정합니다.
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///gallery.db'
+# 데이터베이스 주소입니다. 기본값은 SQLite 파일(instance/gallery.db)이며,
+# DATABASE_URL 환경 변수로 다른 DB(예: postgresql://...)를 지정할 수 있습니다.
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///gallery.db')
 # SQLAlchemy의 이벤트를 처리하지 않도록 설정하여 오버헤드를 줄입니다.
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# 연결 풀 설정입니다. 요청 스레드 수(gunicorn.conf.py의 threads)와 업로드 워커 수보다 크게 잡습니다.
+# SQLite는 다른 연결이 쓰는 중이면 DB_BUSY_TIMEOUT초까지 기다린 뒤에 실패합니다.
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '15'))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', '16')),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '8')),
+    'pool_timeout': 30,
+    # 서버 DB는 오래 쉰 연결을 끊을 수 있으므로 사용 전에 확인합니다. (SQLite는 해당 없음)
+    'pool_pre_ping': not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'),
+}
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] = {
+        'timeout': DB_BUSY_TIMEOUT,
+        # 연결은 풀을 통해 여러 요청 스레드가 번갈아 사용합니다.
+        'check_same_thread': False,
+    }
 # SQLAlchemy 객체를 Flask 앱과 연결하여 초기화합니다.
 db = SQLAlchemy(app)
 
 
+@sqlalchemy.event.listens_for(sqlalchemy.engine.Engine, 'connect')
+def configure_sqlite(dbapi_connection, connection_record):
+    """
+    새 SQLite 연결마다 WAL 모드를 켜서, 쓰는 중에도 다른 요청이 읽을 수 있게 합니다.
+    WAL 모드에서는 synchronous=NORMAL로도 손상 없이 안전하며 커밋이 훨씬 빠릅니다.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=%d' % (DB_BUSY_TIMEOUT * 1000))
+    cursor.close()
+
+
+# 타임스탬프 표시에 사용하는 시간대입니다.
+KST_ZONE = ZoneInfo("Asia/Seoul")
+
+
 # --- 데이터베이스 모델 정의 ---
 class Gallery(db.Model):
     """
@@ -37,54 +83,287 @@ class Gallery(db.Model):
     """
     # 각 레코드를 식별하기 위한 고유 ID, 자동으로 증가합니다.
     id = db.Column(db.Integer, primary_key=True)
-    # 이미지가 업로드된 시점의 타임스탬프 (UTC 기준)
+    # 이미지가 촬영된 시점의 타임스탬프 문자열 (UTC, '%Y-%m-%d_%H-%M-%S') - 이전 버전 호환용
     timestamp = db.Column(db.String(50), nullable=False)
-    # S3에 저장된 이미지의 고유 URL, 중복될 수 없습니다.
+    # 이미지가 촬영된 시각 (UTC, 시간대 정보 없음). 정렬과 기간 조회는 이 열을 사용합니다.
+    created_at = db.Column(db.DateTime, nullable=False)
+    # 미리 계산해 둔 KST 날짜('YYYY-MM-DD')와 표시용 시각 문자열
+    local_date = db.Column(db.String(10), nullable=False)
+    display_time = db.Column(db.String(40), nullable=False)
+    # 이미지를 보낸 기기와 카메라
+    camera_id = db.Column(db.Integer, nullable=False, default=0)
+    device_id = db.Column(db.String(64), nullable=True)
+    # 저장소(S3 등)에 저장된 이미지의 고유 URL, 중복될 수 없습니다.
     url = db.Column(db.String(200), unique=True, nullable=False)
+    # 저장소 안에서의 이미지 이름과 업로드 상태 ('pending', 'stored', 'failed')
+    storage_key = db.Column(db.String(200), nullable=True)
+    status = db.Column(db.String(10), nullable=False, default='stored')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # 썸네일/미리보기 이미지(thumbnails.py)가 원본과 함께 저장소에 있으면 True
+    thumbnails = db.Column(db.Boolean, nullable=False, default=False)
     # 사용자가 작성한 메모
     memo = db.Column(db.Text, nullable=True)
+    # 낙상 순간 이미지이면 True, 낙상 전후 장면이면 False. 사건의 대표 이미지는 낙상 순간 이미지입니다.
+    event = db.Column(db.Boolean, nullable=False, default=True)
+    # 마지막으로 수정된 시각 (UTC). 갤러리 API의 Last-Modified에 사용합니다.
+    updated_at = db.Column(db.DateTime, nullable=False)
+    # 이 이미지가 속한 사건(Incident.id)과, 거의 같은 이미지를 찾기 위한 지각 해시(dHash, 16진수)
+    incident_id = db.Column(db.Integer, nullable=True)
+    phash = db.Column(db.String(16), nullable=True)
+
+    __table_args__ = (
+        # 갤러리 페이지 조회(최신순, 커서 기반)
+        db.Index('ix_gallery_created_at_id', 'created_at', 'id'),
+        # 날짜별 통계와 날짜 필터
+        db.Index('ix_gallery_local_date', 'local_date'),
+        # 카메라별 조회
+        db.Index('ix_gallery_camera_created_at', 'camera_id', 'created_at'),
+        # 업로드가 끝나지 않은 이미지 찾기
+        db.Index('ix_gallery_status', 'status'),
+        # 사건별 이미지 조회
+        db.Index('ix_gallery_incident_id', 'incident_id'),
+    )
+
+    @classmethod
+    def create(cls, created_at, url, memo, camera_id=0, device_id=None, event=True,
+               storage_key=None, status='stored', incident_id=None, phash=None):
+        """촬영 시각(UTC datetime)으로부터 표시용 값을 미리 계산하여 새 레코드를 만듭니다."""
+        created_at = created_at.astimezone(datetime.timezone.utc)
+        kst_time = created_at.astimezone(KST_ZONE)
+        naive = created_at.replace(tzinfo=None)
+        return cls(timestamp=created_at.strftime('%Y-%m-%d_%H-%M-%S'),
+                   created_at=naive,
+                   local_date=kst_time.strftime('%Y-%m-%d'),
+                   display_time=kst_time.strftime('%Y년 %m월 %d일 %H:%M:%S KST'),
+                   camera_id=camera_id, device_id=device_id,
+                   url=url, memo=memo, event=event, updated_at=naive,
+                   storage_key=storage_key, status=status, attempts=0, thumbnails=False,
+                   incident_id=incident_id, phash=phash)
 
+    def variant_url(self, variant):
+        """
+        갤러리에 보여 줄 작은 이미지('thumb', 'preview')의 URL입니다.
+        업로드가 끝나지 않았으면 스풀 디렉터리에서, 작은 이미지가 없는 이전 이미지는 원본을 보여 줍니다.
+        """
+        if self.status != 'stored' and self.storage_key:
+            return f"/spool/{self.id}?variant={variant}"
+        if not self.thumbnails:
+            return self.url
+        return storage.url_for(variant_key(self.storage_key, variant))
 
-# --- AWS S3 클라이언트 설정 ---
-# boto3 라이브러리를 사용하여 S3 서비스와 통신하는 클라이언트를 생성합니다.
-# EC2 IAM 역할을 사용하므로 별도의 자격 증명은 필요 없습니다.
-s3 = boto3.client('s3')
-# 이미지를 업로드할 S3 버킷의 이름을 지정합니다.
-BUCKET_NAME = 'fall-detection-images'
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'timestamp': self.timestamp,
+            'url': self.url,
+            'memo': self.memo,
+            'camera_id': self.camera_id,
+            'device_id': self.device_id,
+            'local_date': self.local_date,
+            'formatted_timestamp': self.display_time,
+            'event': self.event,
+            'status': self.status,
+            'incident_id': self.incident_id,
+            'thumbnail_url': self.variant_url('thumb'),
+            'preview_url': self.variant_url('preview'),
+        }
 
 
-# --- 헬퍼 함수 정의 ---
-def send_sms_notification():
+class Incident(db.Model):
     """
-    환경 변수에 지정된 수신자에게 SMS 알림을 전송합니다.
-    이 함수는 백그라운드 스레드에서 실행됩니다.
+    같은 기기에서 INCIDENT_WINDOW초 안에 이어서 올라온 이미지들을 묶은 낙상 사건입니다.
+    기기는 낙상이 계속되는 동안 쿨다운마다 이미지를 보내므로, 갤러리, 통계, 알림은 이미지가 아니라 사건 단위입니다.
+    대표 이미지(cover)는 사건의 첫 낙상 순간 이미지이며, 표시 시각과 통계 구간도 그 이미지의 시각을 씁니다.
+    낙상 전후 장면만 먼저 도착한 사건은 낙상 순간 이미지가 올 때까지 갤러리에 나오지 않습니다.
     """
-    # .env 파일에서 Textbelt API 키와 수신자 정보를 읽어옵니다.
-    api_key = os.getenv('TEXTBELT_API_KEY')
-    phone_number = os.getenv('RECIPIENT_PHONE_NUMBER')
-    gallery_url = os.getenv('GALLERY_URL')
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(64), nullable=True)
+    camera_id = db.Column(db.Integer, nullable=False, default=0)
+    # 사건에 속한 이미지들의 촬영 시각 범위 (UTC)
+    started_at = db.Column(db.DateTime, nullable=False)
+    ended_at = db.Column(db.DateTime, nullable=False)
+    # 대표 이미지(Gallery.id)와 그 촬영 시각, KST 날짜와 표시용 시각 (낙상 순간 이미지가 오기 전에는 NULL)
+    cover_id = db.Column(db.Integer, nullable=True)
+    occurred_at = db.Column(db.DateTime, nullable=True)
+    local_date = db.Column(db.String(10), nullable=True)
+    display_time = db.Column(db.String(40), nullable=True)
+    # 낙상 순간 이미지 수(중복 포함), 저장한 이미지 수, 거의 같아서 저장하지 않은 이미지 수
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+    image_count = db.Column(db.Integer, nullable=False, default=0)
+    duplicates = db.Column(db.Integer, nullable=False, default=0)
+    # 마지막으로 수정된 시각 (UTC). 갤러리 API의 Last-Modified에 사용합니다.
+    updated_at = db.Column(db.DateTime, nullable=False)
 
-    # 환경 변수가 올바르게 설정되었는지 확인합니다.
-    if not all([api_key, phone_number, gallery_url]):
-        print("SMS 발송 실패: 환경 변수가 올바르게 설정되지 않았습니다.")
-        return
+    __table_args__ = (
+        # 갤러리 페이지 조회(최신순, 커서 기반)
+        db.Index('ix_incident_occurred_at_id', 'occurred_at', 'id'),
+        db.Index('ix_incident_local_date', 'local_date'),
+        # 기기의 진행 중인 사건 찾기
+        db.Index('ix_incident_device_ended_at', 'device_id', 'ended_at'),
+    )
 
-    # 전송할 메시지 내용을 구성합니다.
-    # Textbelt 키가 URL 전송을 허용하도록 인증되면 아래 주석을 해제하여 사용합니다.
-    # message = f"낙상이 감지되었습니다! 즉시 아래 갤러리 링크를 확인하세요:\n{gallery_url}"
-    message = "낙상이 감지되었습니다! 갤러리를 확인하세요."
-    
-    print(f"{phone_number}로 SMS 전송을 시도합니다...")
-    try:
-        # Textbelt API로 POST 요청을 보냅니다.
-        response = requests.post('https://textbelt.com/text', {
-            'phone': phone_number,
-            'message': message,
-            'key': api_key,
-        })
-        print(f"SMS API 응답: {response.json()}")
-    except requests.exceptions.RequestException as e:
-        print(f"SMS API 호출 중 오류 발생: {e}")
+    @classmethod
+    def open_for(cls, device_id, taken_at):
+        """taken_at(UTC, 시간대 정보 없음)에 찍힌 이미지가 들어갈 기기의 사건을 찾습니다. 없으면 None입니다."""
+        window = datetime.timedelta(seconds=INCIDENT_WINDOW)
+        longest = datetime.timedelta(seconds=INCIDENT_MAX_SECONDS)
+        incident = (cls.query
+                    .filter(cls.device_id == device_id,
+                            cls.ended_at >= taken_at - window,
+                            cls.started_at <= taken_at + window)
+                    .order_by(cls.ended_at.desc()).first())
+        # 계속 이어지는 사건도 INCIDENT_MAX_SECONDS마다 새 사건으로 나눕니다.
+        if incident and max(incident.ended_at, taken_at) - min(incident.started_at, taken_at) > longest:
+            return None
+        return incident
+
+    def add(self, item, now):
+        """새로 저장하는 이미지를 사건에 넣습니다. 사건의 첫 낙상 순간 이미지이면 True를 반환합니다."""
+        self.started_at = min(self.started_at, item.created_at)
+        self.ended_at = max(self.ended_at, item.created_at)
+        self.updated_at = now
+        return item.event and self.mark_event(item)
+
+    def mark_event(self, item):
+        """낙상 순간 이미지 수를 늘리고, 첫 낙상 순간 이미지이면 대표 이미지로 정한 뒤 True를 반환합니다."""
+        self.event_count += 1
+        if self.cover_id is not None:
+            return False
+        self.cover_id = item.id
+        self.occurred_at = item.created_at
+        self.local_date = item.local_date
+        self.display_time = item.display_time
+        return True
+
+    def to_dict(self, cover):
+        """갤러리 카드용 dict입니다. 대표 이미지(Gallery)의 URL과 메모를 함께 넣습니다."""
+        return {
+            'id': self.id,
+            'device_id': self.device_id,
+            'camera_id': self.camera_id,
+            'local_date': self.local_date,
+            'formatted_timestamp': self.display_time,
+            'started_at': self.started_at.isoformat() + 'Z',
+            'ended_at': self.ended_at.isoformat() + 'Z',
+            'event_count': self.event_count,
+            'image_count': self.image_count,
+            'duplicates': self.duplicates,
+            'cover_id': self.cover_id,
+            'url': cover.url if cover else None,
+            'memo': cover.memo if cover else None,
+            'status': cover.status if cover else None,
+            'thumbnail_url': cover.variant_url('thumb') if cover else None,
+            'preview_url': cover.variant_url('preview') if cover else None,
+        }
+
+
+class StatsRollup(db.Model):
+    """
+    낙상 사건(Incident) 수를 KST 기준 구간별로 미리 집계해 둔 테이블입니다.
+    /upload에서 사건에 첫 낙상 순간 이미지가 저장될 때마다 그 시각이 속한 구간의 count를 1씩 늘리므로,
+    통계 조회 비용은 사건 수가 아니라 구간 수에 비례합니다.
+    """
+    __tablename__ = 'stats_rollup'
+    # 'day', 'week', 'hour'
+    granularity = db.Column(db.String(8), primary_key=True)
+    # day: 'YYYY-MM-DD', week: 그 주 월요일 'YYYY-MM-DD', hour: 'YYYY-MM-DD HH'
+    bucket = db.Column(db.String(13), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def buckets(created_at):
+        """UTC datetime(시간대 정보 없음)이 속하는 (granularity, bucket) 목록을 반환합니다."""
+        kst_time = created_at.replace(tzinfo=datetime.timezone.utc).astimezone(KST_ZONE)
+        day = kst_time.date()
+        week = day - datetime.timedelta(days=day.weekday())
+        return [('day', day.isoformat()),
+                ('week', week.isoformat()),
+                ('hour', kst_time.strftime('%Y-%m-%d %H'))]
+
+    @classmethod
+    def increment(cls, incidents):
+        """새로 생긴 낙상 사건들을 집계에 더합니다. 호출한 쪽의 트랜잭션 안에서 실행됩니다."""
+        for incident in incidents:
+            for granularity, bucket in cls.buckets(incident.occurred_at):
+                db.session.execute(db.text(
+                    'INSERT INTO stats_rollup (granularity, bucket, count) VALUES (:g, :b, 1) '
+                    'ON CONFLICT (granularity, bucket) DO UPDATE SET count = count + 1'),
+                    {'g': granularity, 'b': bucket})
+
+
+class Device(db.Model):
+    """
+    기기(라즈베리파이)별 최신 하트비트 상태입니다.
+    하트비트마다 쓰지 않고 기기 레지스트리(devices.py)가 메모리에 모아 두었다가 주기적으로 한 번에 기록합니다.
+    """
+    device_id = db.Column(db.String(64), primary_key=True)
+    # 처음/마지막으로 하트비트를 받은 시각과, 모든 카메라에서 프레임이 들어오고 있던 마지막 시각 (UTC)
+    first_seen = db.Column(db.DateTime, nullable=False)
+    last_seen = db.Column(db.DateTime, nullable=False)
+    last_active = db.Column(db.DateTime, nullable=False)
+    # 기기가 보고한 처리 속도, 추론 모델(해상도)과 백엔드, 누적 오류/버린 프레임 수, 실행 시간(초)
+    fps = db.Column(db.Float, nullable=False, default=0.0)
+    model = db.Column(db.String(32), nullable=True)
+    backend = db.Column(db.String(16), nullable=True)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    dropped = db.Column(db.Integer, nullable=False, default=0)
+    uptime = db.Column(db.Float, nullable=False, default=0.0)
+    # 마지막 하트비트 본문(JSON, 카메라별 상태와 온도 등)
+    status = db.Column(db.Text, nullable=True)
+    # 응답 없음 알림을 보낸 뒤 아직 회복하지 않았으면 True
+    stale = db.Column(db.Boolean, nullable=False, default=False)
+
+
+# --- 실시간 이벤트 설정 ---
+# 새 이미지, 메모 수정, 업로드 상태 변경을 /events로 연결된 브라우저에 보냅니다. (events.py 참고)
+event_hub = EventHub(max_subscribers=int(os.getenv('EVENTS_MAX_SUBSCRIBERS', MAX_SUBSCRIBERS)))
+
+
+# --- 이미지 저장소와 업로드 워커 설정 ---
+# STORAGE_BACKEND 환경 변수로 S3(기본값) 또는 로컬 디렉터리를 선택합니다. (storage.py 참고)
+storage = make_storage()
+# 업로드 요청은 이미지를 스풀 디렉터리에 저장하고 바로 응답하며, 저장소 업로드는 워커들이 처리합니다.
+SPOOL_DIR = os.getenv('SPOOL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool'))
+ingestor = Ingestor(app, db, Gallery, storage, SPOOL_DIR,
+                    workers=int(os.getenv('INGEST_WORKERS', '4')),
+                    on_update=lambda item: event_hub.publish('status', item.to_dict()))
+
+
+# 같은 기기에서 이 시간(초) 안에 이어서 올라온 이미지는 하나의 사건(Incident)으로 묶습니다.
+# 한 사건은 INCIDENT_MAX_SECONDS초를 넘지 않습니다.
+INCIDENT_WINDOW = float(os.getenv('INCIDENT_WINDOW_SECONDS', '60'))
+INCIDENT_MAX_SECONDS = float(os.getenv('INCIDENT_MAX_SECONDS', '600'))
+# 사건의 최근 DEDUP_LOOKBACK장 중 dHash 해밍 거리(64비트 중 다른 비트 수)가 이 값 이하인 이미지가 있으면
+# 거의 같은 이미지로 보고 저장하지 않습니다. (음수이면 중복 제거를 하지 않습니다)
+DEDUP_DISTANCE = int(os.getenv('DEDUP_DISTANCE', '4'))
+DEDUP_LOOKBACK = 50
+# 기기별 사건 처리 잠금입니다.
+incident_locks = {}
+incident_locks_guard = threading.Lock()
+
+# 갤러리 API의 한 페이지 기본/최대 항목 수입니다.
+GALLERY_PAGE_SIZE = 30
+GALLERY_MAX_PAGE_SIZE = 100
+
+# 통계 API 응답 캐시입니다. 새 사건이 저장되면 비우고,
+# 다른 프로세스에서 저장된 이벤트도 반영되도록 STATS_CACHE_TTL초가 지나면 다시 계산합니다.
+STATS_GRANULARITIES = ('day', 'week', 'hour')
+STATS_CACHE_TTL = 60
+STATS_CACHE_SIZE = 256
+stats_cache = {}
+stats_cache_lock = threading.Lock()
+
+# 보호자 알림 서비스입니다. 알림은 전송 스레드 하나가 모아서 보내며, 채널은 환경 변수로 고릅니다. (notifier.py 참고)
+notifier = make_notifier()
+
+# 기기 레지스트리입니다. 하트비트는 메모리에만 반영하고, DEVICE_FLUSH_INTERVAL초마다 DB에 기록하면서
+# DEVICE_STALE_SECONDS초 동안 응답이 없는 기기를 알립니다. (devices.py 참고)
+device_registry = DeviceRegistry(app, db, Device, notifier,
+                                 flush_interval=float(os.getenv('DEVICE_FLUSH_INTERVAL', FLUSH_INTERVAL)),
+                                 stale_after=float(os.getenv('DEVICE_STALE_SECONDS', STALE_AFTER)),
+                                 on_update=lambda device: event_hub.publish('device', device))
+# 하트비트 요청 본문의 최대 크기(바이트)입니다.
+HEARTBEAT_MAX_BYTES = 64 * 1024
 
 
 # --- API 엔드포인트 정의 ---
@@ -101,92 +380,415 @@ def save_memo():
     item = Gallery.query.filter_by(url=image_url).first()
     if item:
         item.memo = memo
+        item.updated_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
         db.session.commit() # 변경사항을 데이터베이스에 최종 반영합니다.
+        event_hub.publish('memo', {'id': item.id, 'url': item.url, 'memo': item.memo})
         return jsonify({'status': 'ok'})
     else:
         return jsonify({'status': 'error', 'message': 'Image not found'}), 404
 
+def parse_captured_at(value, utc_now):
+    """
+    기기가 보낸 촬영 시각(epoch 초)을 UTC datetime으로 변환합니다.
+    값이 없거나 잘못되었거나 서버 시각보다 미래이면 서버의 현재 시각을 사용합니다.
+    """
+    try:
+        captured_at = datetime.datetime.fromtimestamp(float(value), datetime.timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return utc_now
+    return min(captured_at, utc_now)
+
 @app.route('/upload', methods=['POST'])
 def upload_image():
     """
-    낙상 감지기로부터 이미지를 받아 S3에 업로드하고,
-    메타데이터를 DB에 저장한 후 SMS 알림을 보냅니다.
+    낙상 감지기로부터 이미지(image0, image1, ...)를 받아 스풀 디렉터리에 저장하고,
+    메타데이터를 'pending' 상태로 DB에 저장한 후 보호자 알림을 예약하고 바로 202로 응답합니다.
+    저장소(S3) 업로드는 업로드 워커(ingest.py)가 비동기로 수행합니다.
+    기기의 전송 보관함(outbox)이 네트워크 장애 후 여러 장을 한 번에 보낼 수 있으므로,
+    타임스탬프는 기기가 함께 보낸 촬영 시각(captured_at)을 우선 사용합니다.
+    event 값이 0인 이미지는 낙상 전후 장면이며, event 값이 없으면 모든 이미지를 낙상 순간 이미지로 봅니다.
+
+    이미지는 같은 기기의 사건(Incident)에 묶이고, 사건에 이미 있는 이미지와 거의 같으면(dHash 해밍 거리가
+    DEDUP_DISTANCE 이하) 저장하지 않고 그 이미지의 URL을 돌려줍니다.
+    알림과 통계는 사건에 첫 낙상 순간 이미지가 들어올 때만 반영합니다.
     """
     # 서버의 현재 시간(UTC)을 기준으로 타임스탬프를 생성합니다.
     utc_now = datetime.datetime.now(datetime.timezone.utc)
-    timestamp = utc_now.strftime('%Y-%m-%d_%H-%M-%S')
-    
-    file = request.files.get('image0')
-    if file:
-        filename = f"{timestamp}_fall_detection.jpg"
-        s3_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{filename}"
+    now = utc_now.replace(tzinfo=None)
+    camera_id = request.form.get('camera_id', type=int, default=0)
+    device_id = request.form.get('device_id')
+    captured_at = request.form.getlist('captured_at')
+    events = request.form.getlist('event')
+
+    files = []
+    while request.files.get('image%d' % len(files)):
+        files.append(request.files['image%d' % len(files)])
+    if not files:
+        return jsonify({'status': 'error', 'message': 'No image file found'}), 400
 
+    # 파일 이름에 넣을 기기 이름입니다. 기기 id를 보내지 않는 기기는 예전 이름 형식을 그대로 씁니다.
+    device_key = f"{re.sub(r'[^A-Za-z0-9._-]', '_', device_id[:64])}_" if device_id else ''
+
+    urls = []
+    stored_items = []
+    new_incidents = []
+    changed_incidents = {}
+    spooled = []
+    # 같은 기기의 요청이 동시에 오면 같은 사건을 두 번 만들 수 있으므로 기기별로 차례대로 처리합니다.
+    with incident_lock(device_id):
         try:
-            # 파일을 S3 버킷에 업로드합니다.
-            s3.upload_fileobj(file, BUCKET_NAME, filename, ExtraArgs={'ContentType': 'image/jpeg'})
-            
-            # DB에 저장할 새 이미지 레코드를 생성합니다.
-            new_image = Gallery(timestamp=timestamp, url=s3_url, memo='[자동 감지] 낙상 의심')
-            db.session.add(new_image)
-            db.session.commit()
+            for index, file in enumerate(files):
+                taken_at = parse_captured_at(
+                    captured_at[index] if index < len(captured_at) else None, utc_now)
+                timestamp = taken_at.strftime('%Y-%m-%d_%H-%M-%S')
+                is_event = events[index] != '0' if index < len(events) else True
+                # 같은 초에 찍힌 여러 장이 겹치지 않도록 밀리초와 기기, 카메라 번호를 파일 이름에 넣습니다.
+                # 같은 기기가 같은 이미지를 다시 보내면 같은 이름이 되므로 중복 저장을 막을 수 있습니다.
+                millis = taken_at.microsecond // 1000
+                filename = f"{timestamp}_{millis:03d}_{device_key}cam{camera_id}_fall_detection.jpg"
+                image_url = storage.url_for(filename)
+                urls.append(image_url)
+
+                # 기기가 응답을 받지 못해 같은 이미지를 다시 보낸 경우에는 이미 저장된 것으로 처리합니다.
+                if Gallery.query.filter_by(url=image_url).first():
+                    continue
 
-            # SMS 전송 함수를 백그라운드 스레드에서 실행하여 응답 지연을 방지합니다.
-            sms_thread = threading.Thread(target=send_sms_notification)
-            sms_thread.start()
+                # 파일을 스풀 디렉터리에 저장합니다. 저장소 업로드는 커밋 후 워커가 수행합니다.
+                path = ingestor.spool(filename, file)
+                spooled.append(path)
+                try:
+                    phash = dhash(path)
+                except OSError as e:
+                    print(f"지각 해시 계산 실패 ({filename}): {e}")
+                    phash = None
 
-            return jsonify({'status': 'ok', 'url': s3_url}), 200
+                naive_taken_at = taken_at.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+                incident = Incident.open_for(device_id, naive_taken_at)
+                if incident is None:
+                    incident = Incident(device_id=device_id, camera_id=camera_id,
+                                        started_at=naive_taken_at, ended_at=naive_taken_at,
+                                        event_count=0, image_count=0, duplicates=0, updated_at=now)
+                    db.session.add(incident)
+                    db.session.flush()
+                changed_incidents[incident.id] = incident
 
+                # 사건에 거의 같은 이미지가 이미 있으면 저장하지 않습니다. (움직임 없이 쓰러져 있는 장면 등)
+                duplicate = find_duplicate(incident, phash)
+                if duplicate is not None:
+                    os.remove(spooled.pop())
+                    urls[-1] = duplicate.url
+                    incident.duplicates += 1
+                    incident.updated_at = now
+                    if is_event:
+                        # 같은 장면의 전후 장면 이미지만 있었으면 그 이미지를 낙상 순간 이미지로 바꿉니다.
+                        if not duplicate.event:
+                            duplicate.event = True
+                            duplicate.memo = '[자동 감지] 낙상 의심'
+                            duplicate.updated_at = now
+                        if incident.mark_event(duplicate):
+                            new_incidents.append(incident)
+                    continue
+
+                # DB에 저장할 새 이미지 레코드를 생성합니다.
+                memo = '[자동 감지] 낙상 의심' if is_event else '[자동 감지] 낙상 전후 장면'
+                item = Gallery.create(taken_at, image_url, memo, camera_id, device_id, is_event,
+                                      storage_key=filename, status='pending',
+                                      incident_id=incident.id, phash=phash)
+                db.session.add(item)
+                db.session.flush()
+                stored_items.append(item)
+                incident.image_count += 1
+                if incident.add(item, now):
+                    new_incidents.append(incident)
+            StatsRollup.increment(new_incidents)
+            db.session.commit()
         except Exception as e:
-            # 오류 발생 시 데이터베이스 변경사항을 되돌립니다.
+            # 오류 발생 시 데이터베이스 변경사항을 되돌리고 스풀 파일을 지웁니다.
             db.session.rollback()
+            for path in spooled:
+                if os.path.exists(path):
+                    os.remove(path)
             print(f"업로드 또는 DB 저장 실패: {e}")
             return jsonify({'status': 'error', 'message': str(e)}), 500
 
-    return jsonify({'status': 'error', 'message': 'No image file found'}), 400
+    # 갤러리를 보고 있는 브라우저에 새 이미지와 바뀐 사건을 알립니다. 업로드 상태 이벤트보다 먼저 보내야 합니다.
+    for item in stored_items:
+        event_hub.publish('gallery', item.to_dict())
+    covers = incident_covers(changed_incidents.values())
+    for incident in changed_incidents.values():
+        if incident.cover_id is not None:
+            event_hub.publish('incident', incident.to_dict(covers.get(incident.cover_id)))
+    # 큐가 가득 차서 넣지 못한 작업은 pending으로 남아 워커가 나중에 처리합니다.
+    for item in stored_items:
+        ingestor.submit(item.id)
+
+    # 알림은 큐에 넣기만 하고 전송 스레드가 보내므로 응답이 늦어지지 않습니다.
+    # 새 사건의 첫 낙상 순간 이미지에만 보내므로, 낙상이 이어지는 동안 기기가 계속 보내도 알림은 한 번입니다.
+    for incident in new_incidents:
+        notifier.notify('fall', f"{incident.display_time} 카메라 {incident.camera_id}")
+    if new_incidents:
+        invalidate_stats_cache()
+
+    return jsonify({'status': 'accepted', 'url': urls[0], 'urls': urls}), 202
+
+def incident_lock(device_id):
+    with incident_locks_guard:
+        return incident_locks.setdefault(device_id, threading.Lock())
+
+def find_duplicate(incident, phash):
+    """사건의 최근 이미지 중 phash와 거의 같은 이미지(Gallery)를 찾습니다. 없으면 None입니다."""
+    if phash is None or DEDUP_DISTANCE < 0:
+        return None
+    recent = (Gallery.query
+              .filter(Gallery.incident_id == incident.id, Gallery.phash.isnot(None))
+              .order_by(Gallery.id.desc()).limit(DEDUP_LOOKBACK).all())
+    for item in recent:
+        if hash_distance(item.phash, phash) <= DEDUP_DISTANCE:
+            return item
+    return None
+
+def incident_covers(incidents):
+    """사건들의 대표 이미지를 한 번에 조회하여 {Gallery.id: Gallery}로 반환합니다."""
+    ids = [incident.cover_id for incident in incidents if incident.cover_id is not None]
+    if not ids:
+        return {}
+    return {item.id: item for item in Gallery.query.filter(Gallery.id.in_(ids)).all()}
+
+@app.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    """
+    기기가 주기적으로 보내는 상태(raspberry-pi/metrics.py의 Metrics.snapshot(), JSON)를 받습니다.
+    기기 레지스트리의 메모리 상태만 바꾸므로 DB에 접근하지 않습니다.
+    """
+    if (request.content_length or 0) > HEARTBEAT_MAX_BYTES:
+        return jsonify({'status': 'error', 'message': 'Heartbeat too large'}), 413
+    data = request.get_json(silent=True)
+    device_id = data.get('device_id') if isinstance(data, dict) else None
+    if not isinstance(device_id, str) or not 0 < len(device_id) <= 64:
+        return jsonify({'status': 'error', 'message': 'device_id is required'}), 400
+    device_registry.beat(device_id, data)
+    return jsonify({'status': 'ok'})
+
+@app.route('/devices/data')
+def devices_data():
+    """
+    기기별 최신 상태를 JSON 형식으로 반환합니다. (기기 레지스트리의 메모리 상태)
+    응답: {'devices': [...], 'stale_after': stale 판단 기준(초)}
+    """
+    return jsonify({'devices': device_registry.snapshot(),
+                    'stale_after': device_registry.stale_after})
+
+@app.route('/media/<path:key>')
+def media(key):
+    """로컬 저장소(STORAGE_BACKEND=local)에 저장된 이미지를 제공합니다."""
+    if not isinstance(storage, LocalStorage):
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
+    # 저장된 이미지는 바뀌지 않으므로 오래 캐시합니다.
+    response = send_from_directory(storage.root, key, max_age=CACHE_MAX_AGE)
+    response.cache_control.public = True
+    return response
+
+@app.route('/spool/<int:item_id>')
+def spooled_image(item_id):
+    """
+    저장소 업로드가 끝나지 않은 이미지를 스풀 디렉터리에서 제공합니다.
+    업로드가 끝났으면 저장소의 URL로 보냅니다.
+    variant('thumb', 'preview')를 지정하면 작은 이미지를, 아직 만들어지지 않았으면 원본을 제공합니다.
+    """
+    variant = request.args.get('variant')
+    if variant is not None and variant not in VARIANTS:
+        return jsonify({'status': 'error', 'message': 'Unknown variant'}), 400
+    item = db.get_or_404(Gallery, item_id)
+    if item.status == 'stored' or not item.storage_key:
+        return redirect(item.variant_url(variant) if variant else item.url)
+    if variant:
+        key = variant_key(item.storage_key, variant)
+        if os.path.exists(ingestor.spool_path(key)):
+            return send_from_directory(ingestor.spool_dir, key)
+    return send_from_directory(ingestor.spool_dir, item.storage_key)
+
+def encode_cursor(incident):
+    """다음 페이지 조회를 시작할 위치 (occurred_at, id)를 URL에 넣을 수 있는 문자열로 만듭니다."""
+    raw = json.dumps([incident.occurred_at.isoformat(), incident.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """encode_cursor로 만든 문자열을 (occurred_at, id)로 되돌립니다. 잘못된 값이면 ValueError가 발생합니다."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        occurred_at, incident_id = json.loads(raw)
+        occurred_at = datetime.datetime.fromisoformat(occurred_at)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(incident_id, int):
+        raise ValueError('Invalid cursor')
+    return occurred_at, incident_id
+
+def filter_dates(query):
+    """start/end 쿼리 파라미터('YYYY-MM-DD', KST 날짜, 양 끝 포함)로 기간을 제한합니다."""
+    if request.args.get('start'):
+        query = query.filter(
+            Incident.local_date >= datetime.date.fromisoformat(request.args['start']).isoformat())
+    if request.args.get('end'):
+        query = query.filter(
+            Incident.local_date <= datetime.date.fromisoformat(request.args['end']).isoformat())
+    return query
 
 @app.route('/gallery')
 def show_gallery():
     """
-    데이터베이스에 저장된 모든 이미지의 목록을 JSON 형식으로 반환합니다.
-    이때 타임스탬프는 KST(한국 시간)로 변환하여 제공합니다.
-    """
-    all_items = Gallery.query.order_by(Gallery.timestamp.desc()).all()
-    
-    utc_zone = ZoneInfo("UTC")
-    kst_zone = ZoneInfo("Asia/Seoul")
-
-    result = []
-    for item in all_items:
-        # DB에 저장된 UTC 시간 문자열을 파싱합니다.
-        naive_time = datetime.datetime.strptime(item.timestamp, '%Y-%m-%d_%H-%M-%S')
-        # 시간대 정보를 UTC로 명시한 후, KST로 변환합니다.
-        utc_time = naive_time.replace(tzinfo=utc_zone)
-        kst_time = utc_time.astimezone(kst_zone)
-        # 프론트엔드에 표시할 형식으로 문자열을 포맷팅합니다.
-        formatted_time = kst_time.strftime('%Y년 %m월 %d일 %H:%M:%S KST')
-
-        result.append({
-            'timestamp': item.timestamp,
-            'url': item.url,
-            'memo': item.memo,
-            'formatted_timestamp': formatted_time
-        })
+    낙상 사건(Incident)을 최신순으로 한 페이지씩 JSON 형식으로 반환합니다.
+    항목마다 대표 이미지(첫 낙상 순간 이미지)의 URL, 썸네일, 메모와 사건의 이미지 수가 들어 있으며,
+    사건의 모든 이미지는 /incidents/<id>로 조회합니다.
+    표시용 KST 시각(formatted_timestamp)과 날짜(local_date)는 저장할 때 미리 계산해 둔 값입니다.
 
-    return jsonify(result)
+    쿼리 파라미터:
+      limit  - 한 페이지의 항목 수 (기본 30, 최대 100)
+      cursor - 이전 응답의 next_cursor. 그 다음 항목부터 반환합니다.
+      start, end - 'YYYY-MM-DD' 형식의 조회 기간 (KST 날짜, 양 끝 포함)
+      camera_id  - 특정 카메라의 사건만 조회합니다.
+    응답: {'items': [...], 'next_cursor': 다음 페이지 커서 또는 null}
+
+    (occurred_at, id) 인덱스를 이용한 키셋 조회이므로 페이지가 뒤로 가도 조회 비용이 일정하며,
+    ETag/Last-Modified를 제공하여 내용이 바뀌지 않았으면 304 응답을 보냅니다.
+    """
+    limit = min(max(request.args.get('limit', GALLERY_PAGE_SIZE, type=int), 1),
+                GALLERY_MAX_PAGE_SIZE)
+    # 낙상 순간 이미지가 아직 없는(전후 장면만 도착한) 사건은 보여 주지 않습니다.
+    query = Incident.query.filter(Incident.occurred_at.isnot(None))
+    try:
+        query = filter_dates(query)
+        if request.args.get('cursor'):
+            occurred_at, incident_id = decode_cursor(request.args['cursor'])
+            query = query.filter(db.tuple_(Incident.occurred_at, Incident.id) < (occurred_at, incident_id))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    camera_id = request.args.get('camera_id', type=int)
+    if camera_id is not None:
+        query = query.filter(Incident.camera_id == camera_id)
+
+    # 다음 페이지가 있는지 알기 위해 한 개를 더 조회합니다.
+    incidents = (query.order_by(Incident.occurred_at.desc(), Incident.id.desc())
+                 .limit(limit + 1).all())
+    next_cursor = encode_cursor(incidents[limit - 1]) if len(incidents) > limit else None
+    incidents = incidents[:limit]
+    covers = incident_covers(incidents)
+
+    response = jsonify({
+        'items': [incident.to_dict(covers.get(incident.cover_id)) for incident in incidents],
+        'next_cursor': next_cursor,
+    })
+    # ETag는 응답 내용의 해시이고, Last-Modified는 페이지 항목(사건과 대표 이미지) 중 가장 최근에 수정된 시각입니다.
+    response.add_etag()
+    updated = [incident.updated_at for incident in incidents] + [
+        item.updated_at for item in covers.values()]
+    if updated:
+        response.last_modified = max(updated).replace(tzinfo=datetime.timezone.utc)
+    # 캐시에 보관하되 매번 서버에 변경 여부를 확인하도록 합니다.
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/incidents/<int:incident_id>')
+def show_incident(incident_id):
+    """
+    사건 하나와 그 사건에 저장된 모든 이미지(낙상 순간과 전후 장면, 촬영 순)를 반환합니다.
+    응답: {'incident': {...}, 'images': [...]}
+    """
+    incident = db.get_or_404(Incident, incident_id)
+    images = (Gallery.query.filter(Gallery.incident_id == incident.id)
+              .order_by(Gallery.created_at, Gallery.id).all())
+    cover = next((item for item in images if item.id == incident.cover_id), None)
+    return jsonify({'incident': incident.to_dict(cover),
+                    'images': [item.to_dict() for item in images]})
+
+def invalidate_stats_cache():
+    with stats_cache_lock:
+        stats_cache.clear()
+
+def query_stats(granularity, start, end):
+    """
+    StatsRollup에서 구간별 낙상 사건 수를 조회하여 (labels, counts)를 반환합니다.
+    start, end는 KST 날짜(datetime.date 또는 None)이며 양 끝을 포함합니다.
+    hour는 기간 안의 시간대(0~23시)별 합계입니다.
+    """
+    bucket = StatsRollup.bucket
+    query = db.session.query(bucket, StatsRollup.count).filter(
+        StatsRollup.granularity == granularity)
+    if start:
+        if granularity == 'week':
+            # 시작일이 속한 주부터 포함합니다.
+            start = start - datetime.timedelta(days=start.weekday())
+        query = query.filter(bucket >= start.isoformat())
+    if end:
+        query = query.filter(bucket < (end + datetime.timedelta(days=1)).isoformat())
+
+    if granularity == 'hour':
+        hour = db.func.substr(bucket, 12, 2)
+        rows = dict(query.with_entities(hour, db.func.sum(StatsRollup.count)).group_by(hour).all())
+        labels = ['%02d' % h for h in range(24)]
+        return labels, [rows.get(label, 0) for label in labels]
+
+    rows = query.order_by(bucket).all()
+    return [b for b, _ in rows], [c for _, c in rows]
 
 @app.route('/stats/data')
 def stats_data():
     """
-    일별 이미지 업로드 통계 데이터를 JSON 형식으로 반환합니다.
+    낙상 사건(Incident) 통계 데이터를 JSON 형식으로 반환합니다.
+    낙상이 이어지는 동안 기기가 여러 번 보낸 이미지는 한 건으로 셉니다.
+
+    쿼리 파라미터:
+      granularity - 'day'(일별, 기본값), 'week'(주별, 월요일 시작), 'hour'(시간대별)
+      start, end  - 'YYYY-MM-DD' 형식의 조회 기간 (KST 날짜, 양 끝 포함)
+    응답: {'labels': [...], 'counts': [...]}
     """
-    all_items = Gallery.query.all()
-    date_counts = Counter([item.timestamp.split('_')[0] for item in all_items])
-    # 날짜순으로 정렬하여 반환합니다.
-    sorted_counts = sorted(date_counts.items())
-    return jsonify({
-        'labels': [d for d, _ in sorted_counts],
-        'counts': [c for _, c in sorted_counts]
-    })
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in STATS_GRANULARITIES:
+        return jsonify({'status': 'error', 'message': 'Unknown granularity'}), 400
+    try:
+        start, end = (datetime.date.fromisoformat(request.args[key]) if request.args.get(key)
+                      else None for key in ('start', 'end'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    key = (granularity, start, end)
+    now = time.monotonic()
+    with stats_cache_lock:
+        cached = stats_cache.get(key)
+    if cached and now - cached[0] < STATS_CACHE_TTL:
+        return jsonify(cached[1])
+
+    labels, counts = query_stats(granularity, start, end)
+    result = {'labels': labels, 'counts': counts}
+    with stats_cache_lock:
+        if len(stats_cache) >= STATS_CACHE_SIZE:
+            stats_cache.clear()
+        stats_cache[key] = (now, result)
+    return jsonify(result)
+
+@app.route('/events')
+def event_stream():
+    """
+    새 이미지('gallery'), 새 사건 또는 사건에 추가된 이미지('incident'), 메모 수정('memo'),
+    업로드 상태 변경('status'), 기기 상태 변경('device', 응답 없음/회복) 이벤트를 SSE로 보냅니다.
+    재연결할 때는 브라우저가 보내는 Last-Event-ID 헤더(또는 last_event_id 인자) 이후의 이벤트부터 보냅니다.
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid Last-Event-ID'}), 400
+    if not event_hub.acquire():
+        response = jsonify({'status': 'error', 'message': 'Too many event streams'})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+
+    response = Response(event_hub.stream(last_id), mimetype='text/event-stream')
+    response.call_on_close(event_hub.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    # nginx 같은 프록시가 응답을 모아서 보내지 않게 합니다.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # --- 웹 페이지 렌더링 ---
@@ -204,14 +806,36 @@ def stats_page():
     """
     return render_template('statistics.html')
 
+@app.route('/devices')
+def devices_page():
+    """
+    기기 상태 웹 페이지(devices.html)를 렌더링합니다.
+    """
+    return render_template('devices.html')
+
 
 # --- 애플리케이션 실행 ---
+def start_background():
+    """요청 처리와 별도로 동작하는 스레드들을 시작합니다. 서버 프로세스마다 한 번 호출합니다."""
+    # 저장소 업로드 워커를 시작합니다. 이전 실행에서 끝나지 않은 업로드도 다시 시도합니다.
+    ingestor.start()
+    # 알림 전송 스레드를 시작합니다.
+    notifier.start()
+    # 기기 상태 기록과 응답 없는 기기 확인을 시작합니다.
+    device_registry.start()
+
+
 if __name__ == '__main__':
+    from migrate import migrate
+
     # 애플리케이션 컨텍스트 안에서 데이터베이스와 테이블을 생성합니다.
     # 이는 서버가 시작될 때 DB 파일이나 테이블이 없으면 자동으로 생성해줍니다.
+    # 이전 버전의 DB 파일이면 스키마를 최신으로 마이그레이션합니다.
     with app.app_context():
-        db.create_all()
-        
-    # Flask 개발 서버를 실행합니다.
+        migrate(db)
+
+    start_background()
+
+    # Flask 개발 서버를 실행합니다. 운영 환경에서는 gunicorn으로 실행하세요. (wsgi.py 참고)
     # host='0.0.0.0'은 모든 네트워크 인터페이스에서 접속을 허용합니다.
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000)
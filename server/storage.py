@@ -0,0 +1,66 @@
+"""
+업로드된 이미지를 보관하는 저장소입니다.
+
+STORAGE_BACKEND 환경 변수로 선택합니다.
+  s3    - AWS S3 버킷 (기본값, S3_BUCKET_NAME)
+  local - 로컬 디렉터리 (LOCAL_STORAGE_DIR). 서버의 /media/<key>로 제공되며,
+          AWS 없이 개발하거나 테스트할 때 S3 대신 사용합니다.
+"""
+import os
+import shutil
+
+import boto3
+
+DEFAULT_BUCKET_NAME = 'fall-detection-images'
+# 저장된 이미지는 이름마다 내용이 정해져 있고 바뀌지 않으므로 브라우저와 CDN이 오래 캐시하게 합니다.
+CACHE_MAX_AGE = 31536000
+CACHE_CONTROL = f'public, max-age={CACHE_MAX_AGE}, immutable'
+
+
+class S3Storage:
+    name = 's3'
+
+    def __init__(self, bucket):
+        # EC2 IAM 역할을 사용하므로 별도의 자격 증명은 필요 없습니다.
+        self.client = boto3.client('s3')
+        self.bucket = bucket
+
+    def url_for(self, key):
+        return f"https://{self.bucket}.s3.amazonaws.com/{key}"
+
+    def put(self, key, path, content_type):
+        """로컬 파일 path를 key로 업로드합니다. 실패하면 예외가 발생합니다."""
+        self.client.upload_file(path, self.bucket, key, ExtraArgs={
+            'ContentType': content_type,
+            'CacheControl': CACHE_CONTROL,
+        })
+
+
+class LocalStorage:
+    name = 'local'
+
+    def __init__(self, root, base_url='/media'):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url
+        os.makedirs(self.root, exist_ok=True)
+
+    def url_for(self, key):
+        return f"{self.base_url}/{key}"
+
+    def put(self, key, path, content_type):
+        """파일을 임시 이름으로 복사한 뒤 이름을 바꿔서, 읽는 쪽이 쓰다 만 파일을 보지 않게 합니다."""
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target + '.tmp')
+        os.replace(target + '.tmp', target)
+
+
+def make_storage():
+    """환경 변수에 따라 저장소를 만듭니다."""
+    backend = os.getenv('STORAGE_BACKEND', 's3')
+    if backend == 'local':
+        default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media')
+        return LocalStorage(os.getenv('LOCAL_STORAGE_DIR', default_dir))
+    if backend == 's3':
+        return S3Storage(os.getenv('S3_BUCKET_NAME', DEFAULT_BUCKET_NAME))
+    raise ValueError('Unknown STORAGE_BACKEND: %s' % backend)
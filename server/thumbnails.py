@@ -0,0 +1,73 @@
+"""
+갤러리에서 원본 대신 보여 줄 작은 이미지(썸네일, 미리보기)를 만듭니다.
+
+업로드 워커가 원본을 저장소에 올리기 전에 스풀 디렉터리에서 만들고, 원본과 같은 이름 규칙으로
+원본 옆에 저장합니다. (예: 2024-01-01_..._fall_detection.jpg -> 2024-01-01_..._fall_detection.thumb.jpg)
+이름이 원본마다 정해져 있고 내용이 바뀌지 않으므로 오래 캐시해도 됩니다.
+
+서버가 거의 같은 이미지를 한 번만 저장하도록 지각 해시(dHash)도 여기서 계산합니다.
+"""
+import os
+
+from PIL import Image
+
+# 종류별 최대 크기(가로, 세로)와 JPEG 품질입니다. 비율은 유지하며 원본보다 크게 만들지 않습니다.
+# thumb는 갤러리 카드(약 300px 너비), preview는 이미지를 눌렀을 때 보이는 확대 화면에 사용합니다.
+VARIANTS = {
+    'thumb': ((360, 360), 70),
+    'preview': ((1280, 1280), 80),
+}
+# 지각 해시(dHash)의 한 변 크기입니다. HASH_SIZE * HASH_SIZE 비트(64비트) 해시를 만듭니다.
+HASH_SIZE = 8
+
+
+def variant_key(key, variant):
+    """원본 이름(또는 경로) key에 해당하는 작은 이미지의 이름입니다."""
+    stem, ext = os.path.splitext(key)
+    return f"{stem}.{variant}{ext or '.jpg'}"
+
+
+def make_variants(path):
+    """
+    원본 이미지 파일 path 옆에 모든 종류의 작은 이미지를 만들고 {종류: 파일 경로}를 반환합니다.
+    이미지를 읽을 수 없으면 OSError가 발생합니다.
+    """
+    paths = {}
+    # 큰 크기부터 만들어서, 작은 이미지는 이미 줄인 이미지에서 다시 줄입니다.
+    order = sorted(VARIANTS, key=lambda variant: VARIANTS[variant][0], reverse=True)
+    with Image.open(path) as original:
+        size = VARIANTS[order[0]][0]
+        # JPEG은 디코딩할 때부터 1/2, 1/4, 1/8 크기로 읽을 수 있어 전체 해상도로 풀지 않아도 됩니다.
+        original.draft('RGB', size)
+        image = original.convert('RGB')
+    for variant in order:
+        size, quality = VARIANTS[variant]
+        image.thumbnail(size, Image.LANCZOS)
+        target = variant_key(path, variant)
+        image.save(target + '.tmp', 'JPEG', quality=quality, optimize=True, progressive=True)
+        os.replace(target + '.tmp', target)
+        paths[variant] = target
+    return paths
+
+
+def dhash(path):
+    """
+    이미지의 차이 해시(dHash)를 16진수 문자열로 반환합니다.
+    흑백 (HASH_SIZE + 1) x HASH_SIZE 크기로 줄인 뒤, 가로로 이웃한 두 픽셀 중 왼쪽이 더 밝으면 1인 비트를 모읍니다.
+    밝기나 JPEG 압축이 조금 달라도 같은 장면이면 해시가 거의 같습니다. 이미지를 읽을 수 없으면 OSError가 발생합니다.
+    """
+    with Image.open(path) as original:
+        original.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = original.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            value = value << 1 | (left > pixels[row * (HASH_SIZE + 1) + col + 1])
+    return '%0*x' % (HASH_SIZE * HASH_SIZE // 4, value)
+
+
+def hash_distance(a, b):
+    """두 dHash 문자열의 해밍 거리(다른 비트 수)입니다. 작을수록 비슷한 이미지입니다."""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
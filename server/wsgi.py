@@ -0,0 +1,12 @@
+"""
+운영 환경용 WSGI 진입점입니다.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+DB 마이그레이션은 gunicorn 마스터 프로세스가 워커를 만들기 전에 한 번 실행합니다. (gunicorn.conf.py)
+다른 WSGI 서버를 사용할 때는 먼저 python3 migrate.py를 실행하세요.
+업로드 워커와 알림 스레드는 요청을 처리하는 프로세스마다 이 모듈을 불러올 때 시작됩니다.
+"""
+from server import app, start_background
+
+start_background()